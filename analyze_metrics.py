@@ -3,145 +3,69 @@ Analyze Overture Metrics CSV files to extract:
 1. Top categorical values for key grouping columns
 2. Summary statistics per theme
 3. Distribution of change_types
+
+The scan itself is shared with generate_llm_context.py (see
+metrics_aggregation.py); `generate_llm_context.py --summary` writes this
+summary from the same scan as the LLM context document.
 """
 
-import pandas as pd
-import glob
+import argparse
 import os
-from collections import defaultdict
-from pathlib import Path
-
-# Configuration
-METRICS_BASE = "Metrics/metrics"
-LATEST_RELEASE = "2025-08-20.1"  # Use the latest release
-METRICS_PATH = f"{METRICS_BASE}/{LATEST_RELEASE}"
-
-# Grouping columns to analyze by theme
-GROUPING_COLUMNS = {
-    'addresses': ['country', 'address_level_1', 'address_level_2', 'datasets', 'change_type'],
-    'buildings': ['subtype', 'class', 'datasets', 'change_type'],
-    'base': ['subtype', 'class', 'datasets', 'change_type'],
-    'places': ['place_countries', 'primary_category', 'confidence', 'datasets', 'change_type'],
-    'divisions': ['subtype', 'class', 'country', 'datasets', 'change_type'],
-    'transportation': ['subtype', 'class', 'subclass', 'datasets', 'change_type']
-}
 
+from csv_readers import READER_BACKENDS, reader_settings
+from defaults import SUMMARY_FILE
+from metrics_aggregation import GROUPING_COLUMNS, analyze_themes, get_latest_release, load_changelog_stats
+from metrics_cache import CACHE_MODES, cache_settings
 
-def analyze_csv_files(theme, csv_pattern):
-    """Analyze all CSV files for a given theme"""
-    files = glob.glob(csv_pattern)
-
-    if not files:
-        print(f"No files found for pattern: {csv_pattern}")
-        return None
-
-    print(f"\n{'='*80}")
-    print(f"Analyzing {theme.upper()} theme - Found {len(files)} files")
-    print(f"{'='*80}")
-
-    # Concatenate all CSV files for this theme
-    dfs = []
-    for file in files:
-        try:
-            df = pd.read_csv(file)
-            dfs.append(df)
-        except Exception as e:
-            print(f"Error reading {file}: {e}")
-
-    if not dfs:
-        return None
-
-    combined_df = pd.concat(dfs, ignore_index=True)
-
-    # Get total count
-    total_records = len(combined_df)
-    total_features = combined_df['total_count'].sum() if 'total_count' in combined_df.columns else combined_df['id_count'].sum()
+# Configuration
+SUMMARY_THEMES = ['addresses', 'buildings', 'base', 'places', 'divisions', 'transportation']
 
-    print(f"\nTotal Records: {total_records:,}")
-    print(f"Total Feature Count: {total_features:,}")
 
-    # Analyze each grouping column
+def summarize_theme(theme, data):
+    """Reduce a shared scan result to the grouping columns reported here"""
     results = {
         'theme': theme,
-        'total_records': total_records,
-        'total_features': total_features,
+        'total_records': data['total_records'],
+        'total_features': data['total_features'],
         'column_analysis': {}
     }
 
-    columns_to_analyze = GROUPING_COLUMNS.get(theme, [])
-
-    for col in columns_to_analyze:
-        if col not in combined_df.columns:
+    for col in GROUPING_COLUMNS.get(theme, []):
+        if col not in data['columns']:
             continue
-
-        print(f"\n{'-'*60}")
-        print(f"Column: {col}")
-        print(f"{'-'*60}")
-
-        # Get value counts
-        if 'total_count' in combined_df.columns:
-            # Aggregate by grouping column
-            value_counts = combined_df.groupby(col)['total_count'].sum().sort_values(ascending=False)
-        elif 'id_count' in combined_df.columns:
-            value_counts = combined_df.groupby(col)['id_count'].sum().sort_values(ascending=False)
-        else:
-            value_counts = combined_df[col].value_counts()
-
-        # Top 15 values
-        top_values = value_counts.head(15)
-        total = value_counts.sum()
-
         results['column_analysis'][col] = {
-            'unique_values': len(value_counts),
-            'top_values': []
+            'unique_values': data['columns'][col]['unique_count'],
+            'top_values': data['columns'][col]['top_values']
         }
 
-        for value, count in top_values.items():
-            percentage = (count / total * 100) if total > 0 else 0
-            print(f"  {value}: {count:,} ({percentage:.2f}%)")
-            results['column_analysis'][col]['top_values'].append({
-                'value': value,
-                'count': count,
-                'percentage': percentage
-            })
-
     return results
 
 
-def main():
-    """Main analysis function"""
-    all_results = {}
+def print_summary(result, files):
+    """Print the analysis of one theme"""
+    print(f"\n{'='*80}")
+    print(f"Analyzing {result['theme'].upper()} theme - Found {files} files")
+    print(f"{'='*80}")
 
-    # Analyze each theme
-    theme_patterns = {
-        'addresses': f"{METRICS_PATH}/row_counts/theme=addresses/**/*.csv",
-        'buildings': f"{METRICS_PATH}/row_counts/theme=buildings/**/*.csv",
-        'base': f"{METRICS_PATH}/row_counts/theme=base/**/*.csv",
-        'places': f"{METRICS_PATH}/row_counts/theme=places/**/*.csv",
-        'divisions': f"{METRICS_PATH}/row_counts/theme=divisions/**/*.csv",
-        'transportation': f"{METRICS_PATH}/row_counts/theme=transportation/**/*.csv"
-    }
+    print(f"\nTotal Records: {result['total_records']:,}")
+    print(f"Total Feature Count: {result['total_features']:,}")
 
-    for theme, pattern in theme_patterns.items():
-        result = analyze_csv_files(theme, pattern)
-        if result:
-            all_results[theme] = result
+    for col, analysis in result['column_analysis'].items():
+        print(f"\n{'-'*60}")
+        print(f"Column: {col}")
+        print(f"{'-'*60}")
+        for item in analysis['top_values']:
+            print(f"  {item['value']}: {item['count']:,} ({item['percentage']:.2f}%)")
 
-    # Analyze changelog stats
-    changelog_file = f"{METRICS_PATH}/changelog_stats/*.csv"
-    changelog_files = glob.glob(changelog_file)
-    if changelog_files:
-        print(f"\n{'='*80}")
-        print(f"Analyzing CHANGELOG STATS")
-        print(f"{'='*80}")
-        df = pd.read_csv(changelog_files[0])
-        print("\nRelease Summary:")
-        print(df.to_string(index=False))
 
-    # Save results summary
-    output_file = "metrics_analysis_summary.txt"
+def write_summary(themes_data, output_file=SUMMARY_FILE):
+    """Write the per-theme summary file from shared scan results"""
     with open(output_file, 'w') as f:
-        for theme, result in all_results.items():
+        for theme in SUMMARY_THEMES:
+            if theme not in themes_data:
+                continue
+            result = summarize_theme(theme, themes_data[theme])
+
             f.write(f"\n{'='*80}\n")
             f.write(f"{theme.upper()} THEME\n")
             f.write(f"{'='*80}\n")
@@ -155,8 +79,47 @@ def main():
                 for item in analysis['top_values'][:10]:
                     f.write(f"    {item['value']}: {item['count']:,} ({item['percentage']:.2f}%)\n")
 
-    print(f"\n\nAnalysis complete! Results saved to {output_file}")
+
+def main(release=None, workers=1, cache=None, reader=None):
+    """Main analysis function"""
+    release = release or get_latest_release()
+    print(f"Using release: {release}")
+
+    all_results = {}
+    for theme, data in analyze_themes(SUMMARY_THEMES, release, workers, cache=cache, reader=reader).items():
+        if data is None:
+            print(f"No files found for theme: {theme}")
+            continue
+        all_results[theme] = data
+        print_summary(summarize_theme(theme, data), data['files'])
+
+    # Analyze changelog stats
+    changelog = load_changelog_stats(release)
+    if changelog is not None:
+        print(f"\n{'='*80}")
+        print(f"Analyzing CHANGELOG STATS")
+        print(f"{'='*80}")
+        print("\nRelease Summary:")
+        print(changelog.to_string(index=False))
+
+    # Save results summary
+    write_summary(all_results)
+
+    print(f"\n\nAnalysis complete! Results saved to {SUMMARY_FILE}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Summarize Overture Metrics per theme")
+    parser.add_argument('--release', help="Release to analyze (default: latest)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used to aggregate themes and partitions (0 = all CPUs)")
+    parser.add_argument('--cache', choices=CACHE_MODES, default='use',
+                        help="Columnar cache of parsed CSVs: use it, rebuild every entry, or bypass it")
+    parser.add_argument('--reader', choices=READER_BACKENDS, default='auto',
+                        help="CSV parser; auto uses pyarrow's multithreaded reader when installed")
+    parser.add_argument('--project', action='store_true',
+                        help="Only read the columns each theme reports, with fixed dtypes")
+    args = parser.parse_args()
+
+    main(release=args.release, workers=args.workers or os.cpu_count(), cache=cache_settings(args.cache),
+         reader=reader_settings(args.reader, args.project))
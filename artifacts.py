@@ -0,0 +1,128 @@
+"""
+Content-hashed, precompressed copies of the generated context files.
+
+Each published file is copied under a name containing a hash of its
+contents, next to gzip and (when the brotli package is installed) brotli
+variants, and listed in a small manifest:
+
+    <dir>/manifest.json
+    <dir>/README_generation_output.3f2a9c01d4e6.txt
+    <dir>/README_generation_output.3f2a9c01d4e6.txt.gz
+    <dir>/README_generation_output.3f2a9c01d4e6.txt.br
+    <dir>/context_slices/places.9b0e1f2a3c4d.txt ...
+
+manifest.json maps each logical name (e.g. README_generation_output.txt)
+to its hashed file, size and compressed variants. A hashed file never
+changes, so everything except the manifest can be served with
+`Cache-Control: public, max-age=31536000, immutable`; only the manifest
+needs revalidating. Servers with precompressed-file support (nginx
+gzip_static / brotli_static, most CDNs) can serve the .gz and .br
+variants directly, and clients without that can fetch the .gz file and
+decompress it themselves.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ARTIFACT_DIR = "artifacts"
+ARTIFACT_MANIFEST = "manifest.json"
+HASH_LENGTH = 12
+HASHED_FILE = re.compile(r"\.[0-9a-f]{%d}\.[^/]*$" % HASH_LENGTH)
+
+
+def hashed_name(logical, digest):
+    """Insert a content hash before a logical name's extension"""
+    stem, ext = os.path.splitext(logical)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def _write_once(path, data):
+    # Content-addressed, so an existing file already holds these bytes
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def load_manifest(artifact_dir=ARTIFACT_DIR):
+    """Load an artifact manifest, or None when there is none"""
+    try:
+        with open(os.path.join(artifact_dir, ARTIFACT_MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_files(manifest):
+    """Every file a manifest references, relative to its directory"""
+    files = set()
+    for entry in (manifest or {}).get('artifacts', {}).values():
+        files.add(entry['file'])
+        files.update(variant['file'] for variant in entry['encodings'].values())
+    return files
+
+
+def publish_artifacts(files, artifact_dir=ARTIFACT_DIR):
+    """Publish files under content-hashed names with compressed variants.
+
+    Args:
+        files: {logical name: path of the generated file}.
+        artifact_dir: Output directory for the hashed files and manifest.
+
+    Files from the previous manifest stay in place so clients holding it
+    can finish their downloads; older hashed files are removed, other files
+    in artifact_dir are never touched. Returns the new manifest.
+    """
+    previous = load_manifest(artifact_dir)
+    artifacts = {}
+    for logical, path in files.items():
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        name = hashed_name(logical, digest)
+        _write_once(os.path.join(artifact_dir, name), data)
+
+        encodings = {}
+        variants = [('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('br', '.br', lambda data: brotli.compress(data, quality=11)))
+        for encoding, suffix, compress in variants:
+            compressed_path = os.path.join(artifact_dir, name + suffix)
+            if os.path.exists(compressed_path):
+                size = os.path.getsize(compressed_path)
+            else:
+                compressed = compress(data)
+                _write_once(compressed_path, compressed)
+                size = len(compressed)
+            encodings[encoding] = {'file': name + suffix, 'bytes': size}
+
+        artifacts[logical] = {'file': name, 'bytes': len(data), 'sha256': digest, 'encodings': encodings}
+
+    manifest = {'version': 1, 'generated': datetime.now().isoformat(timespec='seconds'), 'artifacts': artifacts}
+    tmp = os.path.join(artifact_dir, f"{ARTIFACT_MANIFEST}.tmp-{os.getpid()}")
+    os.makedirs(artifact_dir, exist_ok=True)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(artifact_dir, ARTIFACT_MANIFEST))
+
+    # Keep the current and previous generation of hashed files
+    keep = manifest_files(manifest) | manifest_files(previous)
+    for root, _, names in os.walk(artifact_dir):
+        for file_name in names:
+            path = os.path.join(root, file_name)
+            relative = os.path.relpath(path, artifact_dir).replace(os.sep, '/')
+            if HASHED_FILE.search(relative) and relative not in keep:
+                os.remove(path)
+    return manifest
@@ -0,0 +1,331 @@
+"""
+Benchmark the Overture Metrics scan on synthetic releases.
+
+Generates a Metrics/metrics/<release>/row_counts/theme=*/type=*/*.csv tree
+shaped like a real release (Zipf-skewed countries, categories and address
+levels, a few dominant datasets, mostly-unchanged change types, and a
+changelog_stats TSV), then times four stages separately:
+
+- ingestion: parsing every partition with the configured CSV reader
+- aggregation: analyze_themes() over the release
+- rendering: write_document() from a snapshot of the aggregated results
+- startup: a whole `cli.py render` process from the saved snapshot, which
+  must stay within cli.RENDER_STARTUP_BUDGET and import none of
+  HEAVY_MODULES
+
+Each stage runs in a fresh process so its peak RSS can be measured on its
+own. Results can be saved as a baseline and later runs compared against it
+with regression thresholds; the exit status is 1 when a stage regressed or
+the render startup is over budget.
+
+    python benchmark.py --preset small --save-baseline
+    python benchmark.py --preset small              # compare to the baseline
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cli import RENDER_STARTUP_BUDGET
+from instrumentation import peak_rss_mb
+
+BASELINE_FILE = "benchmark_baseline.json"
+RELEASE = "2099-01-01.0"
+MAX_SLOWDOWN = 0.20    # Allowed drop in throughput before a stage counts as regressed
+MAX_RSS_GROWTH = 0.25  # Allowed growth in peak RSS
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+HEAVY_MODULES = {'pandas', 'numpy', 'pyarrow', 'polars', 'duckdb'}  # Must stay out of `cli.py render`
+
+PRESETS = {
+    'small': {'rows_per_file': 20_000, 'files_per_theme': 4, 'cardinality': 5_000},
+    'medium': {'rows_per_file': 200_000, 'files_per_theme': 8, 'cardinality': 50_000},
+    'large': {'rows_per_file': 1_000_000, 'files_per_theme': 16, 'cardinality': 500_000}
+}
+
+# Partition types and weight column per theme, as in real releases
+THEME_TYPES = {
+    'addresses': ['address'],
+    'buildings': ['building', 'building_part'],
+    'places': ['place'],
+    'divisions': ['division', 'division_area', 'division_boundary'],
+    'transportation': ['segment', 'connector'],
+    'base': ['land', 'water', 'land_use', 'infrastructure', 'land_cover', 'bathymetry']
+}
+WEIGHT_COLUMNS = {'places': 'id_count'}
+DATASETS = ['OpenStreetMap', 'Microsoft ML Buildings', 'Google Open Buildings', 'Meta', 'Esri Community Maps',
+            'ESA WorldCover', 'OpenAddresses', 'USGS Lidar']
+CHANGE_TYPES = ['unchanged', 'data_changed', 'added', 'removed']
+CHANGE_WEIGHTS = [0.85, 0.08, 0.05, 0.02]
+COUNTRIES = [a + b for a in string.ascii_uppercase for b in string.ascii_uppercase]
+
+
+def skewed(rng, size, cardinality, exponent=1.3):
+    """Draw Zipf-distributed ranks in [0, cardinality)"""
+    return (rng.zipf(exponent, size) - 1) % cardinality
+
+
+def synthetic_frame(rng, theme, rows, cardinality):
+    """Build one partition's rows for a theme"""
+    from metrics_aggregation import GROUPING_COLUMNS
+
+    columns = {}
+    for col in GROUPING_COLUMNS[theme] + (['address_level_3'] if theme == 'addresses' else []):
+        if col == 'change_type':
+            values = np.array(CHANGE_TYPES, dtype=object)[rng.choice(len(CHANGE_TYPES), rows, p=CHANGE_WEIGHTS)]
+        elif col == 'datasets':
+            values = np.array(DATASETS, dtype=object)[skewed(rng, rows, len(DATASETS), 2.0)]
+        elif col in ('country', 'place_countries'):
+            values = np.array(COUNTRIES, dtype=object)[skewed(rng, rows, 250, 1.5)]
+        elif col == 'confidence':
+            values = np.round(rng.beta(5, 2, rows), 2)
+        elif col in ('address_level_2', 'address_level_3', 'primary_category'):
+            values = pd.Series(skewed(rng, rows, cardinality, 1.1)).map(lambda rank: f"{col}_{rank}").to_numpy()
+        else:
+            values = pd.Series(skewed(rng, rows, 40, 1.8)).map(lambda rank: f"{col}_{rank}").to_numpy()
+        if values.dtype == object:
+            values[rng.random(rows) < 0.03] = None  # Some missing values
+        columns[col] = values
+
+    counts = rng.integers(1, 5_000, rows)
+    columns[WEIGHT_COLUMNS.get(theme, 'total_count')] = counts
+    if theme not in WEIGHT_COLUMNS:
+        columns['id_count'] = counts
+    columns['geometry_count'] = counts
+    columns['average_geometry_length_km'] = rng.gamma(2.0, 0.5, rows)
+    columns['total_geometry_area_km2'] = rng.gamma(2.0, 5.0, rows)
+    return pd.DataFrame(columns)
+
+
+def generate_tree(root, rows_per_file, files_per_theme, cardinality, release=RELEASE, seed=0):
+    """Write a synthetic Metrics tree under `root`. Returns the number of rows."""
+    rng = np.random.default_rng(seed)
+    base = os.path.join(root, 'Metrics', 'metrics', release)
+    total = 0
+    for theme, types in THEME_TYPES.items():
+        for i in range(files_per_theme):
+            directory = os.path.join(base, 'row_counts', f"theme={theme}", f"type={types[i % len(types)]}")
+            os.makedirs(directory, exist_ok=True)
+            synthetic_frame(rng, theme, rows_per_file, cardinality).to_csv(
+                os.path.join(directory, f"part-{i:05d}.csv"), index=False)
+            total += rows_per_file
+
+    os.makedirs(os.path.join(base, 'changelog_stats'), exist_ok=True)
+    changelog = []
+    for theme, types in THEME_TYPES.items():
+        for type_name in types:
+            parts = rng.dirichlet([1, 1, 2, 40]) * 100
+            count = int(rng.integers(10_000, 10_000_000))
+            changelog.append({'theme': theme, 'type': type_name, 'total_diff_perc': parts[0] - parts[1],
+                              'added': int(count * parts[0] / 100), 'added_perc': parts[0],
+                              'removed': int(count * parts[1] / 100), 'removed_perc': parts[1],
+                              'data_changed': int(count * parts[2] / 100), 'data_changed_perc': parts[2],
+                              'unchanged': int(count * parts[3] / 100), 'unchanged_perc': parts[3]})
+    pd.DataFrame(changelog).to_csv(os.path.join(base, 'changelog_stats', 'changelog_stats.csv'),
+                                   sep='\t', index=False)
+    return total
+
+
+def _run_stage(root, stage, options, themes_data):
+    os.chdir(root)
+    from csv_readers import read_csv_chunks, reader_settings
+    from context_document import write_document
+    from snapshot import build_snapshot, save_snapshot
+    from defaults import THEMES
+    from metrics_aggregation import CHUNK_ROWS, analyze_themes, find_theme_files, load_changelog_stats
+
+    reader = reader_settings(options['reader'])
+    start = time.perf_counter()
+    result = None
+    if stage == 'ingestion':
+        for theme in THEMES:
+            for file in find_theme_files(theme, RELEASE):
+                for _ in read_csv_chunks(file, reader, CHUNK_ROWS):
+                    pass
+    elif stage == 'aggregation':
+        result = analyze_themes(THEMES, RELEASE, options['workers'], options['topk'], options['hll'],
+                                reader=reader)
+    else:
+        snapshot = build_snapshot(RELEASE, themes_data, load_changelog_stats(RELEASE))
+        write_document(snapshot, output_file=os.devnull)
+    seconds = time.perf_counter() - start
+    if stage == 'rendering':
+        save_snapshot(snapshot)  # Rendered again by the startup stage
+    return seconds, peak_rss_mb(), result
+
+
+def run_stage(root, stage, options, themes_data=None):
+    """Run one stage in a fresh process; returns (seconds, peak RSS MB, result)"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_run_stage, root, stage, options, themes_data).result()
+
+
+def run_startup(root, repeat=1):
+    """Time `cli.py render` processes from the snapshot in root; returns (seconds, heavy modules imported)"""
+    command = [sys.executable, CLI, 'render', '--no-scan']
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=root, stdout=subprocess.DEVNULL, check=True)
+        runs.append(time.perf_counter() - start)
+
+    # -X importtime slows the process down, so the imports are listed in a separate run
+    traced = subprocess.run(command[:1] + ['-X', 'importtime'] + command[1:], cwd=root,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    imported = {line.rsplit('|', 1)[1].strip().split('.')[0]
+                for line in traced.stderr.splitlines() if line.startswith('import time:')}
+    return min(runs), sorted(imported & HEAVY_MODULES)
+
+
+def run_benchmark(options, repeat=1):
+    """Generate a tree, time each stage and return a report dict"""
+    root = tempfile.mkdtemp(prefix='metrics-bench-')
+    try:
+        print(f"Generating {options['files_per_theme']} files x {options['rows_per_file']:,} rows per theme "
+              f"in {root}...")
+        rows = generate_tree(root, options['rows_per_file'], options['files_per_theme'],
+                             options['cardinality'], seed=options['seed'])
+
+        stages = {}
+        themes_data = None
+        for stage in ['ingestion', 'aggregation', 'rendering']:
+            runs = [run_stage(root, stage, options, themes_data) for _ in range(repeat)]
+            seconds = min(run[0] for run in runs)
+            stages[stage] = {
+                'seconds': seconds,
+                'rows_per_sec': rows / seconds if stage != 'rendering' and seconds > 0 else None,
+                'peak_rss_mb': max((run[1] for run in runs if run[1] is not None), default=None)
+            }
+            if stage == 'aggregation':
+                themes_data = runs[0][2]
+
+        seconds, heavy = run_startup(root, repeat)
+        stages['startup'] = {'seconds': seconds, 'rows_per_sec': None, 'peak_rss_mb': None, 'heavy_imports': heavy}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {'config': options, 'rows': rows, 'stages': stages}
+
+
+def print_report(report):
+    """Print one line per stage"""
+    print(f"\n{report['rows']:,} rows")
+    print(f"{'Stage':<12} {'Seconds':>9} {'Rows/sec':>12} {'Peak RSS (MB)':>14}")
+    for stage, stats in report['stages'].items():
+        rate = f"{stats['rows_per_sec']:,.0f}" if stats['rows_per_sec'] else '-'
+        rss = f"{stats['peak_rss_mb']:.1f}" if stats['peak_rss_mb'] is not None else '-'
+        print(f"{stage:<12} {stats['seconds']:>9.3f} {rate:>12} {rss:>14}")
+
+
+def compare_to_baseline(report, baseline, max_slowdown=MAX_SLOWDOWN, max_rss_growth=MAX_RSS_GROWTH):
+    """Return a list of regression messages (empty when within thresholds), or None when not comparable"""
+    if baseline['config'] != report['config']:
+        print("Warning: baseline was recorded with a different configuration, comparison skipped")
+        return None
+
+    regressions = []
+    for stage, stats in report['stages'].items():
+        before = baseline['stages'].get(stage)
+        if before is None:
+            continue
+        # Compare throughput where there is one; rendering only has a duration
+        if stats['rows_per_sec'] and before['rows_per_sec']:
+            change = stats['rows_per_sec'] / before['rows_per_sec'] - 1
+            label = f"{stats['rows_per_sec']:,.0f} vs {before['rows_per_sec']:,.0f} rows/sec"
+        else:
+            change = before['seconds'] / stats['seconds'] - 1 if stats['seconds'] > 0 else 0
+            label = f"{stats['seconds']:.3f}s vs {before['seconds']:.3f}s"
+        if change < -max_slowdown:
+            regressions.append(f"{stage}: {-change:.0%} slower ({label})")
+
+        if not (stats['peak_rss_mb'] and before['peak_rss_mb']):
+            continue
+        growth = stats['peak_rss_mb'] / before['peak_rss_mb'] - 1
+        if growth > max_rss_growth:
+            regressions.append(f"{stage}: peak RSS {growth:.0%} higher "
+                               f"({stats['peak_rss_mb']:.1f} vs {before['peak_rss_mb']:.1f} MB)")
+    return regressions
+
+
+def check_startup(report, budget=RENDER_STARTUP_BUDGET):
+    """Return a list of problems with the render startup (empty when within budget)"""
+    stats = report['stages'].get('startup')
+    if stats is None:
+        return []
+    problems = []
+    if stats['seconds'] > budget:
+        problems.append(f"startup: cli.py render took {stats['seconds']:.3f}s, budget {budget:.3f}s")
+    if stats['heavy_imports']:
+        problems.append(f"startup: cli.py render imported {', '.join(stats['heavy_imports'])}")
+    return problems
+
+
+if __name__ == "__main__":
+    from csv_readers import READER_BACKENDS
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, aggregation and rendering")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small', help="Tree size (default small)")
+    parser.add_argument('--rows-per-file', type=int, help="Override the preset's rows per partition")
+    parser.add_argument('--files-per-theme', type=int, help="Override the preset's partitions per theme")
+    parser.add_argument('--cardinality', type=int,
+                        help="Override the preset's distinct values of high-cardinality columns")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the synthetic tree")
+    parser.add_argument('--workers', type=int, default=1, help="Processes used for aggregation (0 = all CPUs)")
+    parser.add_argument('--reader', choices=READER_BACKENDS, default='auto', help="CSV reader backend")
+    parser.add_argument('--top-k', type=int, default=None, metavar='CAPACITY', help="Benchmark top-K mode")
+    parser.add_argument('--hll', type=int, default=None, metavar='PRECISION', help="Benchmark HyperLogLog mode")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per stage; the fastest is reported")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help=f"Baseline file (default {BASELINE_FILE})")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--max-slowdown', type=float, default=MAX_SLOWDOWN,
+                        help=f"Allowed throughput drop as a fraction (default {MAX_SLOWDOWN})")
+    parser.add_argument('--max-rss-growth', type=float, default=MAX_RSS_GROWTH,
+                        help=f"Allowed peak RSS growth as a fraction (default {MAX_RSS_GROWTH})")
+    parser.add_argument('--startup-budget', type=float, default=RENDER_STARTUP_BUDGET,
+                        help=f"Allowed seconds for a cli.py render process (default {RENDER_STARTUP_BUDGET})")
+    parser.add_argument('--json', metavar='FILE', help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    options = dict(PRESETS[args.preset])
+    for key in ['rows_per_file', 'files_per_theme', 'cardinality']:
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+    options.update(seed=args.seed, workers=args.workers or os.cpu_count(), reader=args.reader,
+                   topk=args.top_k, hll=args.hll)
+
+    report = run_benchmark(options, args.repeat)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    problems = check_startup(report, args.startup_budget)
+    for message in problems:
+        print(f"\nOver budget: {message}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.max_slowdown, args.max_rss_growth)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for message in regressions:
+                print(f"  - {message}")
+            raise SystemExit(1)
+        if regressions is not None:
+            print(f"\nNo regressions against {args.baseline}")
+    if problems:
+        raise SystemExit(1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Command-line entry point for the Overture Metrics context tools.
+
+    python3 cli.py scan [options]      # aggregate the CSVs and render (generate_llm_context.py)
+    python3 cli.py render [options]    # re-render from the aggregate snapshot
+    python3 cli.py analyze [options]   # per-theme summary (analyze_metrics.py)
+    python3 cli.py bench [options]     # benchmarks (benchmark.py)
+
+scan, analyze and bench take the options of the script they run. Modules
+are imported only once a command needs them: render works from the
+snapshot alone and never imports pandas or numpy, so re-rendering with
+another detail level or top-N starts within RENDER_STARTUP_BUDGET seconds
+(checked by benchmark.py). Without a usable snapshot, render falls back to
+a scan; so it does when the snapshot is stale, i.e. a newer release exists
+or its CSV partitions changed since it was built, unless --allow-stale is
+given.
+"""
+
+import argparse
+import sys
+
+from artifacts import ARTIFACT_DIR
+from context_document import MAX_TOP_N, SLICE_DIR, render_snapshot
+from snapshot import SNAPSHOT_FILE, load_snapshot, stale_reasons
+from token_budget import DETAIL_PRESETS
+
+RENDER_STARTUP_BUDGET = 0.5  # Seconds for a whole `cli.py render` process, interpreter start included
+
+SCRIPTS = {
+    'scan': 'generate_llm_context',
+    'analyze': 'analyze_metrics',
+    'bench': 'benchmark'
+}
+
+
+def run_script(command, argv):
+    """Run a script's own command line, as if it had been started directly"""
+    import runpy
+    sys.argv = [f"cli.py {command}", *argv]
+    runpy.run_module(SCRIPTS[command], run_name='__main__', alter_sys=True)
+
+
+def render(argv):
+    """Render the document from the aggregate snapshot, scanning only when there is none"""
+    parser = argparse.ArgumentParser(prog='cli.py render',
+                                     description="Render the LLM context document from the aggregate snapshot")
+    parser.add_argument('--snapshot', default=SNAPSHOT_FILE, metavar='FILE',
+                        help=f"Snapshot to render (default {SNAPSHOT_FILE})")
+    parser.add_argument('--detail', choices=list(DETAIL_PRESETS), default='full',
+                        help="Detail level: sections, columns and top values included (default full)")
+    parser.add_argument('--top-n', type=int, metavar='N',
+                        help=f"Top values shown per column (1-{MAX_TOP_N}) instead of the detail level's")
+    parser.add_argument('--token-budget', type=int, metavar='N',
+                        help="Trim the lowest-information content until the document fits in N tokens")
+    parser.add_argument('--summary', metavar='FILE', help="Also write the analyze_metrics.py summary")
+    parser.add_argument('--slices', nargs='?', const=SLICE_DIR, default=None, metavar='DIR',
+                        help=f"Also write per-theme and per-country context slices (default {SLICE_DIR})")
+    parser.add_argument('--artifacts', nargs='?', const=ARTIFACT_DIR, default=None, metavar='DIR',
+                        help=f"Also publish content-hashed, compressed copies (default {ARTIFACT_DIR})")
+    parser.add_argument('--no-scan', action='store_true',
+                        help="Fail instead of scanning the Metrics CSVs when there is no usable snapshot")
+    parser.add_argument('--allow-stale', action='store_true',
+                        help="Render the snapshot, with a warning, even if the Metrics tree has changed since")
+    args = parser.parse_args(argv)
+    if args.top_n is not None and not 1 <= args.top_n <= MAX_TOP_N:
+        parser.error(f"--top-n must be between 1 and {MAX_TOP_N}")
+
+    try:
+        snapshot = load_snapshot(args.snapshot)
+    except (OSError, ValueError) as e:
+        snapshot, problem = None, f"No usable snapshot ({e})"
+    else:
+        stale = stale_reasons(snapshot)
+        problem = f"Snapshot {args.snapshot} is stale: {'; '.join(stale)}" if stale else None
+        if problem and args.allow_stale:
+            print(f"Warning: {problem}")
+            problem = None
+
+    if problem:
+        if args.no_scan:
+            parser.error(problem + ("; pass --allow-stale to render it anyway" if snapshot is not None else ""))
+        print(f"{problem}; scanning the Metrics CSVs instead")
+        # Rebuild with the settings the stale snapshot was built with
+        settings = snapshot['settings'] if snapshot is not None else {}
+        from generate_llm_context import generate_document
+        generate_document(topk=settings.get('topk'), hll=settings.get('hll'),
+                          engine=settings.get('engine', 'pandas'), partitions=settings.get('partitions') or None,
+                          summary_file=args.summary, detail=args.detail, token_budget=args.token_budget,
+                          snapshot_file=args.snapshot, slice_dir=args.slices, artifact_dir=args.artifacts,
+                          cube=settings.get('cube', False), top_n=args.top_n)
+        return
+
+    render_snapshot(snapshot, args.detail, args.token_budget, args.summary, None, args.slices, args.artifacts,
+                    args.top_n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Overture Metrics context tools",
+        epilog="Run 'cli.py <command> --help' for the options of a command.")
+    parser.add_argument('command', choices=['scan', 'render', 'analyze', 'bench'],
+                        help="scan: aggregate the CSVs and render; render: re-render from the snapshot; "
+                             "analyze: per-theme summary; bench: benchmarks")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Options for the command")
+    args = parser.parse_args()
+
+    if args.command == 'render':
+        render(args.args)
+    else:
+        run_script(args.command, args.args)
@@ -0,0 +1,652 @@
+"""
+Render the LLM context document from an aggregate snapshot.
+
+Everything here works on the plain data of a snapshot (see snapshot.py)
+and imports neither pandas nor numpy, so re-rendering an existing snapshot,
+serving documents from one (docs/context_api.py) or writing slices starts
+in a fraction of the time a scan needs. generate_llm_context.py aggregates
+the Metrics CSVs into a snapshot and renders it with these functions.
+"""
+
+import io
+import json
+import os
+import re
+from datetime import datetime
+
+from artifacts import ARTIFACT_MANIFEST, publish_artifacts
+from instrumentation import stage
+from snapshot import slice_snapshot, theme_changelog
+from token_budget import DETAIL_PRESETS, estimate_tokens, fit_to_budget, value_score
+
+# Configuration
+OUTPUT_FILE = "README_generation_output.txt"
+SLICE_DIR = "context_slices"
+SLICE_INDEX = "index.json"
+MAX_TOP_N = 15  # Top values kept per column in the snapshot
+
+# Schema definitions (could be externalized to a config file)
+COLUMN_DEFINITIONS = {
+    'datasets': {
+        'definition': 'The original source(s) of the feature data',
+        'type': 'String (comma-separated for multiple sources)',
+        'notes': 'Common values include OpenStreetMap, Microsoft ML Buildings, Google Open Buildings, Meta, ESA WorldCover, and others'
+    },
+    'change_type': {
+        'definition': "Feature's status compared to the previous Overture release",
+        'type': 'Enumerated string',
+        'values': {
+            'unchanged': 'Feature exists in both releases with identical data (ALL attributes are exactly the same)',
+            'data_changed': 'Feature exists in both but has modified attributes (e.g., coordinates, names, categories, confidence scores, or ANY other attribute changed)',
+            'added': 'New feature in this release',
+            'removed': 'Feature existed in previous release but not current'
+        },
+        'notes': 'Low unchanged counts mean many features had attribute updates between releases. This is normal for dynamic data. DO NOT assume low unchanged values are related to operating hours or other temporal data not present in this dataset.'
+    },
+    'country': {
+        'definition': 'ISO 3166-1 Alpha-2 country code',
+        'type': '2-character string',
+        'examples': 'US, BR, IN, CN, GB',
+        'usage': 'Identifies the country where the feature is located'
+    },
+    'address_level_1': {
+        'definition': 'First-level administrative division (state/province)',
+        'type': 'String',
+        'examples': 'California, Oaxaca, Ontario, Queensland',
+        'notes': 'Meaning varies by country (US: state, Canada: province, etc.)'
+    },
+    'address_level_2': {
+        'definition': 'Second-level administrative division (county/municipality)',
+        'type': 'String',
+        'examples': 'Los Angeles County, Santa Cruz Amilpas',
+        'notes': 'May represent city, county, or district depending on country'
+    },
+    'address_level_3': {
+        'definition': 'Third-level administrative division (neighborhood/district)',
+        'type': 'String',
+        'notes': 'Optional; not all countries use three address levels'
+    },
+    'subtype': {
+        'definition': 'Broad category of the feature (meaning varies by theme)',
+        'type': 'Enumerated string',
+        'notes': 'Buildings: use type (residential, commercial, etc.); Transportation: pathway type (road, rail, water); Base: feature category; Divisions: administrative level'
+    },
+    'class': {
+        'definition': 'More specific classification within the subtype',
+        'type': 'Enumerated string',
+        'notes': 'Provides finer granularity than subtype'
+    },
+    'subclass': {
+        'definition': 'Optional refinement of class (primarily in Transportation)',
+        'type': 'Enumerated string',
+        'examples': 'driveway, parking_aisle, sidewalk, link, crosswalk, alley'
+    },
+    'place_countries': {
+        'definition': 'ISO 3166-1 Alpha-2 code for the country where place is located',
+        'type': '2-character string',
+        'usage': 'Identifies place location in Places theme'
+    },
+    'primary_category': {
+        'definition': "Main category describing the place's purpose or service",
+        'type': 'String',
+        'notes': 'Over 2,000 unique categories exist in Places theme'
+    },
+    'confidence': {
+        'definition': 'Numerical score indicating certainty of place existence',
+        'type': 'Float (0.0 to 1.0)',
+        'interpretation': '1.0 = verified/confirmed; 0.5-0.8 = moderate confidence; 0.0 = permanently closed or does not exist',
+        'notes': 'This score ONLY indicates whether a place exists or is closed. It does NOT represent operating hours, business hours, opening times, or any temporal availability. The data contains NO information about when places are open or closed during the day.'
+    }
+}
+
+THEME_DESCRIPTIONS = {
+    'addresses': {
+        'title': 'ADDRESSES',
+        'description': 'Address points with hierarchical administrative levels',
+        'feature_count_label': 'addresses',
+        'key_points': [
+            'Simplified, worldwide address schema based primarily on OpenAddresses',
+            'Includes hierarchical administrative levels (address_level_1, 2, 3)',
+            'Coverage varies significantly by country'
+        ]
+    },
+    'buildings': {
+        'title': 'BUILDINGS',
+        'description': 'Building footprints categorized by use and construction details',
+        'feature_count_label': 'buildings',
+        'key_points': [
+            'Categorized by use (residential, commercial, industrial, etc.)',
+            'Sources: Google Open Buildings, Microsoft ML Buildings, OpenStreetMap',
+            'Includes detailed attributes: height, floors, construction details'
+        ]
+    },
+    'places': {
+        'title': 'PLACES',
+        'description': 'Points of interest including businesses, landmarks, and amenities',
+        'feature_count_label': 'places',
+        'key_points': [
+            'Businesses, landmarks, amenities, and services worldwide',
+            'Confidence scores indicate data quality (0.0 to 1.0)',
+            'Primary sources: Meta, Microsoft',
+            'Over 2,000 unique place categories'
+        ]
+    },
+    'divisions': {
+        'title': 'DIVISIONS',
+        'description': 'Administrative boundaries and divisions',
+        'feature_count_label': 'divisions',
+        'key_points': [
+            'Nine administrative levels: country → dependency → region → county → localadmin → locality → macrohood → neighborhood → microhood',
+            'Translated into 40+ languages',
+            'Includes population data and administrative hierarchies'
+        ]
+    },
+    'transportation': {
+        'title': 'TRANSPORTATION',
+        'description': 'Transportation network including roads, rails, and waterways',
+        'feature_count_label': 'features',
+        'key_points': [
+            'Includes segments (pathways) and connectors (intersections)',
+            'Detailed routing attributes: speed limits, access restrictions, surface types',
+            'Primarily road data with some rail and water routes'
+        ]
+    },
+    'base': {
+        'title': 'BASE',
+        'description': 'Contextual features including land, water, and infrastructure',
+        'feature_count_label': 'features',
+        'key_points': [
+            'Six feature types: land, water, land_cover, land_use, infrastructure, bathymetry',
+            'Includes natural features (forests, streams) and infrastructure (bridges, power lines)',
+            'Land cover data from ESA WorldCover 2020 (10m resolution)'
+        ]
+    }
+}
+
+
+def format_large_number(num):
+    """Format large numbers with proper suffixes"""
+    if num >= 1_000_000_000:
+        return f"{num/1_000_000_000:.2f}B"
+    elif num >= 1_000_000:
+        return f"{num/1_000_000:.2f}M"
+    elif num >= 1_000:
+        return f"{num/1_000:.2f}K"
+    else:
+        return str(num)
+
+
+def format_stat(value):
+    """Format a numeric statistic with four significant digits, or whole above 10,000"""
+    return f"{value:,.0f}" if abs(value) >= 10_000 else f"{value:,.4g}"
+
+
+def detail_plan(detail='full', top_n=None):
+    """The DETAIL_PRESETS plan for a detail level, optionally with another number of top values"""
+    if detail not in DETAIL_PRESETS:
+        raise ValueError(f"Unknown detail level '{detail}', expected one of {list(DETAIL_PRESETS)}")
+    if top_n is not None and not 1 <= top_n <= MAX_TOP_N:
+        raise ValueError(f"top_n must be between 1 and {MAX_TOP_N}")
+    plan = dict(DETAIL_PRESETS[detail])
+    if top_n is not None:
+        plan['top_values'] = top_n
+    return plan
+
+
+def render_snapshot(snapshot, detail='full', token_budget=None, summary_file=None, report=None, slice_dir=None,
+                    artifact_dir=None, top_n=None):
+    """Render the LLM context document (and optionally the summary, slices and artifacts) from a snapshot"""
+    plan = detail_plan(detail, top_n)
+
+    # Generate document
+    print(f"\nGenerating {OUTPUT_FILE}...")
+    with stage(report, 'render', detail=detail, token_budget=token_budget) as entry:
+        text, plan, tokens = render_within_budget(snapshot, plan, token_budget)
+        write_atomic(OUTPUT_FILE, text)
+        entry['bytes_written'] = os.path.getsize(OUTPUT_FILE)
+        entry['tokens'] = tokens
+
+    print(f"\n✓ Document generated successfully: {OUTPUT_FILE}")
+    print(f"  File size: {os.path.getsize(OUTPUT_FILE) / 1024:.1f} KB (~{tokens:,} tokens)")
+    if token_budget:
+        dropped = [section for section in DETAIL_PRESETS[detail]['sections'] if section not in plan['sections']]
+        if tokens > token_budget:
+            print(f"  Warning: even the leanest document exceeds the budget of {token_budget:,} tokens")
+        elif dropped or plan['min_score'] > 0:
+            print(f"  Trimmed to fit {token_budget:,} tokens: dropped {', '.join(dropped) or 'no sections'}, "
+                  f"values scoring below {plan['min_score']:.4f}")
+
+    if summary_file:
+        from analyze_metrics import write_summary  # Needs the scan modules, so only imported here
+        with stage(report, 'summary'):
+            write_summary(snapshot['themes'], summary_file)
+        print(f"✓ Metrics summary written: {summary_file}")
+
+    if slice_dir:
+        with stage(report, 'render_slices') as entry:
+            index = write_slices(snapshot, slice_dir, detail_plan(detail, top_n), token_budget)
+            entry['slices'] = len(index['slices'])
+        countries = sum(1 for item in index['slices'] if item['country'] is not None)
+        print(f"✓ {len(index['slices']) - countries} theme and {countries} country slices written: {slice_dir}/")
+        if not snapshot.get('slices'):
+            print("  (the snapshot has no per-country aggregates; regenerate with --slices for country slices)")
+
+    if artifact_dir:
+        files = {OUTPUT_FILE: OUTPUT_FILE}
+        if slice_dir:
+            # Logical names match the paths docs/index.html requests
+            files[f"{SLICE_DIR}/{SLICE_INDEX}"] = os.path.join(slice_dir, SLICE_INDEX)
+            files.update({f"{SLICE_DIR}/{item['file']}": os.path.join(slice_dir, item['file'])
+                          for item in index['slices']})
+        with stage(report, 'artifacts') as entry:
+            manifest = publish_artifacts(files, artifact_dir)
+            entry['artifacts'] = len(manifest['artifacts'])
+        document = manifest['artifacts'][OUTPUT_FILE]
+        print(f"✓ {len(manifest['artifacts'])} hashed artifacts published: "
+              f"{os.path.join(artifact_dir, ARTIFACT_MANIFEST)}")
+        print(f"  {OUTPUT_FILE}: {document['bytes'] / 1024:.1f} KB, "
+              + ", ".join(f"{encoding} {variant['bytes'] / 1024:.1f} KB"
+                          for encoding, variant in document['encodings'].items()))
+
+    print("\nYou can now load this file into an LLM for natural language querying!")
+
+
+def write_atomic(path, text):
+    """Write a text file through a temporary file, so readers never see it half-written"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def render_within_budget(snapshot, detail, token_budget=None):
+    """Render a snapshot with a detail plan, trimmed to token_budget if given.
+
+    Returns (text, plan, tokens) like token_budget.fit_to_budget().
+    """
+    if token_budget:
+        return fit_to_budget(lambda plan: render_document(snapshot, plan),
+                             detail, token_budget, value_scores(snapshot['themes'], detail))
+    text = render_document(snapshot, detail)
+    return text, detail, estimate_tokens(text)
+
+
+def slice_name(value):
+    """File-name-safe form of a slice key such as a country code"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', value).strip('._') or '_'
+
+
+def write_slices(snapshot, slice_dir=SLICE_DIR, detail=None, token_budget=None):
+    """Write self-contained context slices and their index.
+
+    One slice per theme (<theme>.txt) and, when the snapshot has per-country
+    aggregates, one per country of the sliced themes
+    (<theme>/<country>.txt). Each slice is a complete document with the
+    shared instructions and schema, limited to its theme or country.
+    <slice_dir>/index.json lists every slice with its size and token count
+    so a client can fetch only the slices it needs. Returns the index.
+    """
+    detail = detail or DETAIL_PRESETS['full']
+    scopes = [(theme, None) for theme in snapshot['themes']]
+    for theme, countries in (snapshot.get('slices') or {}).items():
+        scopes += [(theme, country) for country, data in countries.items() if data]
+
+    entries = []
+    for theme, country in scopes:
+        scoped = slice_snapshot(snapshot, theme, country)
+        path = f"{theme}.txt" if country is None else f"{theme}/{slice_name(country)}.txt"
+        text, _, tokens = render_within_budget(scoped, detail, token_budget)
+        os.makedirs(os.path.dirname(os.path.join(slice_dir, path)), exist_ok=True)
+        write_atomic(os.path.join(slice_dir, path), text)
+        entries.append({
+            'theme': theme,
+            'country': country,
+            'file': path,
+            'features': scoped['themes'][theme]['total_features'],
+            'bytes': len(text.encode('utf-8')),
+            'tokens': tokens
+        })
+
+    index = {
+        'release': snapshot['release'],
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'document': OUTPUT_FILE,
+        'slices': entries
+    }
+    write_atomic(os.path.join(slice_dir, SLICE_INDEX), json.dumps(index, indent=1))
+    return index
+
+
+def value_scores(themes_data, detail):
+    """value_score() of every top value a detail plan could include"""
+    max_features = max((data['total_features'] for data in themes_data.values()), default=0)
+    return [value_score(item['percentage'], data['total_features'], max_features)
+            for data in themes_data.values()
+            for col, col_data in data['columns'].items()
+            if col_data['categorical'] and col in detail['columns']
+            for item in col_data['top_values'][:detail['top_values']]]
+
+
+def render_document(snapshot, detail=None):
+    """Render the LLM context document from an aggregate snapshot.
+
+    `detail` is a plan from token_budget.DETAIL_PRESETS (default full) that
+    selects prose sections, columns and top values per column.
+    """
+    latest_release = snapshot['release']
+    themes_data = snapshot['themes']
+    detail = detail or DETAIL_PRESETS['full']
+    sections = detail['sections']
+    max_features = max((data['total_features'] for data in themes_data.values()), default=0)
+    f = io.StringIO()
+    # Header
+    f.write("=" * 80 + "\n")
+    f.write("OVERTURE MAPS DATA - LLM EXPLORATION GUIDE\n")
+    f.write("=" * 80 + "\n")
+    f.write(f"Release Version: {latest_release}\n")
+    if snapshot.get('scope'):
+        f.write(f"Scope: {snapshot['scope']} (one slice of the full document)\n")
+    f.write("Document Purpose: Enable natural language querying of Overture Maps data\n")
+    f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+
+    # Instructions
+    if 'instructions' in sections:
+        f.write("<<<INSTRUCTIONS_START>>>\n\n")
+        f.write("## YOUR ROLE\n")
+        f.write("You are a data analyst assistant helping users understand and explore Overture Maps\n")
+        f.write("data. This document contains comprehensive statistics, schema definitions, and\n")
+        f.write("context about the Overture Maps Foundation's open geospatial datasets.\n\n")
+
+        f.write("## HOW TO USE THIS DOCUMENT\n")
+        f.write("- Answer user questions about data distributions, coverage, and characteristics\n")
+        f.write("- Provide specific numbers, percentages, and comparisons when available\n")
+        f.write("- Reference the schema definitions to explain data structure\n")
+        f.write("- Use the statistics sections to support your analysis\n")
+        f.write("- Be precise and cite specific metrics from this document\n\n")
+
+        f.write("## KEY CONSTRAINTS\n")
+        f.write(f"- Data is from release {latest_release} only\n")
+        f.write("- All statistics represent aggregated counts across multiple data sources\n")
+        f.write("- Some themes may have data quality variations by geographic region\n")
+        f.write("- Confidence scores in Places theme range from 0.0 (closed/doesn't exist) to 1.0 (verified)\n\n")
+
+        f.write("## CRITICAL: DO NOT MAKE ASSUMPTIONS\n")
+        f.write("- ONLY use information explicitly provided in this document\n")
+        f.write("- DO NOT infer or assume attributes not mentioned in the schema definitions\n")
+        f.write("- DO NOT guess about data that might exist (e.g., operating hours, phone numbers, emails)\n")
+        f.write("- If a user asks about data not covered in this document, clearly state it is not available\n")
+        f.write("- When uncertain, say 'This information is not provided in the available data'\n")
+        f.write("- Example: This data does NOT include operating hours, contact information, or real-time status\n\n")
+
+        f.write("<<<INSTRUCTIONS_END>>>\n\n\n")
+
+    # Overview
+    f.write("=" * 80 + "\n")
+    f.write("## OVERTURE MAPS FOUNDATION OVERVIEW\n")
+    f.write("=" * 80 + "\n\n")
+
+    f.write("Overture Maps Foundation is an open data initiative that provides free,\n")
+    f.write("interoperable geospatial datasets for mapping applications worldwide. The data\n")
+    f.write("is released as GeoParquet files with a JSON schema definition, using GeoJSON\n")
+    f.write("as the canonical geospatial format.\n\n")
+
+    f.write("### THE SIX DATA THEMES\n\n")
+
+    for theme, info in THEME_DESCRIPTIONS.items():
+        # A theme may be split into several country sections
+        entries = [data for key, data in themes_data.items() if data.get('theme', key) == theme]
+        if entries:
+            total_features = sum(data['total_features'] for data in entries)
+            f.write(f"**{info['title']}**\n")
+            f.write(f"   - {format_large_number(total_features)} {info['feature_count_label']}\n")
+            if 'theme_notes' in sections:
+                f.write(f"   - {info['description']}\n")
+                for point in info['key_points']:
+                    f.write(f"   - {point}\n")
+            f.write("\n")
+
+    # Schema Reference
+    if 'schema' in sections:
+        f.write("\n" + "=" * 80 + "\n")
+        f.write("<<<SCHEMA_START>>>\n")
+        f.write("## SCHEMA REFERENCE - GROUPING COLUMNS\n")
+        f.write("=" * 80 + "\n\n")
+
+        f.write("This section defines the key columns used to categorize and group data across\n")
+        f.write("all themes. Understanding these columns is essential for querying the data.\n\n")
+
+        # Universal columns
+        f.write("---\n### UNIVERSAL COLUMNS (All Themes)\n---\n\n")
+        for col in ['datasets', 'change_type']:
+            if col in COLUMN_DEFINITIONS:
+                defn = COLUMN_DEFINITIONS[col]
+                f.write(f"**{col}**\n")
+                f.write(f"Definition: {defn['definition']}\n")
+                f.write(f"Type: {defn['type']}\n")
+                if 'values' in defn:
+                    f.write("Possible Values:\n")
+                    for val, desc in defn['values'].items():
+                        f.write(f"  - {val}: {desc}\n")
+                if 'notes' in defn:
+                    f.write(f"Notes: {defn['notes']}\n")
+                f.write("\n")
+
+        # Theme-specific columns
+        theme_columns = {
+            'ADDRESSES THEME': ['country', 'address_level_1', 'address_level_2', 'address_level_3'],
+            'BUILDINGS THEME': ['subtype', 'class'],
+            'PLACES THEME': ['place_countries', 'primary_category', 'confidence'],
+            'DIVISIONS THEME': ['subtype', 'class', 'country'],
+            'TRANSPORTATION THEME': ['subtype', 'class', 'subclass'],
+            'BASE THEME': ['subtype', 'class']
+        }
+
+        for section, columns in theme_columns.items():
+            f.write(f"---\n### {section} COLUMNS\n---\n\n")
+            for col in columns:
+                if col in COLUMN_DEFINITIONS:
+                    defn = COLUMN_DEFINITIONS[col]
+                    f.write(f"**{col}**\n")
+                    f.write(f"Definition: {defn['definition']}\n")
+                    f.write(f"Type: {defn['type']}\n")
+                    if 'examples' in defn:
+                        f.write(f"Examples: {defn['examples']}\n")
+                    if 'usage' in defn:
+                        f.write(f"Usage: {defn['usage']}\n")
+                    if 'interpretation' in defn:
+                        f.write(f"Interpretation: {defn['interpretation']}\n")
+                    if 'notes' in defn:
+                        f.write(f"Notes: {defn['notes']}\n")
+                    f.write("\n")
+
+        f.write("<<<SCHEMA_END>>>\n\n\n")
+
+    # Theme Statistics
+    for key, data in themes_data.items():
+        theme = data.get('theme', key)
+        info = THEME_DESCRIPTIONS[theme]
+
+        f.write("=" * 80 + "\n")
+        if 'country' in data:
+            f.write(f"## THEME STATISTICS: {info['title']} ({data['country']})\n")
+        else:
+            f.write(f"## THEME STATISTICS: {info['title']}\n")
+        f.write("=" * 80 + "\n\n")
+
+        f.write(f"**Total Features**: {data['total_features']:,} {info['feature_count_label']}\n\n")
+
+        # Changelog info if available; it is per theme, not per country
+        if 'changelog' in sections and 'country' not in data:
+            changes = theme_changelog(snapshot, theme)
+            if changes:
+                f.write("**Release Comparison** (vs. baseline):\n")
+                for row in changes:
+                    f.write(f"  Type: {row['type']}\n")
+                    f.write(f"  - Total Change: {row['total_diff_perc']:.2f}%\n")
+                    f.write(f"  - Added: {int(row['added']):,} ({row['added_perc']:.2f}%)\n")
+                    f.write(f"  - Removed: {int(row['removed']):,} ({row['removed_perc']:.2f}%)\n")
+                    f.write(f"  - Data Changed: {int(row['data_changed']):,} ({row['data_changed_perc']:.2f}%)\n")
+                    f.write(f"  - Unchanged: {int(row['unchanged']):,} ({row['unchanged_perc']:.2f}%)\n")
+                f.write("\n")
+
+        # Trend over earlier releases, from trend mode
+        trend = [point for point in snapshot.get('trend') or [] if theme in point['themes']]
+        if 'trends' in sections and len(trend) > 1 and 'country' not in data:
+            first, last = trend[0], trend[-1]
+            f.write(f"**Trend over {len(trend)} releases** ({first['release']} to {last['release']}):\n")
+            f.write("  Total features:\n")
+            previous = None
+            for point in trend:
+                total = point['themes'][theme]['total_features']
+                change = f" ({(total - previous) / previous * 100:+.2f}%)" if previous else ""
+                f.write(f"    {point['release']}: {total:,}{change}\n")
+                previous = total
+
+            # Share changes of the latest release's top values since the first release
+            f.write(f"  Top value share changes since {first['release']}:\n")
+            first_shares = first['themes'][theme]['shares']
+            for col, shares in last['themes'][theme]['shares'].items():
+                if col not in detail['columns']:
+                    continue
+                for value, share in list(shares.items())[:min(3, detail['top_values'])]:
+                    if value in first_shares.get(col, {}):
+                        before = first_shares[col][value]
+                        f.write(f"    {col} {value}: {before:.2f}% -> {share:.2f}% "
+                                f"({share - before:+.2f} pp)\n")
+                    else:
+                        f.write(f"    {col} {value}: {share:.2f}% (new among the top values)\n")
+            f.write("\n")
+
+        # Column statistics
+        for col, col_data in data['columns'].items():
+            if col_data['categorical'] and col in detail['columns']:
+                # Values below the plan's score threshold are left out, and
+                # so are columns with none left
+                top_values = [item for item in col_data['top_values'][:detail['top_values']]
+                              if value_score(item['percentage'], data['total_features'], max_features)
+                              >= detail['min_score']]
+                if col_data['top_values'] and not top_values:
+                    continue
+
+                f.write(f"**{col.replace('_', ' ').title()}**:\n")
+                if col_data.get('unique_count_is_lower_bound'):
+                    f.write(f"  Unique Values: {col_data['unique_count']}+\n")
+                elif 'unique_count_error' in col_data:
+                    f.write(f"  Unique Values: ~{col_data['unique_count']} "
+                            f"(estimate, ±{col_data['unique_count_error'] * 100:.1f}%)\n")
+                else:
+                    f.write(f"  Unique Values: {col_data['unique_count']}\n")
+                if 'error_bound' in col_data:
+                    f.write(f"  Counts are approximate (each overstated by at most {col_data['error_bound']:,})\n")
+
+                if top_values:
+                    f.write(f"  Top Values:\n")
+                    for item in top_values:
+                        f.write(f"    {item['value']}: {item['count']:,} ({item['percentage']:.2f}%)\n")
+                f.write("\n")
+
+        # Weighted numeric statistics
+        numeric = data.get('numeric') or {}
+        if 'numeric' in sections and numeric:
+            f.write("**Numeric Metrics** (per feature, weighted by feature count; sums over all features; "
+                    "quantiles approximate):\n")
+            for col, stats in numeric.items():
+                parts = [f"mean {format_stat(stats['mean'])}" if stats['mean'] is not None else "mean n/a",
+                         f"min {format_stat(stats['min'])}"]
+                parts += [f"{name} {format_stat(value)}" for name, value in stats['quantiles'].items()]
+                parts.append(f"max {format_stat(stats['max'])}")
+                if 'sum' in stats:
+                    parts.append(f"sum {format_stat(stats['sum'])}")
+                f.write(f"  {col}: {', '.join(parts)}\n")
+            for col, stats in numeric.items():
+                if stats.get('histogram'):
+                    f.write(f"  {col.replace('_', ' ').title()} Distribution:\n")
+                    for bucket in stats['histogram']:
+                        f.write(f"    {bucket['low']:.1f}-{bucket['high']:.1f}: {bucket['weight']:,.0f} "
+                                f"({bucket['percentage']:.2f}%)\n")
+            f.write("\n")
+
+        # Drill-downs from the cube: top values within the largest groups
+        cube = data.get('cube') or {}
+        if 'drilldowns' in sections and cube:
+            f.write("**Drill-downs** (top values within the largest groups):\n")
+            for by, rollups in cube.items():
+                for of, rollup in rollups.items():
+                    if by not in detail['columns'] or of not in detail['columns'] or not rollup:
+                        continue
+                    f.write(f"  {of.replace('_', ' ').title()} by {by.replace('_', ' ').title()}:\n")
+                    for value, row in list(rollup.items())[:detail['top_values']]:
+                        top_values = ', '.join(f"{item['value']} {item['percentage']:.1f}%"
+                                               for item in row['top_values'][:min(3, detail['top_values'])])
+                        f.write(f"    {value} ({int(row['total']):,}): {top_values}\n")
+            f.write("\n")
+
+        f.write("\n")
+
+    # Suggested Prompts
+    if 'prompts' in sections:
+        f.write("=" * 80 + "\n")
+        f.write("<<<PROMPTS_START>>>\n")
+        f.write("## SUGGESTED EXPLORATION PROMPTS\n")
+        f.write("=" * 80 + "\n\n")
+
+        f.write("Use these prompts to begin exploring the Overture Maps data. Each prompt is\n")
+        f.write("designed to leverage the statistics and schema information in this document.\n\n")
+
+        prompts = [
+            ("Geographic Distribution", [
+                "Which countries have the highest concentration of Places data? Show me the top 10 countries and their percentages.",
+                "Compare the distribution of Divisions data across China, India, and the United States.",
+                "What percentage of global building data comes from each data source?"
+            ]),
+            ("Data Quality & Confidence", [
+                "What proportion of Places have high confidence scores (0.8 or above)?",
+                "In the Buildings theme, how much data changed between releases?",
+                "Which themes had no changes in this release?"
+            ]),
+            ("Category Analysis", [
+                "What are the top 10 most common building types globally?",
+                "For the Places theme, list the top 15 primary categories.",
+                "In Transportation, what's the breakdown between road, rail, and water segments?"
+            ]),
+            ("Comparative Insights", [
+                "Compare the data source distribution across all six themes.",
+                "Which theme has the most diverse categorical values?",
+                "What are the most common road classes in the Transportation theme?"
+            ])
+        ]
+
+        for category, prompt_list in prompts:
+            f.write(f"### {category}\n\n")
+            for i, prompt in enumerate(prompt_list, 1):
+                f.write(f"{i}. \"{prompt}\"\n\n")
+
+        f.write("<<<PROMPTS_END>>>\n\n\n")
+
+    # Additional Resources
+    if 'resources' in sections:
+        f.write("=" * 80 + "\n")
+        f.write("## ADDITIONAL RESOURCES\n")
+        f.write("=" * 80 + "\n\n")
+
+        f.write("**Official Documentation**:\n")
+        f.write("  - Overture Maps Documentation: https://docs.overturemaps.org/\n")
+        f.write("  - Schema Reference: https://docs.overturemaps.org/schema/reference/\n")
+        f.write("  - Data Guides: https://docs.overturemaps.org/guides/\n\n")
+
+        f.write("**Data Sources**:\n")
+        f.write("  - OpenStreetMap: https://www.openstreetmap.org/\n")
+        f.write("  - ESA WorldCover: https://worldcover.esa.int/\n")
+        f.write("  - Overture GitHub: https://github.com/OvertureMaps/data\n\n")
+
+    f.write("=" * 80 + "\n")
+    f.write("END OF DOCUMENT\n")
+    f.write("=" * 80 + "\n")
+
+    return f.getvalue()
+
+
+def write_document(snapshot, output_file=OUTPUT_FILE, detail=None):
+    """Render the LLM context document and write it to output_file"""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(render_document(snapshot, detail))
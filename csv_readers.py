@@ -0,0 +1,247 @@
+"""
+Pluggable CSV reader backends for Overture Metrics partitions.
+
+Every backend yields pandas DataFrame chunks with the same contents:
+
+- pandas: the pandas C engine (always available)
+- pyarrow: pyarrow's multithreaded CSV reader
+- polars: polars' multithreaded CSV reader (needs pyarrow for conversion)
+
+'auto' picks the fastest installed backend. All backends support column
+projection and explicit dtypes, treat the same strings as missing values,
+and skip rows with too many fields, matching pd.read_csv(on_bad_lines='skip').
+Floats are parsed correctly rounded by every backend; pandas' default
+converter can be one bit off, so pandas uses its round-trip converter.
+Every backend streams the file and yields chunks of exactly `chunksize`
+rows, so memory stays bounded by the chunk size whatever the file size.
+When the pyarrow or polars backend meets rows it cannot read identically
+(malformed rows, inferred date/time columns, values that no longer fit the
+types inferred from the start of the file), pandas reads the rest of the
+file from the first row not yet yielded, so output never depends on the
+backend.
+"""
+
+import csv
+from importlib.util import find_spec
+
+READER_BACKENDS = ['auto', 'pyarrow', 'polars', 'pandas']
+
+# pd.read_csv's default missing-value strings
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+BLOCK_BYTES = 8 << 20  # Bytes parsed at a time by the pyarrow backend
+BATCH_ROWS = 65_536  # Rows streamed at a time by the polars backend; small batches keep its read-ahead bounded
+
+
+class UnsupportedFile(Exception):
+    """Raised by a fast backend when a file must be read with pandas instead"""
+
+
+def _installed(module):
+    # Checked without importing, so choosing a backend stays cheap
+    return find_spec(module) is not None
+
+
+def resolve_backend(backend='auto'):
+    """Return the concrete backend name for a requested backend"""
+    if backend == 'auto':
+        return 'pyarrow' if _installed('pyarrow') else 'pandas'
+    if backend not in READER_BACKENDS:
+        raise ValueError(f"Unknown CSV reader '{backend}', expected one of {READER_BACKENDS}")
+
+    required = {'pyarrow': ['pyarrow'], 'polars': ['polars', 'pyarrow'], 'pandas': []}[backend]
+    missing = [module for module in required if not _installed(module)]
+    if missing:
+        raise ImportError(f"CSV reader '{backend}' requires {', '.join(missing)} to be installed")
+    return backend
+
+
+def reader_settings(backend='auto', project=False):
+    """Build the reader settings passed to readers.
+
+    Args:
+        backend: One of READER_BACKENDS; 'auto' picks pyarrow when installed.
+        project: Only materialize each theme's schema columns instead of
+            every column of the CSV.
+    """
+    return {'backend': resolve_backend(backend), 'project': project}
+
+
+def read_header(path):
+    """Return the column names of a CSV file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+
+def _read_pandas(path, chunksize, columns, dtypes, skip=0):
+    import pandas as pd
+
+    options = {'on_bad_lines': 'skip', 'usecols': columns, 'dtype': dtypes or None, 'float_precision': 'round_trip',
+               'skiprows': range(1, skip + 1) if skip else None}
+    if chunksize is None:
+        yield pd.read_csv(path, **options)
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, **options)
+
+
+def _narrow_integers(df, columns):
+    # Integer columns are parsed as float; like an unprojected pd.read_csv,
+    # a chunk keeps float64 where values are missing or fractional
+    for col in columns:
+        if col in df.columns and not df[col].isna().any() and (df[col] % 1 == 0).all():
+            df[col] = df[col].astype('int64')
+    return df
+
+
+def _exact_chunks(batches, chunksize, concat, empty):
+    # Regroup streamed batches into chunks of exactly `chunksize` rows, the
+    # last one shorter, so chunk boundaries match pd.read_csv(chunksize=...)
+    buffered, rows, emitted = [], 0, False
+    for batch in batches:
+        buffered.append(batch)
+        rows += len(batch)
+        while chunksize is not None and rows >= chunksize:
+            merged = concat(buffered)
+            yield merged.slice(0, chunksize)
+            emitted = True
+            buffered = [merged.slice(chunksize)]
+            rows -= chunksize
+    if rows or not emitted:
+        yield concat(buffered) if buffered else empty()
+
+
+def _read_pyarrow(path, chunksize, columns, dtypes):
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    types = {'category': pa.dictionary(pa.int32(), pa.string()), 'int64': pa.int64(), 'float64': pa.float64()}
+    invalid_rows = []
+
+    def skip_invalid(row):
+        invalid_rows.append(row)
+        return 'skip'
+
+    try:
+        stream = pacsv.open_csv(
+            path,
+            read_options=pacsv.ReadOptions(use_threads=True, block_size=BLOCK_BYTES),
+            parse_options=pacsv.ParseOptions(invalid_row_handler=skip_invalid),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=columns,
+                column_types={col: types[dtype] for col, dtype in (dtypes or {}).items()},
+                null_values=NA_VALUES,
+                strings_can_be_null=True
+            )
+        )
+    except pa.ArrowInvalid as e:
+        raise UnsupportedFile(str(e))
+
+    for field in stream.schema:
+        if not (pa.types.is_null(field.type) or pa.types.is_integer(field.type) or
+                pa.types.is_floating(field.type) or pa.types.is_boolean(field.type) or
+                pa.types.is_string(field.type) or pa.types.is_dictionary(field.type)):
+            raise UnsupportedFile(f"column {field.name} inferred as {field.type}")
+
+    def batches():
+        # Types are inferred from the first block; a later block that does
+        # not fit them (or has malformed rows) hands the rest to pandas
+        while True:
+            try:
+                batch = stream.read_next_batch()
+            except StopIteration:
+                return
+            except pa.ArrowInvalid as e:
+                raise UnsupportedFile(str(e))
+            if invalid_rows:
+                raise UnsupportedFile(f"{len(invalid_rows)} malformed rows")
+            yield pa.Table.from_batches([batch])
+
+    for table in _exact_chunks(batches(), chunksize, pa.concat_tables, stream.schema.empty_table):
+        converted = []
+        for field in table.schema:
+            column = table.column(field.name)
+            if pa.types.is_null(field.type):
+                # All-missing columns: pandas reads them as float, or text when empty
+                column = column.cast(pa.string() if table.num_rows == 0 else pa.float64())
+            converted.append(column)
+        table = pa.table(converted, names=table.column_names)
+        yield table.to_pandas()
+
+
+def _read_polars(path, chunksize, columns, dtypes):
+    import polars as pl
+
+    types = {'category': pl.Categorical, 'int64': pl.Int64, 'float64': pl.Float64}
+    try:
+        # Types are inferred from the first batch, like pyarrow's first block
+        frame = pl.scan_csv(
+            path,
+            schema_overrides={col: types[dtype] for col, dtype in (dtypes or {}).items()},
+            null_values=NA_VALUES,
+            infer_schema_length=BATCH_ROWS
+        )
+        if columns is not None:
+            frame = frame.select(columns)
+        schema = frame.collect_schema()
+    except pl.exceptions.ComputeError as e:
+        raise UnsupportedFile(str(e))
+
+    for name, dtype in schema.items():
+        if not (dtype.is_numeric() or dtype in (pl.Boolean, pl.String, pl.Null, pl.Categorical)):
+            raise UnsupportedFile(f"column {name} inferred as {dtype}")
+
+    def batches():
+        try:
+            yield from frame.collect_batches(chunk_size=BATCH_ROWS)
+        except pl.exceptions.ComputeError as e:
+            raise UnsupportedFile(str(e))
+
+    for df in _exact_chunks(batches(), chunksize, pl.concat, schema.to_frame):
+        casts = {}
+        for name, dtype in df.schema.items():
+            if name not in (dtypes or {}) and df[name].null_count() == len(df) and dtype in (pl.Null, pl.String):
+                # All-missing columns: pandas reads them as float, or text when empty
+                casts[name] = pl.String if len(df) == 0 else pl.Float64
+        if casts:
+            df = df.with_columns([pl.col(name).cast(dtype) for name, dtype in casts.items()])
+        yield df.to_pandas()
+
+
+def read_csv_chunks(path, reader=None, chunksize=None, columns=None, dtypes=None):
+    """Yield the parsed contents of a CSV file as DataFrame chunks.
+
+    Args:
+        path: CSV file to read.
+        reader: Settings from reader_settings(), or None for pandas.
+        chunksize: Rows per chunk; None yields the whole file at once.
+        columns: Columns to materialize, or None for all. Columns missing
+            from the file are ignored.
+        dtypes: {column: 'category' | 'int64' | 'float64'} for projected
+            columns; other columns are inferred. An 'int64' column is
+            float64 in chunks where it has missing values, as it would be
+            if inferred, rather than failing the file.
+    """
+    backend = reader['backend'] if reader else 'pandas'
+    if columns is not None:
+        header = read_header(path)
+        columns = [col for col in header if col in columns]
+        dtypes = {col: dtype for col, dtype in (dtypes or {}).items() if col in columns}
+    integers = [col for col, dtype in (dtypes or {}).items() if dtype == 'int64']
+    if integers:
+        dtypes = {col: 'float64' if col in integers else dtype for col, dtype in dtypes.items()}
+
+    done = 0  # Rows already yielded when a fast backend gives up part way
+    if backend != 'pandas':
+        read = _read_pyarrow if backend == 'pyarrow' else _read_polars
+        try:
+            for chunk in read(path, chunksize, columns, dtypes):
+                yield _narrow_integers(chunk, integers)
+                done += len(chunk)
+            return
+        except UnsupportedFile:
+            pass
+
+    for chunk in _read_pandas(path, chunksize, columns, dtypes, done):
+        yield _narrow_integers(chunk, integers)
@@ -0,0 +1,31 @@
+"""
+Defaults of the command-line options shared by the scripts.
+
+The modules these settings belong to import pandas, numpy, pyarrow or
+duckdb; keeping the values here lets generate_llm_context.py parse its
+arguments and re-render a snapshot without importing any of them. The
+owning modules import their settings from here, so they can still be
+imported from there.
+"""
+
+THEMES = ['addresses', 'buildings', 'places', 'divisions', 'transportation', 'base']
+
+# High-cardinality columns summarized with a bounded top-K sketch when
+# top-K mode is enabled; all other columns are always counted exactly
+TOPK_COLUMNS = ['address_level_2', 'address_level_3', 'primary_category']
+TOPK_CAPACITY = 1000  # Default counters kept per sketched column
+
+HLL_PRECISION = 14  # 2**14 registers, ~0.81% standard error
+
+CACHE_DIR = ".metrics_cache"
+CACHE_MODES = ['use', 'rebuild', 'off']
+
+AGGREGATE_DIR = ".metrics_aggregates"  # Partial aggregates kept for incremental rebuilds
+
+ENGINES = ['pandas', 'duckdb']
+SQL_MEMORY_LIMIT = '2GB'
+
+TREND_DIR = ".metrics_snapshots"
+POLL_SECONDS = 2.0  # Watch mode's polling period without filesystem events
+
+SUMMARY_FILE = "metrics_analysis_summary.txt"
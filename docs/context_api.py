@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Flask API serving custom LLM context documents on demand.
+
+The aggregate snapshot written by generate_llm_context.py is loaded into
+memory once at startup; requests only render from it, never reading CSVs
+or building DataFrames. Rendered documents are kept in an LRU cache bounded
+by total size, and every response carries an ETag so clients can revalidate
+with If-None-Match. The ETag is derived from the snapshot (release and
+creation time) and the parsed request, not from the rendered text, so it is
+the same in every worker and after cache evictions, and a matching request
+gets a 304 without rendering. When the snapshot was built with --cube, drill-downs
+such as the top place categories in one country are answered from its
+precomputed rollups with a dictionary lookup.
+
+    python3 generate_llm_context.py --slices --cube   # writes metrics_snapshot.json.gz
+    CONTEXT_SNAPSHOT=../metrics_snapshot.json.gz python3 context_api.py
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_document import MAX_TOP_N, detail_plan, render_within_budget
+from snapshot import SNAPSHOT_FILE, drilldown, load_snapshot, select_snapshot
+from token_budget import DETAIL_PRESETS
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for all routes
+
+# Configuration
+SNAPSHOT = os.environ.get('CONTEXT_SNAPSHOT', os.path.join('..', SNAPSHOT_FILE))
+CACHE_MAX_BYTES = int(os.environ.get('CONTEXT_CACHE_MB', '64')) * 1024 * 1024
+
+
+class RenderCache:
+    """Thread-safe LRU cache of rendered documents, bounded by total bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= len(self._entries.pop(key)['body'])
+            self._entries[key] = entry
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted['body'])
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+snapshot = None
+snapshot_lock = threading.Lock()
+cache = RenderCache(CACHE_MAX_BYTES)
+
+
+def load():
+    """Load the aggregate snapshot into memory."""
+    global snapshot
+    snapshot = load_snapshot(SNAPSHOT)
+    print(f"Loaded snapshot for release {snapshot['release']} from {SNAPSHOT}")
+
+
+@app.before_request
+def ensure_loaded():
+    """Load the snapshot on the first request when imported by a WSGI server."""
+    if snapshot is None:
+        with snapshot_lock:
+            if snapshot is None:
+                try:
+                    load()
+                except (OSError, ValueError) as e:
+                    print(f"Error loading snapshot: {e}")
+                    return jsonify({'error': 'Context snapshot unavailable'}), 503
+
+
+def parse_list(name):
+    """Comma-separated query parameter as a list, or None when absent."""
+    value = request.args.get(name, '')
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    return items or None
+
+
+def parse_int(name):
+    """Integer query parameter, or None when absent; ValueError when malformed."""
+    value = request.args.get(name)
+    return int(value) if value is not None else None
+
+
+def document_key(themes, countries, top_n, budget, detail):
+    """Cache key of a custom document, from its parsed request parameters."""
+    return (tuple(themes or ()), tuple(countries or ()), top_n, budget, detail)
+
+
+def document_etag(key):
+    """ETag of a custom document: the snapshot it is rendered from and its key.
+
+    Rendered text carries the render time, so it cannot be hashed instead.
+    """
+    identity = json.dumps([snapshot['release'], snapshot['created'], key])
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+def render(key):
+    """Render a custom document, returning its cache entry."""
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    themes, countries, top_n, budget, detail = key
+    text, _, tokens = render_within_budget(select_snapshot(snapshot, list(themes), list(countries)),
+                                           detail_plan(detail, top_n), budget)
+    entry = {'body': text.encode('utf-8'), 'tokens': tokens}
+    cache.put(key, entry)
+    return entry
+
+
+@app.route('/api/context', methods=['GET'])
+def get_context():
+    """Render a context document for the requested themes and countries."""
+    themes = parse_list('themes')
+    countries = parse_list('countries')
+    detail = request.args.get('detail', 'full')
+    try:
+        top_n = parse_int('top_n')
+        budget = parse_int('budget')
+    except ValueError:
+        return jsonify({'error': 'top_n and budget must be integers'}), 400
+
+    if detail not in DETAIL_PRESETS:
+        return jsonify({'error': f"detail must be one of {', '.join(DETAIL_PRESETS)}"}), 400
+    if top_n is not None and not 1 <= top_n <= MAX_TOP_N:
+        return jsonify({'error': f'top_n must be between 1 and {MAX_TOP_N}'}), 400
+    if budget is not None and budget <= 0:
+        return jsonify({'error': 'budget must be positive'}), 400
+    unknown = [theme for theme in themes or [] if theme not in snapshot['themes']]
+    if unknown:
+        return jsonify({'error': f"Unknown themes: {', '.join(unknown)}"}), 400
+    slices = snapshot.get('slices') or {}
+    known = {country for theme in themes or snapshot['themes'] for country in slices.get(theme, {})}
+    unknown = [country for country in countries or [] if country not in known]
+    if unknown:
+        return jsonify({'error': f"Unknown countries: {', '.join(unknown)}"}), 400
+
+    key = document_key(themes, countries, top_n, budget, detail)
+    etag = document_etag(key)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)  # The client's copy is current; skip rendering
+    else:
+        entry = render(key)
+        response = Response(entry['body'], content_type='text/plain; charset=utf-8')
+        response.headers['X-Context-Tokens'] = str(entry['tokens'])
+    # Weak: documents differ in their Generated line, not in their content
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'  # Revalidate with If-None-Match
+    response.headers['X-Release'] = snapshot['release']
+    return response
+
+
+@app.route('/api/context/drilldown', methods=['GET'])
+def get_drilldown():
+    """Top values of one column within each value, or one value, of another."""
+    theme = request.args.get('theme')
+    by = request.args.get('by')
+    of = request.args.get('of')
+    value = request.args.get('value')
+    try:
+        top_n = parse_int('top_n')
+    except ValueError:
+        return jsonify({'error': 'top_n must be an integer'}), 400
+
+    if not theme or not by or not of:
+        return jsonify({'error': 'theme, by and of are required'}), 400
+    if theme not in snapshot['themes']:
+        return jsonify({'error': f'Unknown theme: {theme}'}), 400
+    if top_n is not None and top_n < 1:
+        return jsonify({'error': 'top_n must be positive'}), 400
+
+    rollup = drilldown(snapshot, theme, by, of)
+    if rollup is None:
+        return jsonify({'error': f'No {of} by {by} drill-down for {theme}; build the snapshot with --cube'}), 404
+    if value is not None:
+        if value not in rollup:
+            return jsonify({'error': f'No {theme} features with {by} {value}'}), 404
+        rows = {value: rollup[value]}
+    else:
+        rows = dict(list(rollup.items())[:top_n]) if top_n else rollup
+        top_n = None  # top_n limits the groups listed, not their values
+
+    rows = {key: {**row, 'top_values': row['top_values'][:top_n]} for key, row in rows.items()}
+    return jsonify({'release': snapshot['release'], 'theme': theme, 'by': by, 'of': of, 'rows': rows}), 200
+
+
+@app.route('/api/context/info', methods=['GET'])
+def get_info():
+    """List the release, themes and countries that can be requested."""
+    return jsonify({
+        'release': snapshot['release'],
+        'themes': list(snapshot['themes']),
+        'countries': {theme: list(countries) for theme, countries in (snapshot.get('slices') or {}).items()},
+        'drilldowns': {theme: {by: list(rollups) for by, rollups in data['cube'].items()}
+                       for theme, data in snapshot['themes'].items() if data.get('cube')},
+        'detail_levels': list(DETAIL_PRESETS),
+        'cache': cache.stats()
+    }), 200
+
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint."""
+    return jsonify({'status': 'healthy', 'release': snapshot['release']}), 200
+
+
+if __name__ == '__main__':
+    # Load the aggregates once; requests only render from memory
+    load()
+
+    # Run the server
+    print("Starting Context API server...")
+    print("Access the API at http://localhost:5001")
+    print("Endpoints:")
+    print("  GET  /api/context?themes=&countries=&top_n=&budget=&detail= - Custom context document")
+    print("  GET  /api/context/drilldown?theme=&by=&of=&value=&top_n= - Precomputed drill-down lookup")
+    print("  GET  /api/context/info - Available themes, countries, drill-downs and cache statistics")
+    print("  GET  /api/health - Health check")
+
+    app.run(host='0.0.0.0', port=5001, threaded=True)
@@ -2,11 +2,33 @@
 """
 Simple Flask API for collecting LLM Data Explorer feedback.
 Stores feedback anonymously in a SQLite database.
+
+Connections are pooled per process and reused across requests: each
+request borrows one and returns it when the request ends. The database
+runs in WAL mode, so the dashboard's reads never wait for a submission and
+submissions only wait for each other, briefly, within the busy timeout.
+That makes it safe to serve from several worker processes:
+
+    gunicorn -w 4 -b 0.0.0.0:5000 feedback_api:app
+
+With FEEDBACK_WRITE_MODE=batch, submissions are validated and queued, and
+a background writer per process inserts them in one transaction per batch
+of up to BATCH_SIZE or BATCH_SECONDS, so a spike costs one commit per
+batch rather than one per submission. A batch the database rejects is
+retried one submission at a time, so only the offending one fails. FEEDBACK_DURABILITY=commit (the
+default) still answers each POST only once its batch is committed;
+FEEDBACK_DURABILITY=queue answers 202 as soon as it is queued, losing
+what is still queued if the process is killed. A full queue answers 503
+with Retry-After, and the queue is drained on shutdown.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 import sqlite3
+import atexit
+import queue
+import threading
+import time
 from datetime import datetime
 import os
 
@@ -14,17 +36,90 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Database configuration
-DATABASE = 'feedback.db'
+DATABASE = os.environ.get('FEEDBACK_DB', 'feedback.db')
+POOL_SIZE = 8          # Idle connections kept per process
+BUSY_TIMEOUT = 10      # Seconds a write waits for another worker's write before failing
+CACHE_SIZE_KB = 8192   # Page cache per connection
 
-def get_db_connection():
-    """Create a database connection."""
-    conn = sqlite3.connect(DATABASE)
+# Write modes: 'sync' inserts and commits in the request, 'batch' queues for the background writer
+WRITE_MODE = os.environ.get('FEEDBACK_WRITE_MODE', 'sync')
+DURABILITY = os.environ.get('FEEDBACK_DURABILITY', 'commit')  # Batch mode: answer once 'commit'ted or 'queue'd
+QUEUE_SIZE = int(os.environ.get('FEEDBACK_QUEUE_SIZE', '1000'))  # Queued submissions per process before 503s
+BATCH_SIZE = 100       # Submissions per transaction
+BATCH_SECONDS = 0.05   # Longest a submission waits for its batch to fill
+COMMIT_TIMEOUT = 30    # Seconds a POST waits for its batch in 'commit' durability
+RETRY_AFTER = 1        # Seconds clients are asked to wait when the queue is full
+
+if WRITE_MODE not in ('sync', 'batch'):
+    raise ValueError(f"FEEDBACK_WRITE_MODE must be 'sync' or 'batch', not {WRITE_MODE!r}")
+if DURABILITY not in ('commit', 'queue'):
+    raise ValueError(f"FEEDBACK_DURABILITY must be 'commit' or 'queue', not {DURABILITY!r}")
+
+INSERT_FEEDBACK = '''
+    INSERT INTO feedback
+    (satisfaction, clarity, llm_provider, questions_answered, improvements, conversation, user_agent, ip_address)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+pool = None
+pool_pid = None
+pool_lock = threading.Lock()
+
+pending = None  # Batch mode: queue of {'row', 'id', 'done'} submissions for this process's writer
+writer = None
+writer_pid = None
+writer_lock = threading.Lock()
+
+def connect():
+    """Open a database connection with the pragmas every connection uses."""
+    # Pooled connections are handed from thread to thread, but only one request uses each at a time
+    conn = sqlite3.connect(DATABASE, timeout=BUSY_TIMEOUT, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA synchronous = NORMAL')  # Safe in WAL mode; a power cut can lose only the latest commits
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
     return conn
 
+def acquire_connection():
+    """Take an idle connection from this process's pool, or open a new one."""
+    global pool, pool_pid
+    if pool_pid != os.getpid():
+        # First use in this process (or a forked worker): never share the parent's connections
+        with pool_lock:
+            if pool_pid != os.getpid():
+                init_db()
+                pool, pool_pid = queue.LifoQueue(maxsize=POOL_SIZE), os.getpid()
+    try:
+        return pool.get_nowait()
+    except queue.Empty:
+        return connect()
+
+def release_connection(conn):
+    """Return a connection to the pool, closing it when the pool is full."""
+    if conn.in_transaction:
+        conn.rollback()  # A request failed mid-write
+    try:
+        pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def get_db_connection():
+    """Database connection of the current request, returned to the pool when it ends."""
+    if 'db' not in g:
+        g.db = acquire_connection()
+    return g.db
+
+@app.teardown_appcontext
+def close_db_connection(exception):
+    """Hand the request's connection back to the pool."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        release_connection(conn)
+
 def init_db():
     """Initialize the database with the feedback table."""
-    conn = get_db_connection()
+    conn = connect()
+    conn.execute('PRAGMA journal_mode = WAL')  # Stored in the database file, so set once
     conn.execute('''
         CREATE TABLE IF NOT EXISTS feedback (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,6 +138,93 @@ def init_db():
     conn.close()
     print(f"Database initialized at {DATABASE}")
 
+def start_writer():
+    """Start this process's write-behind queue and writer thread, once."""
+    global pending, writer, writer_pid
+    with writer_lock:
+        if writer_pid != os.getpid():
+            pending = queue.Queue(maxsize=QUEUE_SIZE)
+            writer = threading.Thread(target=write_batches, args=(pending,), name='feedback-writer', daemon=True)
+            writer.start()
+            writer_pid = os.getpid()
+            atexit.register(stop_writer)
+
+def stop_writer():
+    """Drain the queue on shutdown: the writer commits what is queued, then exits."""
+    if writer is not None and writer_pid == os.getpid() and writer.is_alive():
+        pending.put(None)
+        writer.join()
+        print("Feedback queue drained")
+
+def write_batches(pending):
+    """Insert queued submissions, one transaction per batch, until the None sentinel."""
+    conn = acquire_connection()  # Kept by the writer for the life of the process
+    while True:
+        batch = [pending.get()]
+        deadline = time.monotonic() + BATCH_SECONDS
+        while batch[-1] is not None and len(batch) < BATCH_SIZE:
+            try:
+                batch.append(pending.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        items = [item for item in batch if item is not None]
+        if items:
+            commit_batch(conn, items)
+        if batch[-1] is None:
+            conn.close()
+            return
+
+def commit_batch(conn, items):
+    """Insert a batch in one transaction and wake the requests waiting for it.
+
+    When the database rejects the batch, its submissions are retried one
+    transaction each, so a row that cannot be stored fails only its own
+    request. A locked or unwritable database fails the whole batch.
+    """
+    try:
+        with conn:
+            for item in items:
+                item['id'] = conn.execute(INSERT_FEEDBACK, item['row']).lastrowid
+    except sqlite3.OperationalError as e:
+        print(f"Error writing {len(items)} queued submissions: {e}")
+        for item in items:
+            item['id'] = None
+    except sqlite3.Error as e:
+        print(f"Error writing {len(items)} queued submissions, retrying one at a time: {e}")
+        for item in items:
+            try:
+                with conn:
+                    item['id'] = conn.execute(INSERT_FEEDBACK, item['row']).lastrowid
+            except sqlite3.Error as e:
+                print(f"Error writing a queued submission: {e}")
+                item['id'] = None
+    for item in items:
+        item['done'].set()
+
+def enqueue_feedback(row):
+    """Queue a validated submission for the background writer (batch mode)."""
+    if writer_pid != os.getpid():
+        start_writer()
+    item = {'row': row, 'id': None, 'done': threading.Event()}
+    try:
+        pending.put_nowait(item)
+    except queue.Full:
+        return jsonify({'error': 'Too many submissions, please retry shortly'}), 503, {'Retry-After': str(RETRY_AFTER)}
+
+    if DURABILITY == 'queue':
+        return jsonify({
+            'success': True,
+            'message': 'Feedback queued',
+            'id': None
+        }), 202
+    if not item['done'].wait(COMMIT_TIMEOUT) or item['id'] is None:
+        return jsonify({'error': 'Internal server error'}), 500
+    return jsonify({
+        'success': True,
+        'message': 'Feedback submitted successfully',
+        'id': item['id']
+    }), 201
+
 @app.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     """Handle feedback submission."""
@@ -61,17 +243,16 @@ def submit_feedback():
         if not (1 <= int(data['clarity']) <= 5):
             return jsonify({'error': 'Clarity must be between 1 and 5'}), 400
 
+        # Text fields are stored as they are, so a row is rejected here rather than by the database
+        for field in ['llm_provider', 'questions_answered', 'improvements', 'conversation']:
+            if not isinstance(data.get(field, ''), str):
+                return jsonify({'error': f'{field} must be text'}), 400
+
         # Get optional metadata
         user_agent = request.headers.get('User-Agent', '')
         ip_address = request.remote_addr
 
-        # Insert into database
-        conn = get_db_connection()
-        cursor = conn.execute('''
-            INSERT INTO feedback
-            (satisfaction, clarity, llm_provider, questions_answered, improvements, conversation, user_agent, ip_address)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        row = (
             data['satisfaction'],
             data['clarity'],
             data['llm_provider'],
@@ -80,10 +261,15 @@ def submit_feedback():
             data.get('conversation', ''),
             user_agent,
             ip_address
-        ))
+        )
+        if WRITE_MODE == 'batch':
+            return enqueue_feedback(row)
+
+        # Insert into database
+        conn = get_db_connection()
+        cursor = conn.execute(INSERT_FEEDBACK, row)
         conn.commit()
         feedback_id = cursor.lastrowid
-        conn.close()
 
         return jsonify({
             'success': True,
@@ -101,7 +287,6 @@ def get_feedback():
     try:
         conn = get_db_connection()
         feedback = conn.execute('SELECT * FROM feedback ORDER BY timestamp DESC').fetchall()
-        conn.close()
 
         # Convert to list of dicts
         feedback_list = [dict(row) for row in feedback]
@@ -148,8 +333,6 @@ def get_stats():
             GROUP BY questions_answered
         ''').fetchall()
 
-        conn.close()
-
         return jsonify({
             'success': True,
             'total_responses': total,
@@ -166,14 +349,19 @@ def get_stats():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()}), 200
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'write_mode': WRITE_MODE,
+        'queued': pending.qsize() if pending is not None and writer_pid == os.getpid() else 0
+    }), 200
 
 if __name__ == '__main__':
     # Initialize database on startup
     init_db()
 
     # Run the server
-    print("Starting Feedback API server...")
+    print(f"Starting Feedback API server ({WRITE_MODE} writes)...")
     print("Access the API at http://localhost:5000")
     print("Endpoints:")
     print("  POST /api/feedback - Submit feedback")
@@ -7,510 +7,346 @@ This script:
 3. Generates a comprehensive, LLM-ready text file
 """
 
-import pandas as pd
-import glob
+import argparse
 import os
-from datetime import datetime
-from pathlib import Path
 
-# Configuration
-METRICS_BASE = "Metrics/metrics"
-OUTPUT_FILE = "README_generation_output.txt"
-
-# Schema definitions (could be externalized to a config file)
-COLUMN_DEFINITIONS = {
-    'datasets': {
-        'definition': 'The original source(s) of the feature data',
-        'type': 'String (comma-separated for multiple sources)',
-        'notes': 'Common values include OpenStreetMap, Microsoft ML Buildings, Google Open Buildings, Meta, ESA WorldCover, and others'
-    },
-    'change_type': {
-        'definition': "Feature's status compared to the previous Overture release",
-        'type': 'Enumerated string',
-        'values': {
-            'unchanged': 'Feature exists in both releases with identical data (ALL attributes are exactly the same)',
-            'data_changed': 'Feature exists in both but has modified attributes (e.g., coordinates, names, categories, confidence scores, or ANY other attribute changed)',
-            'added': 'New feature in this release',
-            'removed': 'Feature existed in previous release but not current'
-        },
-        'notes': 'Low unchanged counts mean many features had attribute updates between releases. This is normal for dynamic data. DO NOT assume low unchanged values are related to operating hours or other temporal data not present in this dataset.'
-    },
-    'country': {
-        'definition': 'ISO 3166-1 Alpha-2 country code',
-        'type': '2-character string',
-        'examples': 'US, BR, IN, CN, GB',
-        'usage': 'Identifies the country where the feature is located'
-    },
-    'address_level_1': {
-        'definition': 'First-level administrative division (state/province)',
-        'type': 'String',
-        'examples': 'California, Oaxaca, Ontario, Queensland',
-        'notes': 'Meaning varies by country (US: state, Canada: province, etc.)'
-    },
-    'address_level_2': {
-        'definition': 'Second-level administrative division (county/municipality)',
-        'type': 'String',
-        'examples': 'Los Angeles County, Santa Cruz Amilpas',
-        'notes': 'May represent city, county, or district depending on country'
-    },
-    'address_level_3': {
-        'definition': 'Third-level administrative division (neighborhood/district)',
-        'type': 'String',
-        'notes': 'Optional; not all countries use three address levels'
-    },
-    'subtype': {
-        'definition': 'Broad category of the feature (meaning varies by theme)',
-        'type': 'Enumerated string',
-        'notes': 'Buildings: use type (residential, commercial, etc.); Transportation: pathway type (road, rail, water); Base: feature category; Divisions: administrative level'
-    },
-    'class': {
-        'definition': 'More specific classification within the subtype',
-        'type': 'Enumerated string',
-        'notes': 'Provides finer granularity than subtype'
-    },
-    'subclass': {
-        'definition': 'Optional refinement of class (primarily in Transportation)',
-        'type': 'Enumerated string',
-        'examples': 'driveway, parking_aisle, sidewalk, link, crosswalk, alley'
-    },
-    'place_countries': {
-        'definition': 'ISO 3166-1 Alpha-2 code for the country where place is located',
-        'type': '2-character string',
-        'usage': 'Identifies place location in Places theme'
-    },
-    'primary_category': {
-        'definition': "Main category describing the place's purpose or service",
-        'type': 'String',
-        'notes': 'Over 2,000 unique categories exist in Places theme'
-    },
-    'confidence': {
-        'definition': 'Numerical score indicating certainty of place existence',
-        'type': 'Float (0.0 to 1.0)',
-        'interpretation': '1.0 = verified/confirmed; 0.5-0.8 = moderate confidence; 0.0 = permanently closed or does not exist',
-        'notes': 'This score ONLY indicates whether a place exists or is closed. It does NOT represent operating hours, business hours, opening times, or any temporal availability. The data contains NO information about when places are open or closed during the day.'
-    }
-}
-
-THEME_DESCRIPTIONS = {
-    'addresses': {
-        'title': 'ADDRESSES',
-        'description': 'Address points with hierarchical administrative levels',
-        'feature_count_label': 'addresses',
-        'key_points': [
-            'Simplified, worldwide address schema based primarily on OpenAddresses',
-            'Includes hierarchical administrative levels (address_level_1, 2, 3)',
-            'Coverage varies significantly by country'
-        ]
-    },
-    'buildings': {
-        'title': 'BUILDINGS',
-        'description': 'Building footprints categorized by use and construction details',
-        'feature_count_label': 'buildings',
-        'key_points': [
-            'Categorized by use (residential, commercial, industrial, etc.)',
-            'Sources: Google Open Buildings, Microsoft ML Buildings, OpenStreetMap',
-            'Includes detailed attributes: height, floors, construction details'
-        ]
-    },
-    'places': {
-        'title': 'PLACES',
-        'description': 'Points of interest including businesses, landmarks, and amenities',
-        'feature_count_label': 'places',
-        'key_points': [
-            'Businesses, landmarks, amenities, and services worldwide',
-            'Confidence scores indicate data quality (0.0 to 1.0)',
-            'Primary sources: Meta, Microsoft',
-            'Over 2,000 unique place categories'
-        ]
-    },
-    'divisions': {
-        'title': 'DIVISIONS',
-        'description': 'Administrative boundaries and divisions',
-        'feature_count_label': 'divisions',
-        'key_points': [
-            'Nine administrative levels: country → dependency → region → county → localadmin → locality → macrohood → neighborhood → microhood',
-            'Translated into 40+ languages',
-            'Includes population data and administrative hierarchies'
-        ]
-    },
-    'transportation': {
-        'title': 'TRANSPORTATION',
-        'description': 'Transportation network including roads, rails, and waterways',
-        'feature_count_label': 'features',
-        'key_points': [
-            'Includes segments (pathways) and connectors (intersections)',
-            'Detailed routing attributes: speed limits, access restrictions, surface types',
-            'Primarily road data with some rail and water routes'
-        ]
-    },
-    'base': {
-        'title': 'BASE',
-        'description': 'Contextual features including land, water, and infrastructure',
-        'feature_count_label': 'features',
-        'key_points': [
-            'Six feature types: land, water, land_cover, land_use, infrastructure, bathymetry',
-            'Includes natural features (forests, streams) and infrastructure (bridges, power lines)',
-            'Land cover data from ESA WorldCover 2020 (10m resolution)'
-        ]
-    }
-}
-
-
-def get_latest_release():
-    """Find the most recent release directory"""
-    releases = glob.glob(f"{METRICS_BASE}/*/")
-    if not releases:
-        raise FileNotFoundError(f"No releases found in {METRICS_BASE}")
-
-    # Extract release dates and sort
-    release_dates = []
-    for r in releases:
-        release_name = os.path.basename(r.rstrip('/'))
-        release_dates.append(release_name)
-
-    release_dates.sort(reverse=True)
-    return release_dates[0]
-
-
-def analyze_theme_data(theme, release):
-    """Analyze all CSV files for a given theme"""
-    pattern = f"{METRICS_BASE}/{release}/row_counts/theme={theme}/**/*.csv"
-    files = glob.glob(pattern, recursive=True)
-
-    if not files:
-        return None
-
-    # Concatenate all CSV files
-    dfs = []
-    for file in files:
-        try:
-            df = pd.read_csv(file, on_bad_lines='skip')
-            dfs.append(df)
-        except Exception as e:
-            print(f"Warning: Error reading {file}: {e}")
-            continue
-
-    if not dfs:
-        return None
-
-    combined_df = pd.concat(dfs, ignore_index=True)
-
-    # Determine count column
-    count_col = 'total_count' if 'total_count' in combined_df.columns else 'id_count'
-    if count_col not in combined_df.columns:
-        count_col = None
-
-    result = {
-        'total_records': len(combined_df),
-        'total_features': combined_df[count_col].sum() if count_col else 0,
-        'columns': {}
-    }
-
-    # Analyze each column
-    for col in combined_df.columns:
-        if col in ['total_count', 'id_count', 'geometry_count', 'bbox_count', 'version_count',
-                   'sources_count', 'average_geometry_length_km', 'total_geometry_length_km',
-                   'average_geometry_area_km2', 'total_geometry_area_km2']:
-            continue  # Skip metric columns
-
-        if combined_df[col].dtype == 'object' or combined_df[col].dtype.name == 'category':
-            # Aggregate by column value
-            if count_col:
-                value_counts = combined_df.groupby(col)[count_col].sum().sort_values(ascending=False)
-            else:
-                value_counts = combined_df[col].value_counts()
-
-            total = value_counts.sum()
-
-            result['columns'][col] = {
-                'unique_count': len(value_counts),
-                'top_values': []
-            }
-
-            for value, count in value_counts.head(15).items():
-                percentage = (count / total * 100) if total > 0 else 0
-                result['columns'][col]['top_values'].append({
-                    'value': str(value),
-                    'count': int(count),
-                    'percentage': percentage
-                })
-
-    return result
-
-
-def load_changelog_stats(release):
-    """Load changelog statistics"""
-    pattern = f"{METRICS_BASE}/{release}/changelog_stats/*.csv"
-    files = glob.glob(pattern)
-
-    if not files:
-        return None
-
-    try:
-        df = pd.read_csv(files[0], sep='\t')
-        return df
-    except:
-        return None
+from artifacts import ARTIFACT_DIR
+from context_document import MAX_TOP_N, SLICE_DIR, render_snapshot
+from csv_readers import READER_BACKENDS, reader_settings
+from defaults import (AGGREGATE_DIR, CACHE_DIR, CACHE_MODES, ENGINES, HLL_PRECISION, POLL_SECONDS, SQL_MEMORY_LIMIT,
+                      SUMMARY_FILE, THEMES, TOPK_CAPACITY, TOPK_COLUMNS, TREND_DIR)
+from token_budget import DETAIL_PRESETS
+from instrumentation import PROFILERS, finish_report, new_report, print_report, profiled, stage, write_report
+from snapshot import SNAPSHOT_FILE, build_snapshot, load_snapshot, save_snapshot, source_fingerprints
 
+# The scan's modules (pandas, numpy, pyarrow, duckdb, watchdog) are imported
+# by the code paths that aggregate, so re-rendering a snapshot needs none
 
-def format_large_number(num):
-    """Format large numbers with proper suffixes"""
-    if num >= 1_000_000_000:
-        return f"{num/1_000_000_000:.2f}B"
-    elif num >= 1_000_000:
-        return f"{num/1_000_000:.2f}M"
-    elif num >= 1_000:
-        return f"{num/1_000:.2f}K"
-    else:
-        return str(num)
-
-
-def generate_document():
-    """Main function to generate the LLM context document"""
+# Configuration
+SHARD_FILE = "shard-{shard}-of-{shards}.json.gz"
+
+
+def generate_document(workers=1, topk=None, hll=None, cache=None, store=None, release=None,
+                      summary_file=None, reader=None, engine='pandas', memory_limit=SQL_MEMORY_LIMIT,
+                      partitions=None, merge=None, report=None, detail='full', token_budget=None,
+                      snapshot_file=SNAPSHOT_FILE, slice_dir=None, artifact_dir=None, trend=None,
+                      trend_dir=TREND_DIR, cube=False, top_n=None):
+    """Main function to generate the LLM context document
+
+    The aggregates are written to `snapshot_file` first and the document is
+    rendered from that snapshot alone, so render_snapshot() can later
+    re-render it without touching the CSVs.
+
+    Args:
+        workers: Number of processes used to aggregate CSV partitions.
+            1 runs everything in the current process.
+        topk: Counter capacity for the top-K sketch of TOPK_COLUMNS, or
+            None to count every column exactly.
+        hll: HyperLogLog precision for approximate unique counts of columns
+            above their SKETCH_THRESHOLDS, or None to keep them exact.
+        cache: Parsed-CSV cache settings from metrics_cache.cache_settings(),
+            or None to always parse the CSVs.
+        store: Directory of persisted partial aggregates for incremental
+            rebuilds, or None to aggregate every partition.
+        release: Release to document; defaults to the latest one.
+        summary_file: Also write the analyze_metrics.py summary here, from
+            the same scan.
+        reader: CSV reader settings from csv_readers.reader_settings(), or
+            None for the fastest installed backend.
+        engine: 'pandas' parses partitions into DataFrames; 'duckdb' pushes
+            the aggregation down to DuckDB, which spills to disk past
+            `memory_limit` and ignores `cache` and `reader`.
+        partitions: Only document partitions whose hive-style keys match,
+            e.g. {'type': 'segment'}.
+        merge: Shard files written by generate_shard(). When given, the
+            document is rendered from their merged partials instead of
+            scanning the CSVs.
+        report: Run report from instrumentation.new_report() that records
+            each stage's wall time, CPU time, rows, bytes and peak memory.
+        detail: Detail level from token_budget.DETAIL_PRESETS ('compact',
+            'standard' or 'full').
+        token_budget: Maximum tokens for the document. Starting from
+            `detail`, the lowest-information content is dropped until the
+            document fits.
+        snapshot_file: Where to write the aggregate snapshot.
+        slice_dir: Also write per-theme and per-country context slices and
+            their index here (see write_slices()). Country slices need a
+            second, pandas-based pass over the sliced themes.
+        artifact_dir: Also publish the document (and slices) here under
+            content-hashed names with gzip/brotli variants and a manifest;
+            see artifacts.py.
+        trend: Also aggregate this many releases up to and including the
+            documented one, and add per-theme trend sections. Releases
+            already aggregated with the same settings are reused from
+            `trend_dir`; the others are scanned in parallel.
+        cube: Also build the drill-down cube of CUBE_DIMENSIONS in the same
+            scan; it is kept in the snapshot for drill-down lookups and
+            rendered in the 'drilldowns' section. With `merge`, the shards
+            decide.
+        top_n: Top values shown per column instead of the detail level's.
+    """
+
+    if detail not in DETAIL_PRESETS:
+        raise ValueError(f"Unknown detail level '{detail}', expected one of {list(DETAIL_PRESETS)}")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+    if engine == 'duckdb' and store is not None:
+        raise ValueError("Incremental rebuilds need the pandas engine")
+    if merge and (slice_dir or trend):
+        raise ValueError("Country slices and trends are aggregated from the CSVs and cannot be built from shards")
+
+    from metrics_aggregation import (analyze_slices, analyze_themes, get_latest_release, load_changelog_stats,
+                                     merge_shards)
 
     print("=" * 80)
     print("GENERATING LLM CONTEXT DOCUMENT")
     print("=" * 80)
 
-    # Find latest release
-    latest_release = get_latest_release()
-    print(f"\nUsing release: {latest_release}")
-
-    # Analyze all themes
-    print("\nAnalyzing themes...")
-    themes_data = {}
-    for theme in ['addresses', 'buildings', 'places', 'divisions', 'transportation', 'base']:
+    if merge:
+        # Merge partials aggregated on other machines
+        from partial_store import load_shard
+        with stage(report, 'merge_shards', shards=len(merge)) as entry:
+            shards = [load_shard(path) for path in merge]
+            entry['bytes'] = sum(os.path.getsize(path) for path in merge)
+            latest_release, results = merge_shards(shards)
+        if release and release != latest_release:
+            raise ValueError(f"Shards are for release {latest_release}, not {release}")
+        settings = {'engine': 'pandas', **shards[0]['settings'], 'shards': len(shards)}
+        sources = None
+        print(f"\nUsing release: {latest_release}")
+        print(f"\nMerging {len(shards)} shards...")
+    else:
+        with stage(report, 'release_discovery'):
+            latest_release = release or get_latest_release()
+        settings = {'engine': engine, 'topk': topk, 'hll': hll, 'cube': cube, 'partitions': partitions or {}}
+        # Taken before the scan, so partitions changing during it leave the snapshot stale
+        sources = source_fingerprints(latest_release, partitions)
+        print(f"\nUsing release: {latest_release}")
+        if engine == 'duckdb':
+            from sql_engine import analyze_themes_sql
+            print(f"\nAnalyzing themes with DuckDB (memory limit {memory_limit})...")
+            results = analyze_themes_sql(THEMES, latest_release, topk, hll, memory_limit,
+                                         threads=workers if workers > 1 else None, partitions=partitions,
+                                         report=report, cube=cube)
+        else:
+            if workers > 1:
+                print(f"\nAnalyzing themes with {workers} worker processes...")
+            else:
+                print("\nAnalyzing themes...")
+            results = analyze_themes(THEMES, latest_release, workers, topk, hll, cache, store, reader,
+                                     partitions, report, cube)
+    if report is not None:
+        report['release'] = latest_release
+    for theme in results:
         print(f"  - {theme}...")
-        data = analyze_theme_data(theme, latest_release)
-        if data:
-            themes_data[theme] = data
 
     # Load changelog
     print("\nLoading changelog statistics...")
-    changelog = load_changelog_stats(latest_release)
-
-    # Generate document
-    print(f"\nGenerating {OUTPUT_FILE}...")
-
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        # Header
-        f.write("=" * 80 + "\n")
-        f.write("OVERTURE MAPS DATA - LLM EXPLORATION GUIDE\n")
-        f.write("=" * 80 + "\n")
-        f.write(f"Release Version: {latest_release}\n")
-        f.write("Document Purpose: Enable natural language querying of Overture Maps data\n")
-        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-
-        # Instructions
-        f.write("<<<INSTRUCTIONS_START>>>\n\n")
-        f.write("## YOUR ROLE\n")
-        f.write("You are a data analyst assistant helping users understand and explore Overture Maps\n")
-        f.write("data. This document contains comprehensive statistics, schema definitions, and\n")
-        f.write("context about the Overture Maps Foundation's open geospatial datasets.\n\n")
-
-        f.write("## HOW TO USE THIS DOCUMENT\n")
-        f.write("- Answer user questions about data distributions, coverage, and characteristics\n")
-        f.write("- Provide specific numbers, percentages, and comparisons when available\n")
-        f.write("- Reference the schema definitions to explain data structure\n")
-        f.write("- Use the statistics sections to support your analysis\n")
-        f.write("- Be precise and cite specific metrics from this document\n\n")
-
-        f.write("## KEY CONSTRAINTS\n")
-        f.write(f"- Data is from release {latest_release} only\n")
-        f.write("- All statistics represent aggregated counts across multiple data sources\n")
-        f.write("- Some themes may have data quality variations by geographic region\n")
-        f.write("- Confidence scores in Places theme range from 0.0 (closed/doesn't exist) to 1.0 (verified)\n\n")
-
-        f.write("## CRITICAL: DO NOT MAKE ASSUMPTIONS\n")
-        f.write("- ONLY use information explicitly provided in this document\n")
-        f.write("- DO NOT infer or assume attributes not mentioned in the schema definitions\n")
-        f.write("- DO NOT guess about data that might exist (e.g., operating hours, phone numbers, emails)\n")
-        f.write("- If a user asks about data not covered in this document, clearly state it is not available\n")
-        f.write("- When uncertain, say 'This information is not provided in the available data'\n")
-        f.write("- Example: This data does NOT include operating hours, contact information, or real-time status\n\n")
-
-        f.write("<<<INSTRUCTIONS_END>>>\n\n\n")
-
-        # Overview
-        f.write("=" * 80 + "\n")
-        f.write("## OVERTURE MAPS FOUNDATION OVERVIEW\n")
-        f.write("=" * 80 + "\n\n")
-
-        f.write("Overture Maps Foundation is an open data initiative that provides free,\n")
-        f.write("interoperable geospatial datasets for mapping applications worldwide. The data\n")
-        f.write("is released as GeoParquet files with a JSON schema definition, using GeoJSON\n")
-        f.write("as the canonical geospatial format.\n\n")
-
-        f.write("### THE SIX DATA THEMES\n\n")
-
-        for theme, info in THEME_DESCRIPTIONS.items():
-            if theme in themes_data:
-                data = themes_data[theme]
-                f.write(f"**{info['title']}**\n")
-                f.write(f"   - {format_large_number(data['total_features'])} {info['feature_count_label']}\n")
-                f.write(f"   - {info['description']}\n")
-                for point in info['key_points']:
-                    f.write(f"   - {point}\n")
-                f.write("\n")
-
-        # Schema Reference
-        f.write("\n" + "=" * 80 + "\n")
-        f.write("<<<SCHEMA_START>>>\n")
-        f.write("## SCHEMA REFERENCE - GROUPING COLUMNS\n")
-        f.write("=" * 80 + "\n\n")
-
-        f.write("This section defines the key columns used to categorize and group data across\n")
-        f.write("all themes. Understanding these columns is essential for querying the data.\n\n")
-
-        # Universal columns
-        f.write("---\n### UNIVERSAL COLUMNS (All Themes)\n---\n\n")
-        for col in ['datasets', 'change_type']:
-            if col in COLUMN_DEFINITIONS:
-                defn = COLUMN_DEFINITIONS[col]
-                f.write(f"**{col}**\n")
-                f.write(f"Definition: {defn['definition']}\n")
-                f.write(f"Type: {defn['type']}\n")
-                if 'values' in defn:
-                    f.write("Possible Values:\n")
-                    for val, desc in defn['values'].items():
-                        f.write(f"  - {val}: {desc}\n")
-                if 'notes' in defn:
-                    f.write(f"Notes: {defn['notes']}\n")
-                f.write("\n")
-
-        # Theme-specific columns
-        theme_columns = {
-            'ADDRESSES THEME': ['country', 'address_level_1', 'address_level_2', 'address_level_3'],
-            'BUILDINGS THEME': ['subtype', 'class'],
-            'PLACES THEME': ['place_countries', 'primary_category', 'confidence'],
-            'DIVISIONS THEME': ['subtype', 'class', 'country'],
-            'TRANSPORTATION THEME': ['subtype', 'class', 'subclass'],
-            'BASE THEME': ['subtype', 'class']
-        }
-
-        for section, columns in theme_columns.items():
-            f.write(f"---\n### {section} COLUMNS\n---\n\n")
-            for col in columns:
-                if col in COLUMN_DEFINITIONS:
-                    defn = COLUMN_DEFINITIONS[col]
-                    f.write(f"**{col}**\n")
-                    f.write(f"Definition: {defn['definition']}\n")
-                    f.write(f"Type: {defn['type']}\n")
-                    if 'examples' in defn:
-                        f.write(f"Examples: {defn['examples']}\n")
-                    if 'usage' in defn:
-                        f.write(f"Usage: {defn['usage']}\n")
-                    if 'interpretation' in defn:
-                        f.write(f"Interpretation: {defn['interpretation']}\n")
-                    if 'notes' in defn:
-                        f.write(f"Notes: {defn['notes']}\n")
-                    f.write("\n")
-
-        f.write("<<<SCHEMA_END>>>\n\n\n")
-
-        # Theme Statistics
-        for theme, data in themes_data.items():
-            info = THEME_DESCRIPTIONS[theme]
-
-            f.write("=" * 80 + "\n")
-            f.write(f"## THEME STATISTICS: {info['title']}\n")
-            f.write("=" * 80 + "\n\n")
-
-            f.write(f"**Total Features**: {data['total_features']:,} {info['feature_count_label']}\n\n")
-
-            # Changelog info if available
-            if changelog is not None:
-                theme_changelog = changelog[changelog['theme'] == theme]
-                if not theme_changelog.empty:
-                    f.write("**Release Comparison** (vs. baseline):\n")
-                    for _, row in theme_changelog.iterrows():
-                        f.write(f"  Type: {row['type']}\n")
-                        f.write(f"  - Total Change: {row['total_diff_perc']:.2f}%\n")
-                        f.write(f"  - Added: {int(row['added']):,} ({row['added_perc']:.2f}%)\n")
-                        f.write(f"  - Removed: {int(row['removed']):,} ({row['removed_perc']:.2f}%)\n")
-                        f.write(f"  - Data Changed: {int(row['data_changed']):,} ({row['data_changed_perc']:.2f}%)\n")
-                        f.write(f"  - Unchanged: {int(row['unchanged']):,} ({row['unchanged_perc']:.2f}%)\n")
-                    f.write("\n")
-
-            # Column statistics
-            for col, col_data in data['columns'].items():
-                if col in ['change_type', 'datasets', 'subtype', 'class', 'subclass',
-                           'country', 'place_countries', 'primary_category', 'confidence',
-                           'address_level_1', 'address_level_2']:
-
-                    f.write(f"**{col.replace('_', ' ').title()}**:\n")
-                    f.write(f"  Unique Values: {col_data['unique_count']}\n")
-
-                    if col_data['top_values']:
-                        f.write(f"  Top Values:\n")
-                        for item in col_data['top_values'][:10]:
-                            f.write(f"    {item['value']}: {item['count']:,} ({item['percentage']:.2f}%)\n")
-                    f.write("\n")
-
-            f.write("\n")
-
-        # Suggested Prompts
-        f.write("=" * 80 + "\n")
-        f.write("<<<PROMPTS_START>>>\n")
-        f.write("## SUGGESTED EXPLORATION PROMPTS\n")
-        f.write("=" * 80 + "\n\n")
-
-        f.write("Use these prompts to begin exploring the Overture Maps data. Each prompt is\n")
-        f.write("designed to leverage the statistics and schema information in this document.\n\n")
-
-        prompts = [
-            ("Geographic Distribution", [
-                "Which countries have the highest concentration of Places data? Show me the top 10 countries and their percentages.",
-                "Compare the distribution of Divisions data across China, India, and the United States.",
-                "What percentage of global building data comes from each data source?"
-            ]),
-            ("Data Quality & Confidence", [
-                "What proportion of Places have high confidence scores (0.8 or above)?",
-                "In the Buildings theme, how much data changed between releases?",
-                "Which themes had no changes in this release?"
-            ]),
-            ("Category Analysis", [
-                "What are the top 10 most common building types globally?",
-                "For the Places theme, list the top 15 primary categories.",
-                "In Transportation, what's the breakdown between road, rail, and water segments?"
-            ]),
-            ("Comparative Insights", [
-                "Compare the data source distribution across all six themes.",
-                "Which theme has the most diverse categorical values?",
-                "What are the most common road classes in the Transportation theme?"
-            ])
-        ]
-
-        for category, prompt_list in prompts:
-            f.write(f"### {category}\n\n")
-            for i, prompt in enumerate(prompt_list, 1):
-                f.write(f"{i}. \"{prompt}\"\n\n")
-
-        f.write("<<<PROMPTS_END>>>\n\n\n")
-
-        # Additional Resources
-        f.write("=" * 80 + "\n")
-        f.write("## ADDITIONAL RESOURCES\n")
-        f.write("=" * 80 + "\n\n")
-
-        f.write("**Official Documentation**:\n")
-        f.write("  - Overture Maps Documentation: https://docs.overturemaps.org/\n")
-        f.write("  - Schema Reference: https://docs.overturemaps.org/schema/reference/\n")
-        f.write("  - Data Guides: https://docs.overturemaps.org/guides/\n\n")
-
-        f.write("**Data Sources**:\n")
-        f.write("  - OpenStreetMap: https://www.openstreetmap.org/\n")
-        f.write("  - ESA WorldCover: https://worldcover.esa.int/\n")
-        f.write("  - Overture GitHub: https://github.com/OvertureMaps/data\n\n")
-
-        f.write("=" * 80 + "\n")
-        f.write("END OF DOCUMENT\n")
-        f.write("=" * 80 + "\n")
-
-    print(f"\n✓ Document generated successfully: {OUTPUT_FILE}")
-    print(f"  File size: {os.path.getsize(OUTPUT_FILE) / 1024:.1f} KB")
-    print("\nYou can now load this file into an LLM for natural language querying!")
+    with stage(report, 'changelog'):
+        changelog = shards[0]['changelog'] if merge else load_changelog_stats(latest_release)
+
+    slices = None
+    if slice_dir:
+        print("\nAnalyzing themes per country...")
+        with stage(report, 'slices'):
+            slices = analyze_slices(THEMES, latest_release, workers, topk, hll, cache, reader, partitions)
+
+    trend_data = None
+    if trend and trend > 1:
+        from trends import build_trend, release_snapshots, select_releases, store_snapshot, trend_settings
+        releases = select_releases(latest_release, trend)
+        print(f"\nAggregating {len(releases) - 1} earlier releases for trends...")
+        with stage(report, 'trend', releases=len(releases)):
+            current = build_snapshot(latest_release, results, changelog,
+                                     trend_settings(latest_release, THEMES, topk, hll, partitions))
+            store_snapshot(current, trend_dir)
+            earlier = release_snapshots(releases[:-1], THEMES, workers, topk, hll, cache, reader, partitions,
+                                        trend_dir)
+            trend_data = build_trend([*earlier.values(), current])
+
+    with stage(report, 'snapshot') as entry:
+        snapshot = build_snapshot(latest_release, results, changelog, settings, slices, trend_data, sources)
+        save_snapshot(snapshot, snapshot_file)
+        entry['bytes_written'] = os.path.getsize(snapshot_file)
+    print(f"\n✓ Aggregate snapshot written: {snapshot_file}")
+
+    render_snapshot(snapshot, detail, token_budget, summary_file, report, slice_dir, artifact_dir, top_n)
+
+
+def generate_shard(shard, shards, output_file=None, workers=1, topk=None, hll=None, cache=None, release=None,
+                   reader=None, partitions=None, cube=False):
+    """Aggregate one shard (0-based) of a release and write it for a later merge.
+
+    Every shard must use the same release and settings; generate_document(
+    merge=...) then renders the same document as a single-machine run.
+    """
+    from metrics_aggregation import aggregate_shard, get_latest_release
+    from partial_store import save_shard
+
+    release = release or get_latest_release()
+    output_file = output_file or SHARD_FILE.format(shard=shard + 1, shards=shards)
+    print(f"Aggregating shard {shard + 1}/{shards} of release {release}...")
+
+    data = aggregate_shard(THEMES, release, shard, shards, workers, topk, hll, cache, reader, partitions, cube)
+    save_shard(data, output_file)
+    print(f"✓ Shard written: {output_file} ({len(data['partials'])} partitions)")
+
+
+def watch_document(workers=1, topk=None, hll=None, cache=None, release=None, summary_file=None, reader=None,
+                   partitions=None, detail='full', token_budget=None, snapshot_file=SNAPSHOT_FILE, slice_dir=None,
+                   artifact_dir=None, cube=False, interval=POLL_SECONDS, top_n=None):
+    """Keep the document up to date while new partitions and releases land.
+
+    Partition aggregates stay in memory between rebuilds (see watch.py);
+    each rebuild writes the snapshot and re-renders the document, plus the
+    summary, theme slices and artifacts when requested, replacing each file
+    atomically. Arguments are as for generate_document(); `interval` is the
+    polling period when no filesystem event arrives first.
+    """
+    from metrics_aggregation import load_changelog_stats
+    from watch import watch_partitions
+
+    if detail not in DETAIL_PRESETS:
+        raise ValueError(f"Unknown detail level '{detail}', expected one of {list(DETAIL_PRESETS)}")
+    settings = {'engine': 'pandas', 'topk': topk, 'hll': hll, 'cube': cube, 'partitions': partitions or {}}
+
+    def rebuild(release, results, changes):
+        # Taken after the scan; a partition changed since is picked up by the next rebuild
+        sources = source_fingerprints(release, partitions)
+        snapshot = build_snapshot(release, results, load_changelog_stats(release), settings, sources=sources)
+        save_snapshot(snapshot, snapshot_file)
+        render_snapshot(snapshot, detail, token_budget, summary_file, None, slice_dir, artifact_dir, top_n)
+
+    watch_partitions(rebuild, release, THEMES, workers, topk, hll, cache, reader, partitions, cube, interval)
 
 
 if __name__ == "__main__":
-    generate_document()
+    parser = argparse.ArgumentParser(description="Generate the LLM context document from Overture Metrics")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used to aggregate themes and partitions (0 = all CPUs)")
+    parser.add_argument('--top-k', type=int, nargs='?', const=TOPK_CAPACITY, default=None, metavar='CAPACITY',
+                        help=f"Summarize {', '.join(TOPK_COLUMNS)} with a bounded top-K sketch "
+                             f"(default capacity {TOPK_CAPACITY})")
+    parser.add_argument('--hll', type=int, nargs='?', const=HLL_PRECISION, default=None, metavar='PRECISION',
+                        help="Estimate unique counts with HyperLogLog for columns above their sketch "
+                             f"threshold (default precision {HLL_PRECISION})")
+    parser.add_argument('--cube', action='store_true',
+                        help="Also build drill-down rollups (e.g. primary category by country) in the same scan")
+    parser.add_argument('--cache', choices=CACHE_MODES, default='use',
+                        help="Columnar cache of parsed CSVs: use it, rebuild every entry, or bypass it")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help=f"Cache location (default {CACHE_DIR})")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Reuse stored per-partition aggregates and only re-aggregate changed partitions")
+    parser.add_argument('--store-dir', default=AGGREGATE_DIR,
+                        help=f"Where --incremental keeps partial aggregates (default {AGGREGATE_DIR})")
+    parser.add_argument('--release', help="Release to document (default: latest)")
+    parser.add_argument('--summary', nargs='?', const=SUMMARY_FILE, default=None, metavar='FILE',
+                        help=f"Also write the analyze_metrics.py summary from the same scan (default {SUMMARY_FILE})")
+    parser.add_argument('--engine', choices=ENGINES, default='pandas',
+                        help="Aggregate in pandas, or push the aggregation down to DuckDB for trees larger than RAM")
+    parser.add_argument('--memory-limit', default=SQL_MEMORY_LIMIT,
+                        help=f"DuckDB memory limit before spilling to disk (default {SQL_MEMORY_LIMIT})")
+    parser.add_argument('--partition', action='append', default=[], metavar='KEY=VALUE',
+                        help="Only include partitions with this hive-style key, e.g. type=segment (repeatable)")
+    parser.add_argument('--shard', metavar='I/N',
+                        help="Only aggregate shard I of N (1-based) and write it to --shard-out instead of rendering")
+    parser.add_argument('--shard-out', metavar='FILE',
+                        help="Where --shard writes its partials (default shard-I-of-N.json.gz)")
+    parser.add_argument('--merge', nargs='+', metavar='SHARD',
+                        help="Render the document from shard files written with --shard")
+    parser.add_argument('--snapshot', default=SNAPSHOT_FILE, metavar='FILE',
+                        help=f"Where to write the aggregate snapshot (default {SNAPSHOT_FILE})")
+    parser.add_argument('--from-snapshot', metavar='FILE',
+                        help="Re-render the document from a snapshot without reading the Metrics CSVs")
+    parser.add_argument('--slices', nargs='?', const=SLICE_DIR, default=None, metavar='DIR',
+                        help=f"Also write per-theme and per-country context slices with an index (default {SLICE_DIR})")
+    parser.add_argument('--artifacts', nargs='?', const=ARTIFACT_DIR, default=None, metavar='DIR',
+                        help="Also publish content-hashed, gzip/brotli-compressed copies and a manifest "
+                             f"(default {ARTIFACT_DIR})")
+    parser.add_argument('--watch', type=float, nargs='?', const=POLL_SECONDS, default=None, metavar='SECONDS',
+                        help="Keep running, re-aggregating only new or changed partitions and rebuilding on change; "
+                             f"polls every SECONDS (default {POLL_SECONDS:g}) unless watchdog is installed")
+    parser.add_argument('--trend', type=int, metavar='N',
+                        help="Add trend sections over the last N releases, reusing stored per-release aggregates")
+    parser.add_argument('--trend-dir', default=TREND_DIR,
+                        help=f"Where --trend keeps per-release aggregates (default {TREND_DIR})")
+    parser.add_argument('--detail', choices=list(DETAIL_PRESETS), default='full',
+                        help="Detail level: sections, columns and top values included (default full)")
+    parser.add_argument('--top-n', type=int, metavar='N',
+                        help=f"Top values shown per column (1-{MAX_TOP_N}) instead of the detail level's")
+    parser.add_argument('--token-budget', type=int, metavar='N',
+                        help="Trim the lowest-information content until the document fits in N tokens")
+    parser.add_argument('--report', metavar='FILE',
+                        help="Write a JSON run report with per-stage wall/CPU time, rows, bytes and peak memory")
+    parser.add_argument('--profile', metavar='FILE', help="Profile the run (main process only) into FILE")
+    parser.add_argument('--profiler', choices=PROFILERS, default='cprofile',
+                        help="cprofile writes pstats data, pyinstrument an HTML report")
+    parser.add_argument('--reader', choices=READER_BACKENDS, default='auto',
+                        help="CSV parser; auto uses pyarrow's multithreaded reader when installed")
+    parser.add_argument('--project', action='store_true',
+                        help="Only read the columns each theme reports, with fixed dtypes")
+    args = parser.parse_args()
+    if args.engine == 'duckdb' and args.incremental:
+        parser.error("--incremental needs the pandas engine")
+    if any('=' not in key for key in args.partition):
+        parser.error("--partition expects KEY=VALUE")
+    if args.shard and (args.merge or args.incremental or args.engine == 'duckdb'):
+        parser.error("--shard cannot be combined with --merge, --incremental or --engine duckdb")
+    if args.from_snapshot and (args.shard or args.merge or args.incremental):
+        parser.error("--from-snapshot cannot be combined with --shard, --merge or --incremental")
+    if (args.slices or args.trend) and (args.shard or args.merge):
+        parser.error("--slices and --trend cannot be combined with --shard or --merge")
+    if args.cube and (args.merge or args.from_snapshot):
+        parser.error("--cube applies when aggregating the CSVs; with shards, pass it to every --shard")
+    if args.watch is not None and (args.shard or args.merge or args.from_snapshot or args.incremental
+                                   or args.trend or args.engine == 'duckdb' or args.report or args.profile):
+        parser.error("--watch cannot be combined with --shard, --merge, --from-snapshot, --incremental, --trend, "
+                     "--engine duckdb, --report or --profile")
+    if args.top_n is not None and not 1 <= args.top_n <= MAX_TOP_N:
+        parser.error(f"--top-n must be between 1 and {MAX_TOP_N}")
+    if args.trend and args.from_snapshot:
+        parser.error("--trend aggregates releases; re-render a snapshot built with --trend instead")
+
+    cache = None
+    if not args.from_snapshot:
+        from metrics_cache import cache_settings
+        cache = cache_settings(args.cache, args.cache_dir)
+    reader = reader_settings(args.reader, args.project)
+    partitions = dict(key.split('=', 1) for key in args.partition)
+    if args.shard:
+        try:
+            shard, shards = (int(part) for part in args.shard.split('/'))
+        except ValueError:
+            parser.error("--shard expects I/N, e.g. 1/4")
+        if not 1 <= shard <= shards:
+            parser.error("--shard I/N needs 1 <= I <= N")
+        generate_shard(shard - 1, shards, args.shard_out, workers=args.workers or os.cpu_count(),
+                       topk=args.top_k, hll=args.hll, cache=cache, release=args.release, reader=reader,
+                       partitions=partitions, cube=args.cube)
+    elif args.watch is not None:
+        watch_document(workers=args.workers or os.cpu_count(), topk=args.top_k, hll=args.hll, cache=cache,
+                       release=args.release, summary_file=args.summary, reader=reader, partitions=partitions,
+                       detail=args.detail, token_budget=args.token_budget, snapshot_file=args.snapshot,
+                       slice_dir=args.slices, artifact_dir=args.artifacts, cube=args.cube, interval=args.watch,
+                       top_n=args.top_n)
+    else:
+        report = new_report(workers=args.workers or os.cpu_count(), engine=args.engine, reader=reader,
+                            topk=args.top_k, hll=args.hll, incremental=args.incremental) if args.report else None
+        with profiled(args.profile, args.profiler):
+            if args.from_snapshot:
+                render_snapshot(load_snapshot(args.from_snapshot), args.detail, args.token_budget,
+                                args.summary, report, args.slices, args.artifacts, args.top_n)
+            else:
+                generate_document(workers=args.workers or os.cpu_count(), topk=args.top_k, hll=args.hll,
+                                  cache=cache, store=args.store_dir if args.incremental else None,
+                                  release=args.release, summary_file=args.summary, reader=reader,
+                                  engine=args.engine, memory_limit=args.memory_limit,
+                                  partitions=partitions, merge=args.merge, report=report,
+                                  detail=args.detail, token_budget=args.token_budget,
+                                  snapshot_file=args.snapshot, slice_dir=args.slices,
+                                  artifact_dir=args.artifacts, trend=args.trend, trend_dir=args.trend_dir,
+                                  cube=args.cube, top_n=args.top_n)
+        if report is not None:
+            write_report(finish_report(report), args.report)
+            print_report(report)
+            print(f"\n✓ Run report written: {args.report}")
@@ -0,0 +1,130 @@
+"""
+Per-stage timing and memory instrumentation for metrics builds.
+
+A run report is a plain dict with one entry per stage (release discovery,
+partition discovery, each theme's read/fold/merge, changelog load, render).
+Each entry records wall time, CPU time and peak RSS, plus whatever the stage
+adds (rows parsed, bytes read, ...). Pass report=None to skip recording.
+
+    report = new_report(release=release)
+    with stage(report, 'render') as entry:
+        ...
+    write_report(report, 'run_report.json')
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILERS = ['cprofile', 'pyinstrument']
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children, in MB"""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024  # ru_maxrss is in KB on Linux
+
+
+def cpu_seconds():
+    """CPU time used by this process and its finished children"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def new_report(**info):
+    """Start a run report"""
+    return {'started': datetime.now().isoformat(timespec='seconds'), **info, 'stages': [],
+            '_wall': time.perf_counter(), '_cpu': cpu_seconds()}
+
+
+@contextmanager
+def stage(report, name, **info):
+    """Record one stage of a run; yields its entry so the stage can add counters"""
+    entry = {'stage': name, **info}
+    wall = time.perf_counter()
+    cpu = cpu_seconds()
+    try:
+        yield entry
+    finally:
+        if report is not None:
+            entry['wall_seconds'] = time.perf_counter() - wall
+            entry['cpu_seconds'] = cpu_seconds() - cpu
+            entry['peak_rss_mb'] = peak_rss_mb()
+            report['stages'].append(entry)
+
+
+def add_file_stats(entry, stats):
+    """Add one partition's stats from aggregate_file() to a stage entry"""
+    for key in ['files', 'rows', 'bytes', 'read_seconds', 'fold_seconds', 'file_cpu_seconds']:
+        entry[key] = entry.get(key, 0) + stats[key]
+    if stats['peak_rss_mb'] is not None:
+        entry['file_peak_rss_mb'] = max(entry.get('file_peak_rss_mb', 0), stats['peak_rss_mb'])
+
+
+def finish_report(report):
+    """Add run totals and drop the internal start markers"""
+    report['wall_seconds'] = time.perf_counter() - report.pop('_wall')
+    report['cpu_seconds'] = cpu_seconds() - report.pop('_cpu')
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def write_report(report, path):
+    """Write a finished run report as JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=float)
+
+
+def print_report(report):
+    """Print the slowest stages first"""
+    print(f"\n{'Stage':<28} {'Wall (s)':>9} {'CPU (s)':>9} {'Rows':>12} {'Peak RSS (MB)':>14}")
+    for entry in sorted(report['stages'], key=lambda entry: -entry['wall_seconds']):
+        rows = f"{entry['rows']:,}" if 'rows' in entry else '-'
+        rss = f"{entry['peak_rss_mb']:.1f}" if entry['peak_rss_mb'] is not None else '-'
+        print(f"{entry['stage']:<28} {entry['wall_seconds']:>9.3f} {entry['cpu_seconds']:>9.3f} "
+              f"{rows:>12} {rss:>14}")
+
+
+@contextmanager
+def profiled(path, profiler='cprofile'):
+    """Profile the enclosed block into `path`; does nothing when path is None.
+
+    cProfile writes pstats data (open with `python -m pstats` or snakeviz);
+    pyinstrument writes an HTML report. Only the current process is profiled.
+    """
+    if path is None:
+        yield
+        return
+
+    if profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("--profiler pyinstrument requires pyinstrument to be installed")
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profile.output_html())
+    else:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
@@ -0,0 +1,923 @@
+"""
+Shared scan and aggregation of Overture Metrics CSV files.
+
+Both generate_llm_context.py and analyze_metrics.py build their outputs from
+the per-theme results computed here, so one scan of a release can feed
+both. Each CSV partition is folded into a partial aggregate (weighted value
+counts per grouping column), partials are merged per theme, and the merged
+aggregate is finalized into the result dict used for rendering.
+
+Optionally, partials also hold a sparse drill-down cube: weighted counts of
+value pairs for the column pairs in CUBE_DIMENSIONS (e.g. the primary
+categories within each country), nested by the first column's value so a
+drill-down is a dictionary lookup rather than a rescan.
+"""
+
+import glob
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial as bind
+
+import numpy as np
+import pandas as pd
+
+from csv_readers import reader_settings
+from defaults import TOPK_CAPACITY, TOPK_COLUMNS
+from instrumentation import add_file_stats, peak_rss_mb, stage
+from metrics_cache import enforce_size_limit, file_fingerprint, iter_csv_chunks
+from partition_index import METRICS_BASE, find_partitions, list_releases, partition_keys
+from partial_store import (load_manifest, load_partial, partial_path, remove_unreferenced,
+                           save_manifest, save_partial, theme_path, theme_token)
+from sketches import NumericSummary, SketchedCounts
+
+# Configuration
+CHUNK_ROWS = 1_000_000  # Rows read at a time from large CSV partitions
+
+# Columns analyze_metrics.py reports per theme. These are aggregated even
+# when their values are numeric (e.g. confidence); other columns only when
+# they hold text
+GROUPING_COLUMNS = {
+    'addresses': ['country', 'address_level_1', 'address_level_2', 'datasets', 'change_type'],
+    'buildings': ['subtype', 'class', 'datasets', 'change_type'],
+    'base': ['subtype', 'class', 'datasets', 'change_type'],
+    'places': ['place_countries', 'primary_category', 'confidence', 'datasets', 'change_type'],
+    'divisions': ['subtype', 'class', 'country', 'datasets', 'change_type'],
+    'transportation': ['subtype', 'class', 'subclass', 'datasets', 'change_type']
+}
+ALWAYS_GROUPED = {col for columns in GROUPING_COLUMNS.values() for col in columns}
+
+# Column each theme is split on for per-country context slices
+SLICE_COLUMNS = {
+    'addresses': 'country',
+    'places': 'place_countries',
+    'divisions': 'country'
+}
+
+# Column pairs rolled up into the drill-down cube, (by, of): the values of
+# `of` within each value of `by`. Pairs apply to every theme having both
+CUBE_DIMENSIONS = [
+    ('place_countries', 'primary_category'),
+    ('datasets', 'primary_category'),
+    ('primary_category', 'change_type'),
+    ('country', 'address_level_1'),
+    ('country', 'subtype'),
+    ('country', 'datasets'),
+    ('datasets', 'class'),
+    ('subtype', 'class'),
+    ('class', 'subclass'),
+    ('subtype', 'change_type')
+]
+CUBE_TOP_VALUES = 15  # `of` values kept per `by` value in results
+
+# Metric columns are summed, never grouped on
+METRIC_COLUMNS = ['total_count', 'id_count', 'geometry_count', 'bbox_count', 'version_count',
+                  'sources_count', 'average_geometry_length_km', 'total_geometry_length_km',
+                  'average_geometry_area_km2', 'total_geometry_area_km2']
+
+# Numeric columns summarized with count-weighted statistics and quantiles,
+# and the bin edges of those that also get a weighted histogram. Averages
+# and confidence describe each feature of a group; the other columns are
+# totals over the group's features, summarized per feature (total / count).
+# Confidence is a score, so it gets no sum.
+NUMERIC_COLUMNS = [col for col in METRIC_COLUMNS if col not in ('total_count', 'id_count')] + ['confidence']
+PER_FEATURE_COLUMNS = ['average_geometry_length_km', 'average_geometry_area_km2', 'confidence']
+UNSUMMED_COLUMNS = ['confidence']
+HISTOGRAM_BINS = {'confidence': [i / 10 for i in range(11)]}
+TDIGEST_COMPRESSION = 200  # ~120 centroids, well under 0.1% rank error
+
+# Columns and dtypes materialized per theme when column projection is on
+THEME_SCHEMAS = {
+    theme: {
+        **{col: 'float64' if col == 'confidence' else 'category' for col in columns},
+        **({'address_level_3': 'category'} if theme == 'addresses' else {}),
+        'total_count': 'int64',
+        'id_count': 'int64',
+        **{col: 'float64' for col in NUMERIC_COLUMNS if col not in columns}
+    }
+    for theme, columns in GROUPING_COLUMNS.items()
+}
+
+# With distinct-count sketches enabled, a column is counted exactly until it
+# has more distinct values than its threshold, then switches to sketches
+SKETCH_THRESHOLD = 100_000
+SKETCH_THRESHOLDS = {
+    'address_level_2': 20_000,
+    'address_level_3': 20_000,
+    'primary_category': 20_000
+}
+
+def get_latest_release():
+    """Find the most recent release, from the releases index when built"""
+    releases = list_releases()
+    if not releases:
+        raise FileNotFoundError(f"No releases found in {METRICS_BASE}")
+    return releases[-1]
+
+
+def find_theme_files(theme, release, partitions=None):
+    """List the CSV partitions for a theme in a stable order.
+
+    `partitions` optionally filters on other partition keys, e.g.
+    {'type': 'segment'}. Uses the release's partition index when built.
+    """
+    return find_partitions(release, **{**(partitions or {}), 'theme': theme})
+
+
+def is_categorical(dtype):
+    """Check whether a column dtype holds text or categorical values"""
+    return dtype == 'object' or dtype.name == 'category'
+
+
+def is_grouping_column(col, dtype):
+    """Check whether a column holds values worth aggregating"""
+    if col in METRIC_COLUMNS:
+        return False
+    return is_categorical(dtype) or col in ALWAYS_GROUPED
+
+
+def new_partial(topk=None, hll=None, cube=False):
+    """Create an empty partial aggregate.
+
+    A partial holds running weighted value counts per grouping column, kept
+    separately for each weight column ('total_count', 'id_count', or
+    'records' when neither exists) so partitions with different schemas
+    merge the same way a concatenated DataFrame would. Its size depends on
+    the number of distinct values, not the number of rows.
+
+    Args:
+        topk: Counter capacity for TOPK_COLUMNS, or None to count them exactly.
+        hll: HyperLogLog precision for distinct counts, or None to disable
+            switching columns to sketches at their SKETCH_THRESHOLDS.
+        cube: Also count the value pairs of CUBE_DIMENSIONS, kept as
+            {by: {of: {by value: {of value: count}}}}; None when disabled.
+    """
+    return {'files': 0, 'total_records': 0, 'column_order': [], 'categorical': [], 'tallies': {},
+            'numeric': {}, 'cube': {} if cube else None, 'sketch': {'topk': topk, 'hll': hll}}
+
+
+def to_sketch(partial, counts):
+    """Convert exact value counts into a SketchedCounts"""
+    sketched = SketchedCounts(partial['sketch']['topk'] or TOPK_CAPACITY, partial['sketch']['hll'])
+    sketched.update(counts)
+    return sketched
+
+
+def add_counts(partial, tally, col, counts):
+    """Add exact value counts, or another column's sketch, to a running tally"""
+    sketch = partial['sketch']
+    running = tally['columns'].get(col)
+    if running is None:
+        running = SketchedCounts(sketch['topk'], sketch['hll']) if sketch['topk'] and col in TOPK_COLUMNS else {}
+    if isinstance(counts, SketchedCounts) and isinstance(running, dict):
+        running = to_sketch(partial, running)
+    tally['columns'][col] = running
+
+    if isinstance(running, SketchedCounts):
+        if isinstance(counts, SketchedCounts):
+            running.merge(counts)
+        else:
+            running.update(counts)
+        return
+
+    for key, count in counts.items():
+        running[key] = running.get(key, 0) + count
+    if sketch['hll'] and len(running) > SKETCH_THRESHOLDS.get(col, SKETCH_THRESHOLD):
+        tally['columns'][col] = to_sketch(partial, running)
+
+
+def weighted_value_counts(df, columns, weights):
+    """Compute weighted value counts for several columns in one pass.
+
+    Each column is factorized once and its weights summed with bincount, so
+    no column is sorted or grouped separately. NaN values are dropped, as
+    groupby would. Returns {column: {str(value): count}}.
+    """
+    integral = weights.dtype.kind in 'iub'
+    if not integral:
+        weights = np.nan_to_num(weights.astype(float))
+
+    counts = {}
+    for col in columns:
+        codes, uniques = pd.factorize(df[col])
+        present = codes >= 0
+        sums = np.bincount(codes[present], weights=weights[present], minlength=len(uniques))
+        if integral:
+            sums = sums.astype(np.int64)
+        counts[col] = dict(zip(map(str, uniques), sums.tolist()))
+    return counts
+
+
+def weighted_pair_counts(df, pairs, weights):
+    """Compute weighted counts of value pairs for several column pairs.
+
+    Like weighted_value_counts(), each column is factorized once; a pair's
+    codes are combined into one code and summed with bincount. Rows missing
+    either value are dropped. Returns {(by, of): {by value: {of value: count}}}.
+    """
+    integral = weights.dtype.kind in 'iub'
+    if not integral:
+        weights = np.nan_to_num(weights.astype(float))
+
+    factorized = {col: pd.factorize(df[col]) for pair in pairs for col in pair}
+    counts = {}
+    for by, of in pairs:
+        (by_codes, by_values), (of_codes, of_values) = factorized[by], factorized[of]
+        present = (by_codes >= 0) & (of_codes >= 0)
+        combined = by_codes[present].astype(np.int64) * len(of_values) + of_codes[present]
+        codes, inverse = np.unique(combined, return_inverse=True)
+        sums = np.bincount(inverse, weights=weights[present], minlength=len(codes))
+        if integral:
+            sums = sums.astype(np.int64)
+
+        cells = {}
+        for code, count in zip(codes.tolist(), sums.tolist()):
+            by_index, of_index = divmod(code, len(of_values))
+            cells.setdefault(str(by_values[by_index]), {})[str(of_values[of_index])] = count
+        counts[(by, of)] = cells
+    return counts
+
+
+def add_cube_counts(partial, by, of, cells):
+    """Add pair counts {by value: {of value: count}} to a partial's cube"""
+    running = partial['cube'].setdefault(by, {}).setdefault(of, {})
+    for by_value, counts in cells.items():
+        row = running.setdefault(by_value, {})
+        for of_value, count in counts.items():
+            row[of_value] = row.get(of_value, 0) + count
+
+
+def fold_frame(partial, df):
+    """Fold one DataFrame (a file or a chunk of one) into a partial"""
+    weight = 'total_count' if 'total_count' in df.columns else 'id_count'
+    if weight not in df.columns:
+        weight = 'records'
+
+    tally = partial['tallies'].setdefault(weight, {'total_features': 0, 'columns': {}})
+    partial['total_records'] += len(df)
+    if weight != 'records':
+        tally['total_features'] += df[weight].sum()
+        weights = df[weight].to_numpy()
+    else:
+        weights = np.ones(len(df), dtype=np.int64)
+
+    columns = [col for col in df.columns if is_grouping_column(col, df[col].dtype)]
+    for col, counts in weighted_value_counts(df, columns, weights).items():
+        if col not in partial['column_order']:
+            partial['column_order'].append(col)
+        if col not in partial['categorical'] and is_categorical(df[col].dtype):
+            partial['categorical'].append(col)
+        add_counts(partial, tally, col, counts)
+
+    # Drill-down pairs, weighted by the same count
+    if partial['cube'] is not None:
+        pairs = [(by, of) for by, of in CUBE_DIMENSIONS if by in columns and of in columns]
+        for (by, of), cells in weighted_pair_counts(df, pairs, weights).items():
+            add_cube_counts(partial, by, of, cells)
+
+    # Numeric columns, weighted by the same count
+    for col in df.columns:
+        if col in NUMERIC_COLUMNS and df[col].dtype.kind in 'iuf':
+            add_numeric(partial, col, df[col].to_numpy(dtype=float), weights)
+
+
+def numeric_summary(partial, col):
+    """A partial's summary of a numeric column, created when missing"""
+    if col not in partial['numeric']:
+        partial['numeric'][col] = NumericSummary(TDIGEST_COMPRESSION, HISTOGRAM_BINS.get(col),
+                                                 totals=col not in PER_FEATURE_COLUMNS)
+    return partial['numeric'][col]
+
+
+def add_numeric(partial, col, values, weights):
+    """Add a batch of a numeric column's values and weights to a partial"""
+    numeric_summary(partial, col).update(values, weights)
+
+
+def merge_partial(partial, other):
+    """Fold another partial aggregate into a partial, in place"""
+    partial['files'] += other['files']
+    partial['total_records'] += other['total_records']
+    for col in other['column_order']:
+        if col not in partial['column_order']:
+            partial['column_order'].append(col)
+    for col in other['categorical']:
+        if col not in partial['categorical']:
+            partial['categorical'].append(col)
+
+    for weight, other_tally in other['tallies'].items():
+        tally = partial['tallies'].setdefault(weight, {'total_features': 0, 'columns': {}})
+        tally['total_features'] += other_tally['total_features']
+        for col, other_counts in other_tally['columns'].items():
+            add_counts(partial, tally, col, other_counts)
+
+    if other.get('cube'):
+        if partial['cube'] is None:
+            partial['cube'] = {}
+        for by, rollups in other['cube'].items():
+            for of, cells in rollups.items():
+                add_cube_counts(partial, by, of, cells)
+
+    merge_numeric(partial, other)
+
+
+def merge_numeric(partial, other):
+    """Fold another partial's numeric summaries into a partial, in place"""
+    for col, summary in other.get('numeric', {}).items():
+        if col not in partial['numeric']:
+            partial['numeric'][col] = NumericSummary(summary.digest.compression, summary.bins, summary.totals)
+        partial['numeric'][col].merge(summary)
+
+
+def subtract_partial(partial, other):
+    """Remove a partial aggregate previously merged into a partial, in place.
+
+    Only valid for exact integer counts (see is_subtractable). Values whose
+    count drops to zero are dropped, so callers must make sure no remaining
+    partition holds zero-weight rows for them.
+    """
+    partial['files'] -= other['files']
+    partial['total_records'] -= other['total_records']
+
+    for weight, other_tally in other['tallies'].items():
+        tally = partial['tallies'][weight]
+        tally['total_features'] -= other_tally['total_features']
+        for col, other_counts in other_tally['columns'].items():
+            running = tally['columns'][col]
+            for key, count in other_counts.items():
+                remaining = running[key] - count
+                if remaining:
+                    running[key] = remaining
+                else:
+                    del running[key]
+
+    for by, rollups in (other.get('cube') or {}).items():
+        for of, cells in rollups.items():
+            running = partial['cube'][by][of]
+            for by_value, counts in cells.items():
+                row = running[by_value]
+                for of_value, count in counts.items():
+                    remaining = row[of_value] - count
+                    if remaining:
+                        row[of_value] = remaining
+                    else:
+                        del row[of_value]
+                if not row:
+                    del running[by_value]
+
+
+def is_subtractable(partial):
+    """Check that a partial's counts are all exact integers.
+
+    Numeric summaries are not considered: they cannot be subtracted and are
+    always re-merged (see update_stored_theme()).
+    """
+    for tally in partial['tallies'].values():
+        # Totals summed by pandas are numpy integers until stored as JSON
+        if not isinstance(tally['total_features'], (int, np.integer)):
+            return False
+        for counts in tally['columns'].values():
+            if isinstance(counts, SketchedCounts):
+                return False
+            if not all(isinstance(count, int) for count in counts.values()):
+                return False
+    return all(isinstance(count, int) for row in cube_rows(partial) for count in row.values())
+
+
+def cube_rows(partial):
+    """Every {of value: count} row of a partial's cube"""
+    return [row for rollups in (partial.get('cube') or {}).values()
+            for cells in rollups.values() for row in cells.values()]
+
+
+def has_zero_weights(partial):
+    """Check whether any value of a partial has a total weight of zero"""
+    counts = [counts for tally in partial['tallies'].values()
+              for counts in tally['columns'].values() if not isinstance(counts, SketchedCounts)]
+    return any(count == 0 for counts in counts + cube_rows(partial) for count in counts.values())
+
+
+def aggregate_file(file, chunksize=CHUNK_ROWS, topk=None, hll=None, cache=None, reader=None, cube=False):
+    """Aggregate a single CSV partition into a partial aggregate.
+
+    Large files are read in chunks of `chunksize` rows and each chunk is
+    discarded once folded in. Parsed chunks come from, and are written to,
+    the columnar cache described by `cache`; `reader` selects the CSV
+    backend and whether only the theme's schema columns are read. Runs in
+    worker processes, so it only takes and returns picklable data.
+
+    Time spent parsing and folding, rows, bytes and peak RSS are recorded in
+    partial['stats'] for instrumentation; they are not merged or stored.
+    """
+    columns = dtypes = None
+    if reader and reader['project']:
+        dtypes = THEME_SCHEMAS.get(partition_keys(file).get('theme'))
+        columns = list(dtypes) if dtypes else None
+
+    partial = new_partial(topk, hll, cube)
+    stats = {'files': 1, 'rows': 0, 'bytes': 0, 'read_seconds': 0.0, 'fold_seconds': 0.0}
+    cpu = time.process_time()
+    try:
+        stats['bytes'] = os.path.getsize(file)
+        chunks = iter_csv_chunks(file, chunksize, cache, reader, columns, dtypes)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            stats['read_seconds'] += time.perf_counter() - start
+            if chunk is None:
+                break
+
+            start = time.perf_counter()
+            fold_frame(partial, chunk)
+            stats['fold_seconds'] += time.perf_counter() - start
+            stats['rows'] += len(chunk)
+    except Exception as e:
+        print(f"Warning: Error reading {file}: {e}")
+        return None
+
+    stats['file_cpu_seconds'] = time.process_time() - cpu
+    stats['peak_rss_mb'] = peak_rss_mb()
+    partial['files'] = 1
+    partial['stats'] = stats
+    return partial
+
+
+def aggregate_file_slices(file, column, chunksize=CHUNK_ROWS, topk=None, hll=None, cache=None, reader=None):
+    """Aggregate a CSV partition into one partial per value of `column`.
+
+    Returns {value: partial}, or None when the file could not be read.
+    Rows without a value are left out.
+    """
+    columns = dtypes = None
+    if reader and reader['project']:
+        dtypes = THEME_SCHEMAS.get(partition_keys(file).get('theme'))
+        columns = list(dtypes) if dtypes else None
+
+    slices = {}
+    try:
+        for chunk in iter_csv_chunks(file, chunksize, cache, reader, columns, dtypes):
+            if column not in chunk.columns:
+                continue
+            for value, group in chunk.groupby(column, sort=False, observed=True):
+                fold_frame(slices.setdefault(str(value), new_partial(topk, hll)), group)
+    except Exception as e:
+        print(f"Warning: Error reading {file}: {e}")
+        return None
+
+    for partial in slices.values():
+        partial['files'] = 1
+    return slices
+
+
+def summarize_sketch(sketched):
+    """Summarize a SketchedCounts in the same shape as an exact column.
+
+    Once values have been evicted, each top value carries the maximum
+    overestimate of its count, and the unique count is a HyperLogLog
+    estimate or, without one, only a lower bound.
+    """
+    heavy = sketched.heavy
+    column = {
+        'unique_count': len(heavy),
+        'top_values': []
+    }
+    if not heavy.is_exact:
+        column['error_bound'] = int(heavy.floor)
+        if sketched.distinct is not None:
+            column['unique_count'] = sketched.distinct.estimate()
+            column['unique_count_error'] = sketched.distinct.relative_error
+        else:
+            column['unique_count_is_lower_bound'] = True
+
+    for value, count, error in heavy.top(15):
+        percentage = (count / heavy.total * 100) if heavy.total > 0 else 0
+        column['top_values'].append({
+            'value': value,
+            'count': int(count),
+            'percentage': percentage,
+            'error': int(error)
+        })
+
+    return column
+
+
+def heaviest(counts, n):
+    """Return the n heaviest (value, count) pairs, ties broken by value.
+
+    The order groupby().sort_values() gives, selected without sorting
+    every distinct value.
+    """
+    return heapq.nsmallest(n, counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def finalize_partial(partial):
+    """Turn a partial aggregate into the theme result used for rendering"""
+    if partial['files'] == 0:
+        return None
+
+    # Same count column the combined DataFrame would have used
+    tallies = partial['tallies']
+    count_col = 'total_count' if 'total_count' in tallies else 'id_count'
+    if count_col not in tallies:
+        count_col = 'records'
+    main = tallies.get(count_col, {'total_features': 0, 'columns': {}})
+
+    result = {
+        'files': partial['files'],
+        'total_records': partial['total_records'],
+        'total_features': main['total_features'],
+        'columns': {}
+    }
+
+    for col in partial['column_order']:
+        counts = main['columns'].get(col, {})
+        if isinstance(counts, SketchedCounts):
+            result['columns'][col] = summarize_sketch(counts)
+            result['columns'][col]['categorical'] = col in partial['categorical']
+            continue
+
+        counts = dict(counts)
+        for weight, tally in tallies.items():
+            if weight != count_col:
+                # Partitions lacking the count column still contribute their values
+                other_counts = tally['columns'].get(col, {})
+                if isinstance(other_counts, SketchedCounts):
+                    other_counts = other_counts.heavy.counts
+                for key in other_counts:
+                    counts.setdefault(key, 0)
+
+        total = sum(counts.values())
+
+        result['columns'][col] = {
+            'unique_count': len(counts),
+            'categorical': col in partial['categorical'],
+            'top_values': []
+        }
+
+        for value, count in heaviest(counts, 15):
+            percentage = (count / total * 100) if total > 0 else 0
+            result['columns'][col]['top_values'].append({
+                'value': value,
+                'count': int(count),
+                'percentage': percentage
+            })
+
+    # Weighted statistics of numeric columns, in scan order
+    numeric = {col: summary.summarize() for col, summary in partial.get('numeric', {}).items()}
+    result['numeric'] = {col: summary for col, summary in numeric.items() if summary}
+    for col in UNSUMMED_COLUMNS:
+        result['numeric'].get(col, {}).pop('sum', None)
+
+    if partial.get('cube') is not None:
+        result['cube'] = finalize_cube(partial['cube'])
+
+    return result
+
+
+def finalize_cube(cube):
+    """Turn a partial's cube into drill-down results.
+
+    Returns {by: {of: {by value: {'total', 'unique_count', 'top_values'}}}},
+    with the `by` values ordered by total and their top `of` values shaped
+    like a column's top values.
+    """
+    result = {}
+    for by, rollups in cube.items():
+        for of, cells in rollups.items():
+            rows = sorted(((by_value, sum(counts.values()), counts) for by_value, counts in cells.items()),
+                          key=lambda row: (-row[1], row[0]))
+            drilldown = {}
+            for by_value, total, counts in rows:
+                drilldown[by_value] = {
+                    'total': total,
+                    'unique_count': len(counts),
+                    'top_values': [{'value': value, 'count': count,
+                                    'percentage': (count / total * 100) if total > 0 else 0}
+                                   for value, count in heaviest(counts, CUBE_TOP_VALUES)]
+                }
+            result.setdefault(by, {})[of] = drilldown
+    return result
+
+
+def update_stored_theme(store, release, manifest, theme, files, fresh):
+    """Bring a theme's stored aggregate up to date and return it.
+
+    The stored theme aggregate is reused, with the stored partials of
+    deleted and replaced partitions subtracted and the `fresh` partials of
+    new and changed ones merged in. Numeric summaries (quantile sketches,
+    min/max) cannot be subtracted, so after any change only they are
+    re-merged in file order from the stored partials. When subtraction of
+    the counts is not exact (sketched or float counts, zero-weight values)
+    the whole aggregate is re-merged in file order from the stored partials
+    of unchanged partitions and the fresh ones instead. No CSV is re-read.
+
+    Args:
+        files: Current CSV partitions of the theme, sorted.
+        fresh: (file, fingerprint, partial) for each re-aggregated partition;
+            partial is None when the file could not be read.
+    """
+    settings = manifest['settings']
+    theme_entry = manifest['themes'].get(theme, {'aggregate': None, 'files': {}})
+    entries = dict(theme_entry['files'])
+    current = set(files)
+    outdated = [file for file in entries if file not in current]
+    outdated += [file for file, _, _ in fresh if file in entries]
+    kept = {file: entry for file, entry in entries.items() if file not in outdated}
+
+    # Unreadable partitions are left out and retried on the next rebuild
+    fresh_partials = {file: partial for file, _, partial in fresh if partial is not None}
+
+    aggregate = None
+    stored = theme_path(store, release, theme, theme_entry['aggregate']) if theme_entry['aggregate'] else None
+    if stored and os.path.exists(stored):
+        aggregate = load_partial(stored)
+        if not is_subtractable(aggregate):
+            # Sketches depend on merge order, so any change re-merges in file order
+            if outdated or fresh_partials:
+                aggregate = None
+        elif outdated:
+            if not any(entry['zero_weights'] for entry in kept.values()):
+                for file in outdated:
+                    subtract_partial(aggregate, load_partial(
+                        partial_path(store, release, file, entries[file]['fingerprint'])))
+            else:
+                aggregate = None
+
+    if aggregate is None:
+        aggregate = new_partial(settings['topk'], settings['hll'], settings['cube'])
+        for file in files:
+            if file in fresh_partials:
+                merge_partial(aggregate, fresh_partials[file])
+            elif file in kept:
+                merge_partial(aggregate, load_partial(
+                    partial_path(store, release, file, kept[file]['fingerprint'])))
+    else:
+        for partial in fresh_partials.values():
+            merge_partial(aggregate, partial)
+        if aggregate['numeric'] and (outdated or fresh_partials):
+            # Digests depend on merge order, so re-merge the summaries in file order
+            aggregate['numeric'] = {}
+            for file in files:
+                if file in fresh_partials:
+                    merge_numeric(aggregate, fresh_partials[file])
+                elif file in kept:
+                    merge_numeric(aggregate, load_partial(
+                        partial_path(store, release, file, kept[file]['fingerprint'])))
+
+    for file, fingerprint, partial in fresh:
+        if partial is None:
+            continue
+        save_partial(partial, partial_path(store, release, file, fingerprint))
+        kept[file] = {
+            'fingerprint': fingerprint,
+            'columns': partial['column_order'],
+            'categorical': partial['categorical'],
+            'weights': list(partial['tallies']),
+            'zero_weights': has_zero_weights(partial)
+        }
+
+    # Column order and weight tallies as a full rebuild in file order would have them
+    aggregate['column_order'] = []
+    aggregate['categorical'] = []
+    for file in files:
+        for key in ['columns', 'categorical']:
+            target = aggregate['column_order' if key == 'columns' else 'categorical']
+            for col in kept.get(file, {}).get(key, []):
+                if col not in target:
+                    target.append(col)
+    weights = {weight for entry in kept.values() for weight in entry['weights']}
+    aggregate['tallies'] = {weight: tally for weight, tally in aggregate['tallies'].items() if weight in weights}
+
+    token = theme_token(kept)
+    save_partial(aggregate, theme_path(store, release, theme, token))
+    manifest['themes'][theme] = {'aggregate': token, 'files': kept}
+    return aggregate
+
+
+def analyze_themes(themes, release, workers=1, topk=None, hll=None, cache=None, store=None, reader=None,
+                   partitions=None, report=None, cube=False):
+    """Analyze several themes, optionally spreading partitions over a process pool.
+
+    Every CSV partition of every theme is an independent task. Partials are
+    folded into a running per-theme aggregate in sorted file order as they
+    arrive, so memory stays bounded and the output does not depend on the
+    number of workers.
+
+    Args:
+        topk: Counter capacity for the top-K sketch of TOPK_COLUMNS, or
+            None to count every column exactly.
+        hll: HyperLogLog precision; when set, columns that exceed their
+            SKETCH_THRESHOLDS switch to top-K and distinct-count sketches.
+        cache: Parsed-CSV cache settings from metrics_cache.cache_settings(),
+            or None to always parse the CSVs.
+        store: Directory of persisted per-partition partial aggregates. When
+            given, only partitions that are new or changed since the last
+            run are re-aggregated.
+        reader: CSV reader settings from csv_readers.reader_settings();
+            defaults to the fastest installed backend without projection.
+        partitions: Only aggregate partitions whose keys match, e.g.
+            {'type': 'segment'}; see find_theme_files().
+        report: Run report from instrumentation.new_report() to record
+            partition discovery and each theme's read, fold, merge and
+            finalize times in, or None.
+        cube: Also build each theme's drill-down cube of CUBE_DIMENSIONS,
+            returned in result['cube'].
+    """
+    if reader is None:
+        reader = reader_settings()
+
+    with stage(report, 'partition_discovery') as entry:
+        files_by_theme = {theme: find_theme_files(theme, release, partitions) for theme in themes}
+        stale_by_theme = files_by_theme
+        if store is not None:
+            manifest = load_manifest(store, release, {'topk': topk, 'hll': hll, 'cube': cube,
+                                                      'project': reader['project']})
+            fingerprints = {file: file_fingerprint(file) for files in files_by_theme.values() for file in files}
+            stale_by_theme = {}
+            for theme, theme_files in files_by_theme.items():
+                entries = manifest['themes'].get(theme, {'files': {}})['files']
+                stale_by_theme[theme] = [file for file in theme_files
+                                         if entries.get(file, {}).get('fingerprint') != fingerprints[file]]
+        entry['partitions'] = sum(len(files) for files in files_by_theme.values())
+        entry['stale'] = sum(len(files) for files in stale_by_theme.values())
+
+    files = [file for theme in themes for file in stale_by_theme[theme]]
+    task = bind(aggregate_file, topk=topk, hll=hll, cache=cache, reader=reader, cube=cube)
+
+    if workers > 1 and len(files) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        partials = pool.map(task, files)
+    else:
+        pool = None
+        partials = map(task, files)
+
+    results = {}
+    try:
+        for theme in themes:
+            with stage(report, f"theme:{theme}", files=0, rows=0, bytes=0) as entry:
+                entry['merge_seconds'] = 0.0
+                if store is not None:
+                    fresh = [(file, fingerprints[file], next(partials)) for file in stale_by_theme[theme]]
+                    start = time.perf_counter()
+                    theme_partial = update_stored_theme(store, release, manifest, theme,
+                                                        files_by_theme[theme], fresh)
+                    entry['merge_seconds'] += time.perf_counter() - start
+                    for _, _, partial in fresh:
+                        if partial is not None:
+                            add_file_stats(entry, partial['stats'])
+                else:
+                    theme_partial = new_partial(topk, hll, cube)
+                    for _ in files_by_theme[theme]:
+                        partial = next(partials)
+                        if partial is not None:
+                            start = time.perf_counter()
+                            merge_partial(theme_partial, partial)
+                            entry['merge_seconds'] += time.perf_counter() - start
+                            add_file_stats(entry, partial['stats'])
+
+                start = time.perf_counter()
+                results[theme] = finalize_partial(theme_partial)
+                entry['finalize_seconds'] = time.perf_counter() - start
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if store is not None:
+        save_manifest(store, release, manifest)
+        remove_unreferenced(store, release, manifest)
+    enforce_size_limit(cache)
+    return results
+
+
+def analyze_theme_data(theme, release, workers=1, topk=None, hll=None, cache=None, store=None, reader=None,
+                       partitions=None):
+    """Analyze all CSV files for a given theme"""
+    return analyze_themes([theme], release, workers, topk, hll, cache, store, reader, partitions)[theme]
+
+
+def analyze_slices(themes, release, workers=1, topk=None, hll=None, cache=None, reader=None, partitions=None):
+    """Analyze the themes in SLICE_COLUMNS separately for each country.
+
+    A separate pass over those themes' partitions (cheap with a warm cache)
+    that splits every partition on its slice column. Per-country partials
+    are folded into running per-country aggregates in sorted file order as
+    they arrive, like analyze_themes(), so only one file's slices are held
+    at a time.
+
+    Returns {theme: {country: result}} with results shaped like those of
+    analyze_themes(); themes without a slice column are left out.
+    """
+    if reader is None:
+        reader = reader_settings()
+
+    themes = [theme for theme in themes if theme in SLICE_COLUMNS]
+    files_by_theme = {theme: find_theme_files(theme, release, partitions) for theme in themes}
+    files = [file for theme in themes for file in files_by_theme[theme]]
+    columns = [SLICE_COLUMNS[theme] for theme in themes for _ in files_by_theme[theme]]
+    task = bind(aggregate_file_slices, topk=topk, hll=hll, cache=cache, reader=reader)
+
+    if workers > 1 and len(files) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        file_slices = pool.map(task, files, columns)
+    else:
+        pool = None
+        file_slices = map(task, files, columns)
+
+    results = {}
+    try:
+        for theme in themes:
+            merged = {}
+            for _ in files_by_theme[theme]:
+                for country, partial in (next(file_slices) or {}).items():
+                    merge_partial(merged.setdefault(country, new_partial(topk, hll)), partial)
+            results[theme] = {country: finalize_partial(merged[country]) for country in sorted(merged)}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    enforce_size_limit(cache)
+    return results
+
+
+def aggregate_shard(themes, release, shard, shards, workers=1, topk=None, hll=None, cache=None, reader=None,
+                    partitions=None, cube=False):
+    """Aggregate one shard of a release for a later merge_shards().
+
+    The partitions of all themes, in sorted order, are dealt round-robin to
+    `shards` shards and shard number `shard` (0-based) is aggregated. Partials
+    are kept per partition rather than pre-merged, so merge_shards() can
+    fold them in the same order as a single-machine run and the result does
+    not depend on the sharding, even with sketches enabled.
+
+    Returns the shard as a dict for partial_store.save_shard().
+    """
+    if reader is None:
+        reader = reader_settings()
+    if not 0 <= shard < shards:
+        raise ValueError(f"Shard {shard} out of range for {shards} shards")
+
+    all_files = [file for theme in themes for file in find_theme_files(theme, release, partitions)]
+    files = all_files[shard::shards]
+    task = bind(aggregate_file, topk=topk, hll=hll, cache=cache, reader=reader, cube=cube)
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(task, files))
+    else:
+        partials = list(map(task, files))
+    enforce_size_limit(cache)
+
+    return {
+        'release': release,
+        'shard': shard,
+        'shards': shards,
+        'themes': themes,
+        'settings': {'topk': topk, 'hll': hll, 'cube': cube, 'project': reader['project'],
+                     'partitions': partitions or {}},
+        'partials': dict(zip(files, partials)),
+        'changelog': load_changelog_stats(release)
+    }
+
+
+def merge_shards(shards):
+    """Merge shards from aggregate_shard() into per-theme results.
+
+    All shards of one build must be present exactly once. Returns
+    (release, {theme: result}) with the same results analyze_themes() gives
+    for the whole release.
+    """
+    if not shards:
+        raise ValueError("No shards to merge")
+    first = shards[0]
+    for shard in shards:
+        for key in ['release', 'shards', 'themes', 'settings']:
+            if shard[key] != first[key]:
+                raise ValueError(f"Shards disagree on {key}: {first[key]!r} vs {shard[key]!r}")
+    found = sorted(shard['shard'] + 1 for shard in shards)
+    if found != list(range(1, first['shards'] + 1)):
+        raise ValueError(f"Expected each of the {first['shards']} shards exactly once, got shards {found}")
+
+    partials = {file: partial for shard in shards for file, partial in shard['partials'].items()}
+    results = {}
+    for theme in first['themes']:
+        theme_partial = new_partial(first['settings']['topk'], first['settings']['hll'], first['settings']['cube'])
+        for file in sorted(file for file in partials if partition_keys(file).get('theme') == theme):
+            if partials[file] is not None:
+                merge_partial(theme_partial, partials[file])
+        results[theme] = finalize_partial(theme_partial)
+    return first['release'], results
+
+
+def load_changelog_stats(release):
+    """Load changelog statistics"""
+    pattern = f"{METRICS_BASE}/{release}/changelog_stats/*.csv"
+    files = glob.glob(pattern)
+
+    if not files:
+        return None
+
+    try:
+        df = pd.read_csv(files[0], sep='\t')
+        return df
+    except:
+        return None
@@ -0,0 +1,184 @@
+"""
+On-disk columnar cache of parsed Overture Metrics CSV files.
+
+The first read of a CSV partition (through any csv_readers backend) stores
+the parsed DataFrame chunks as Feather files (Arrow IPC, with string columns dictionary-encoded as
+categoricals), or as pickles when pyarrow is not installed. Later reads
+load those instead of re-parsing the text.
+
+Entries are keyed by source path plus size and mtime (or a content hash),
+so a changed CSV is never served from a stale entry. The cache is capped
+in size and evicts the least recently used entries first.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from csv_readers import read_csv_chunks
+from defaults import CACHE_DIR, CACHE_MODES
+from partition_index import file_fingerprint
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'feather'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+CACHE_VERSION = 2
+
+
+def cache_settings(mode='use', directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, hash_contents=False):
+    """Build the cache settings passed to readers.
+
+    Args:
+        mode: 'use' reads and fills the cache, 'rebuild' re-parses every CSV
+            and overwrites its entry, 'off' bypasses the cache entirely.
+        directory: Where cache entries are stored.
+        max_bytes: Size cap enforced by enforce_size_limit().
+        hash_contents: Key entries by a SHA-1 of the file contents instead
+            of size and mtime. Slower, but robust to mtime-preserving copies.
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}")
+    return {'mode': mode, 'dir': directory, 'max_bytes': max_bytes, 'hash_contents': hash_contents}
+
+
+def _entry_names(path, columns, dtypes, hash_contents):
+    """Return (source prefix, entry directory name) for a CSV file"""
+    source = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    version = json.dumps([CACHE_VERSION, CACHE_FORMAT, columns, sorted((dtypes or {}).items()),
+                          file_fingerprint(path, hash_contents)])
+    return source, f"{source}-{hashlib.sha1(version.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _load_part(file):
+    if file.endswith('.feather'):
+        return pd.read_feather(file)
+    return pd.read_pickle(file)
+
+
+def _write_part(df, file):
+    # Dictionary-encode text columns; metric columns keep their numeric dtypes
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            df[col] = df[col].astype('category')
+
+    if CACHE_FORMAT == 'feather':
+        df.to_feather(file)
+    else:
+        df.to_pickle(file)
+
+
+def _load_entry(entry):
+    meta_file = os.path.join(entry, 'meta.json')
+    with open(meta_file, encoding='utf-8') as f:
+        meta = json.load(f)
+    os.utime(meta_file)  # Mark as recently used for LRU eviction
+    for part in meta['parts']:
+        yield _load_part(os.path.join(entry, part))
+
+
+def _write_entry(cache, source, name, path, chunks):
+    """Write chunks to a new cache entry while yielding them to the caller"""
+    os.makedirs(cache['dir'], exist_ok=True)
+    tmp = os.path.join(cache['dir'], f".tmp-{name}-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    parts = []
+    try:
+        for chunk in chunks:
+            part = f"part-{len(parts):05d}.{CACHE_FORMAT}"
+            _write_part(chunk, os.path.join(tmp, part))
+            parts.append(part)
+            yield chunk
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    size = sum(os.path.getsize(os.path.join(tmp, part)) for part in parts)
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.abspath(path), 'parts': parts, 'bytes': size,
+                   'created': time.time()}, f)
+
+    # Drop stale entries for the same source before publishing the new one
+    for existing in os.listdir(cache['dir']):
+        if existing.startswith(source + '-'):
+            shutil.rmtree(os.path.join(cache['dir'], existing), ignore_errors=True)
+    try:
+        os.rename(tmp, os.path.join(cache['dir'], name))
+    except OSError:
+        # Another process published the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def iter_csv_chunks(path, chunksize=None, cache=None, reader=None, columns=None, dtypes=None):
+    """Yield the parsed contents of a CSV file as DataFrame chunks.
+
+    Args:
+        path: CSV file to read.
+        chunksize: Rows per chunk when parsing the CSV; None reads it whole.
+            Cached entries keep the chunking they were written with.
+        cache: Settings from cache_settings(), or None to bypass the cache.
+        reader, columns, dtypes: Passed to csv_readers.read_csv_chunks().
+            Backends produce identical frames, so only the projection is
+            part of the cache key.
+    """
+    def parse():
+        return read_csv_chunks(path, reader, chunksize, columns, dtypes)
+
+    if cache is None or cache['mode'] == 'off':
+        yield from parse()
+        return
+
+    source, name = _entry_names(path, columns, dtypes, cache['hash_contents'])
+    entry = os.path.join(cache['dir'], name)
+    if cache['mode'] == 'use' and os.path.isdir(entry):
+        loaded = 0
+        try:
+            for chunk in _load_entry(entry):
+                loaded += 1
+                yield chunk
+            return
+        except (OSError, ValueError):
+            shutil.rmtree(entry, ignore_errors=True)
+            if loaded:
+                raise
+            # Corrupt entry with nothing yielded yet, fall back to the CSV
+
+    yield from _write_entry(cache, source, name, path, parse())
+
+
+def enforce_size_limit(cache):
+    """Evict least recently used entries until the cache fits its size cap"""
+    if cache is None or cache['mode'] == 'off' or not os.path.isdir(cache['dir']):
+        return
+
+    entries = []
+    for name in os.listdir(cache['dir']):
+        meta_file = os.path.join(cache['dir'], name, 'meta.json')
+        try:
+            with open(meta_file, encoding='utf-8') as f:
+                size = json.load(f)['bytes']
+            entries.append((os.path.getmtime(meta_file), size, name))
+        except (OSError, ValueError, KeyError):
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= cache['max_bytes']:
+            break
+        shutil.rmtree(os.path.join(cache['dir'], name), ignore_errors=True)
+        total -= size
+
+
+def clear_cache(directory=CACHE_DIR):
+    """Delete every cache entry"""
+    shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,202 @@
+"""
+Persistent per-partition partial aggregates for incremental regeneration.
+
+Each CSV partition's partial aggregate (weighted value counts per grouping
+column, plus totals) is stored as gzipped JSON next to a manifest of the
+file fingerprints it was built from. A rebuild only re-aggregates new or
+changed partitions and reuses the stored partials for everything else.
+
+Layout of a store directory:
+
+    <store>/<release>/manifest.json
+    <store>/<release>/partials/<sha1 of path and fingerprint>.json.gz
+    <store>/<release>/theme=<theme>-<token>.json.gz    (merged theme aggregate)
+
+Stored files are never overwritten in place: a partial is named after the
+fingerprint it was built from and a theme aggregate after the set of
+partitions it covers, and the manifest is written last. An interrupted
+rebuild therefore leaves the previous manifest pointing at consistent data.
+
+The same serialization is used for shard files (save_shard/load_shard),
+which carry the per-partition partials of one shard of a distributed build
+to the machine that merges them.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from sketches import NumericSummary, SketchedCounts
+
+STORE_VERSION = 6
+
+
+def _plain(value):
+    """Convert numpy scalars to plain Python numbers for JSON"""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def partial_to_dict(partial):
+    """Serialize a partial aggregate to JSON-compatible data"""
+    tallies = {}
+    for weight, tally in partial['tallies'].items():
+        columns = {}
+        for col, counts in tally['columns'].items():
+            if isinstance(counts, SketchedCounts):
+                columns[col] = {'sketch': counts.to_dict()}
+            else:
+                columns[col] = {'exact': {key: _plain(count) for key, count in counts.items()}}
+        tallies[weight] = {'total_features': _plain(tally['total_features']), 'columns': columns}
+
+    return {
+        'files': partial['files'],
+        'total_records': partial['total_records'],
+        'column_order': partial['column_order'],
+        'categorical': partial['categorical'],
+        'sketch': partial['sketch'],
+        'tallies': tallies,
+        'numeric': {col: summary.to_dict() for col, summary in partial.get('numeric', {}).items()},
+        'cube': partial.get('cube')
+    }
+
+
+def partial_from_dict(data):
+    """Rebuild a partial aggregate serialized with partial_to_dict()"""
+    tallies = {}
+    for weight, tally in data['tallies'].items():
+        columns = {}
+        for col, counts in tally['columns'].items():
+            if 'sketch' in counts:
+                columns[col] = SketchedCounts.from_dict(counts['sketch'])
+            else:
+                columns[col] = counts['exact']
+        tallies[weight] = {'total_features': tally['total_features'], 'columns': columns}
+
+    return {
+        'files': data['files'],
+        'total_records': data['total_records'],
+        'column_order': data['column_order'],
+        'categorical': data['categorical'],
+        'sketch': data['sketch'],
+        'tallies': tallies,
+        'numeric': {col: NumericSummary.from_dict(summary) for col, summary in data['numeric'].items()},
+        'cube': data['cube']
+    }
+
+
+def _write_atomic(path, payload, compress):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    opener = gzip.open if compress else open
+    with opener(tmp, 'wt', encoding='utf-8') as f:
+        json.dump(payload, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def save_partial(partial, path):
+    """Write a partial aggregate as gzipped JSON, atomically"""
+    _write_atomic(path, partial_to_dict(partial), compress=True)
+
+
+def load_partial(path):
+    """Read a partial aggregate written by save_partial()"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return partial_from_dict(json.load(f))
+
+
+def release_dir(store, release):
+    return os.path.join(store, release)
+
+
+def partial_path(store, release, file, fingerprint):
+    """Where the partial aggregate for one version of a CSV partition is stored"""
+    name = hashlib.sha1(f"{os.path.abspath(file)}|{fingerprint}".encode('utf-8')).hexdigest()
+    return os.path.join(release_dir(store, release), 'partials', f"{name}.json.gz")
+
+
+def theme_token(entries):
+    """Identify the set of partition versions a theme aggregate covers"""
+    listing = json.dumps(sorted((file, entry['fingerprint']) for file, entry in entries.items()))
+    return hashlib.sha1(listing.encode('utf-8')).hexdigest()[:16]
+
+
+def theme_path(store, release, theme, token):
+    """Where the merged aggregate for a theme is stored"""
+    return os.path.join(release_dir(store, release), f"theme={theme}-{token}.json.gz")
+
+
+def remove_unreferenced(store, release, manifest):
+    """Delete stored partials and theme aggregates the manifest no longer uses"""
+    keep = set()
+    for theme, theme_entry in manifest['themes'].items():
+        keep.add(theme_path(store, release, theme, theme_entry['aggregate']))
+        for file, entry in theme_entry['files'].items():
+            keep.add(partial_path(store, release, file, entry['fingerprint']))
+
+    root = release_dir(store, release)
+    candidates = [os.path.join(root, name) for name in os.listdir(root) if name.startswith('theme=')]
+    partials_dir = os.path.join(root, 'partials')
+    if os.path.isdir(partials_dir):
+        candidates += [os.path.join(partials_dir, name) for name in os.listdir(partials_dir)]
+    for path in candidates:
+        if path not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def load_manifest(store, release, settings):
+    """Load a release manifest, or start a fresh one if settings changed.
+
+    The manifest maps each theme to its merged aggregate and stored
+    partitions: {'themes': {theme: {'aggregate': token, 'files': {file:
+    {'fingerprint', 'columns', 'categorical', 'weights', 'zero_weights'}}}}}
+    """
+    path = os.path.join(release_dir(store, release), 'manifest.json')
+    fresh = {'version': STORE_VERSION, 'settings': settings, 'themes': {}}
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return fresh
+
+    if manifest.get('version') != STORE_VERSION or manifest.get('settings') != settings:
+        return fresh
+    return manifest
+
+
+def save_manifest(store, release, manifest):
+    """Write a release manifest atomically"""
+    _write_atomic(os.path.join(release_dir(store, release), 'manifest.json'), manifest, compress=False)
+
+
+def save_shard(shard, path):
+    """Write a shard from metrics_aggregation.aggregate_shard() as gzipped JSON"""
+    changelog = shard['changelog']
+    payload = {
+        **shard,
+        'version': STORE_VERSION,
+        'partials': {file: partial_to_dict(partial) if partial is not None else None
+                     for file, partial in shard['partials'].items()},
+        'changelog': changelog.to_dict(orient='split', index=False) if changelog is not None else None
+    }
+    _write_atomic(os.path.abspath(path), payload, compress=True)
+
+
+def load_shard(path):
+    """Read a shard written by save_shard()"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != STORE_VERSION:
+        raise ValueError(f"{path} was written by an incompatible version")
+
+    changelog = data['changelog']
+    data['partials'] = {file: partial_from_dict(partial) if partial is not None else None
+                        for file, partial in data['partials'].items()}
+    data['changelog'] = pd.DataFrame(**changelog) if changelog is not None else None
+    del data['version']
+    return data
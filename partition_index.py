@@ -0,0 +1,175 @@
+"""
+Index of Overture Metrics releases and partition files.
+
+Walking thousands of hive-style partition directories (theme=.../type=...)
+is slow on network filesystems. Building the index walks a release once and
+writes two small JSON files:
+
+    <base>/_releases.json                  (every release directory)
+    <base>/<release>/_partitions.json      (every row_counts CSV partition)
+
+Each partition entry records its path relative to the release directory,
+size in bytes, CSV record count, theme and partition keys. Releases are
+always listed from the directory itself, and the releases index rewritten
+whenever it no longer matches. Readers use the partition index when it
+exists and only fall back to globbing without it, so rebuild the index
+after syncing new data:
+
+    python partition_index.py                  # every release
+    python partition_index.py --release 2025-09-24.0
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+
+METRICS_BASE = "Metrics/metrics"
+RELEASES_INDEX = "_releases.json"
+PARTITION_INDEX = "_partitions.json"
+INDEX_VERSION = 1
+
+
+def partition_keys(path):
+    """Parse hive-style partition keys (theme=.../type=...) from a file path"""
+    parts = os.path.normpath(path).split(os.sep)
+    return dict(part.split('=', 1) for part in parts if '=' in part)
+
+
+def file_fingerprint(path, hash_contents=False):
+    """Identify a file's contents by size and mtime, or size and SHA-1"""
+    stat = os.stat(path)
+    if not hash_contents:
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return f"{stat.st_size}:{digest.hexdigest()}"
+
+
+def count_rows(path):
+    """Count the CSV records of a file, excluding the header.
+
+    Records are counted as pd.read_csv reads them: blank lines are skipped
+    and quoted fields may span lines. Files without quotes or blank lines,
+    where every line is a record, are counted by their newlines instead of
+    being parsed.
+    """
+    lines = 0
+    tail = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            joined = tail + block
+            if b'"' in block or b'\n\n' in joined or b'\n\r\n' in joined:
+                return _count_records(path)
+            lines += block.count(b'\n')
+            tail = joined[-2:]
+    if tail[-1:] != b'\n':
+        lines += 1  # Final line without a trailing newline
+    return max(lines - 1, 0)
+
+
+def _count_records(path):
+    with open(path, newline='', encoding='utf-8', errors='replace') as f:
+        return max(sum(1 for row in csv.reader(f) if row) - 1, 0)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if data.get('version') == INDEX_VERSION else None
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+
+def build_partition_index(release, base=METRICS_BASE):
+    """Walk a release once and write its partition index. Returns the index."""
+    root = os.path.join(base, release)
+    partitions = []
+    for path in sorted(glob.glob(os.path.join(root, 'row_counts', '**', '*.csv'), recursive=True)):
+        keys = partition_keys(os.path.relpath(path, root))
+        partitions.append({
+            'path': os.path.relpath(path, root),
+            'size': os.path.getsize(path),
+            'rows': count_rows(path),
+            'theme': keys.get('theme'),
+            'keys': keys
+        })
+
+    index = {'version': INDEX_VERSION, 'release': release, 'partitions': partitions}
+    _write_json(os.path.join(root, PARTITION_INDEX), index)
+
+    _write_json(os.path.join(base, RELEASES_INDEX), {'version': INDEX_VERSION, 'releases': release_dirs(base)})
+    return index
+
+
+def load_partition_index(release, base=METRICS_BASE):
+    """Load a release's partition index, or None if it has not been built"""
+    return _read_json(os.path.join(base, release, PARTITION_INDEX))
+
+
+def release_dirs(base=METRICS_BASE):
+    """Names of the release directories in `base`, sorted"""
+    return sorted(os.path.basename(path.rstrip('/')) for path in glob.glob(f"{base}/*/"))
+
+
+def list_releases(base=METRICS_BASE):
+    """List releases, oldest first.
+
+    Releases are the directories in `base`, found with one listing rather
+    than a walk, so a newly synced release shows up at once. A releases
+    index that no longer matches them is rewritten.
+    """
+    releases = release_dirs(base)
+    path = os.path.join(base, RELEASES_INDEX)
+    index = _read_json(path)
+    if index is not None and index['releases'] != releases:
+        try:
+            _write_json(path, {'version': INDEX_VERSION, 'releases': releases})
+        except OSError:
+            pass  # Read-only tree: the listing is still correct
+    return releases
+
+
+def find_partitions(release, base=METRICS_BASE, **keys):
+    """List the CSV partitions of a release whose partition keys match `keys`.
+
+    With an index no directory is listed; without one, the matching part of
+    the tree is globbed. Paths are returned in sorted order.
+    """
+    keys = {key: str(value) for key, value in keys.items()}
+    index = load_partition_index(release, base)
+    if index is not None:
+        return [os.path.join(base, release, entry['path']) for entry in index['partitions']
+                if all(entry['keys'].get(key) == value for key, value in keys.items())]
+
+    prefix = f"theme={keys['theme']}/" if 'theme' in keys else ""
+    pattern = f"{base}/{release}/row_counts/{prefix}**/*.csv"
+    return sorted(path for path in glob.glob(pattern, recursive=True)
+                  if all(partition_keys(path).get(key) == value for key, value in keys.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index Overture Metrics releases and partition files")
+    parser.add_argument('--release', action='append',
+                        help="Release to index; repeat for several (default: every release directory)")
+    parser.add_argument('--base', default=METRICS_BASE, help=f"Metrics directory (default {METRICS_BASE})")
+    args = parser.parse_args()
+
+    releases = args.release or release_dirs(args.base)
+    for release in releases:
+        index = build_partition_index(release, args.base)
+        rows = sum(entry['rows'] for entry in index['partitions'])
+        print(f"{release}: {len(index['partitions'])} partitions, {rows:,} rows")
@@ -0,0 +1,205 @@
+"""
+Aggregate snapshot of a Metrics release, the build artifact renderers read.
+
+Aggregating a release means reading every CSV partition; rendering only
+needs the per-theme results. A snapshot keeps exactly what the renderers use
+in one small gzipped JSON file:
+
+    {'version': SNAPSHOT_VERSION,
+     'release': '2025-09-24.0',
+     'settings': {...},                      (how the aggregates were built)
+     'themes': {theme: {'files', 'total_records', 'total_features',
+                        'columns': {col: {'categorical', 'unique_count',
+                                          'top_values': [...]}},
+                        'numeric': {col: {'mean', 'quantiles', ...}},
+                        'cube': {by: {of: {value: {'total', 'unique_count',
+                                                   'top_values': [...]}}}}}},
+     'changelog': [{'theme', 'type', 'added', ...}, ...] or None,
+     'slices': {theme: {country: <theme result>}} or None,
+     'trend': [{'release', 'themes': {...}}, ...] or None,
+     'sources': {partition path: fingerprint} or None}
+
+Slices hold the themes in metrics_aggregation.SLICE_COLUMNS aggregated
+separately per country; slice_snapshot() narrows a snapshot to one theme or
+one country of a theme for rendering a context slice. The trend, from
+trends.build_trend(), summarizes this and earlier releases, oldest first.
+The optional drill-down cube is indexed by column pair and value, so
+drilldown() answers e.g. "top place categories in BR" with lookups.
+
+Loading a snapshot needs neither pandas nor the Metrics tree, so the
+document can be re-rendered, or rendered in another format, in milliseconds.
+When the tree is at hand, stale_reasons() compares the snapshot's release
+and the recorded fingerprints of its CSV partitions with what is on disk.
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime
+
+from partition_index import METRICS_BASE, file_fingerprint, find_partitions, list_releases
+
+SNAPSHOT_FILE = "metrics_snapshot.json.gz"
+SNAPSHOT_VERSION = 3
+
+
+def _plain(value):
+    """Convert numpy scalars and containers to plain Python data for JSON"""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value.item() if hasattr(value, 'item') else value
+
+
+def changelog_records(changelog):
+    """Changelog rows of a load_changelog_stats() DataFrame as plain dicts"""
+    if changelog is None:
+        return None
+    return [_plain(row) for row in changelog.to_dict(orient='records')]
+
+
+def source_fingerprints(release, partitions=None, base=METRICS_BASE):
+    """Fingerprints of a release's CSV partitions, as {path within the release: fingerprint}"""
+    root = os.path.join(base, release)
+    fingerprints = {}
+    for path in find_partitions(release, base, **(partitions or {})):
+        try:
+            fingerprints[os.path.relpath(path, root)] = file_fingerprint(path)
+        except OSError:
+            continue  # Listed by a stale partition index
+    return fingerprints
+
+
+def stale_reasons(snapshot, base=METRICS_BASE):
+    """List how the Metrics tree has moved on since a snapshot was built.
+
+    Empty when the snapshot is of the newest release and its partitions
+    are unchanged, or when there is no Metrics tree to compare with.
+    Partitions are only compared when the snapshot recorded their
+    fingerprints (see build_snapshot()).
+    """
+    releases = list_releases(base) if os.path.isdir(base) else []
+    if not releases:
+        return []
+
+    reasons = []
+    release = snapshot['release']
+    if releases[-1] != release:
+        reasons.append(f"it is of release {release}, but the newest release is {releases[-1]}")
+    recorded = snapshot.get('sources')
+    if recorded is not None and release in releases:
+        current = source_fingerprints(release, snapshot['settings'].get('partitions'), base)
+        counts = {'added': len(current.keys() - recorded.keys()),
+                  'changed': sum(current[path] != recorded[path] for path in current.keys() & recorded.keys()),
+                  'removed': len(recorded.keys() - current.keys())}
+        if any(counts.values()):
+            changes = ', '.join(f"{count} {change}" for change, count in counts.items() if count)
+            reasons.append(f"its CSV partitions changed since it was built ({changes})")
+    return reasons
+
+
+def build_snapshot(release, themes_data, changelog, settings=None, slices=None, trend=None, sources=None):
+    """Collect aggregated theme results and changelog rows into a snapshot.
+
+    Args:
+        release: Release the results were aggregated from.
+        themes_data: {theme: result} from analyze_themes() and friends;
+            themes without data (None) are left out.
+        changelog: DataFrame from load_changelog_stats(), or None.
+        settings: How the results were built (engine, sketches, ...),
+            recorded for reference.
+        slices: {theme: {country: result}} from analyze_slices(), or None.
+        trend: Per-release totals and top-value shares from
+            trends.build_trend(), or None.
+        sources: source_fingerprints() of the partitions the results were
+            aggregated from, taken before the scan, or None when unknown.
+    """
+    return {
+        'version': SNAPSHOT_VERSION,
+        'release': release,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'settings': _plain(settings or {}),
+        'themes': {theme: _plain(data) for theme, data in themes_data.items() if data},
+        'changelog': changelog_records(changelog),
+        'slices': _plain(slices) if slices else None,
+        'trend': _plain(trend) if trend else None,
+        'sources': sources
+    }
+
+
+def save_snapshot(snapshot, path=SNAPSHOT_FILE):
+    """Write a snapshot as gzipped JSON, atomically"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path=SNAPSHOT_FILE):
+    """Read a snapshot written by save_snapshot()"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is snapshot version {snapshot.get('version')}, expected {SNAPSHOT_VERSION}")
+    return snapshot
+
+
+def theme_changelog(snapshot, theme):
+    """Changelog rows of one theme, in file order"""
+    return [row for row in snapshot['changelog'] or [] if row['theme'] == theme]
+
+
+def slice_snapshot(snapshot, theme, country=None):
+    """Narrow a snapshot to one theme, or to one country of a sliced theme.
+
+    The result renders like a full snapshot; its 'scope' names the slice.
+    Changelog rows are per theme, so country slices carry none.
+    """
+    if country is None:
+        data = snapshot['themes'][theme]
+        changelog = theme_changelog(snapshot, theme)
+        scope = f"{theme} theme"
+    else:
+        data = snapshot['slices'][theme][country]
+        changelog = []
+        scope = f"{theme} theme, {country}"
+    return {**snapshot, 'themes': {theme: data}, 'changelog': changelog, 'slices': None, 'scope': scope}
+
+
+def drilldown(snapshot, theme, by, of, value=None):
+    """Look up a drill-down in a theme's cube.
+
+    With `value`, returns the top `of` values within that value of `by`
+    ({'total', 'unique_count', 'top_values'}); without, all `by` values with
+    their drill-downs, largest first. None when the snapshot has no such
+    rollup (or value).
+    """
+    rollup = (snapshot['themes'][theme].get('cube') or {}).get(by, {}).get(of)
+    if rollup is None or value is None:
+        return rollup
+    return rollup.get(value)
+
+
+def select_snapshot(snapshot, themes=None, countries=None):
+    """Narrow a snapshot to some themes and, where sliced, some countries.
+
+    Themes with per-country slices get one section per requested country
+    they have data for; other themes are kept whole, since they have no
+    country breakdown.
+    """
+    themes = themes or list(snapshot['themes'])
+    selected = {}
+    for theme in themes:
+        sliced = (snapshot.get('slices') or {}).get(theme)
+        if countries and sliced:
+            for country in countries:
+                if sliced.get(country):
+                    selected[f"{theme}/{country}"] = {**sliced[country], 'theme': theme, 'country': country}
+        else:
+            selected[theme] = snapshot['themes'][theme]
+
+    scope = ', '.join(themes)
+    if countries:
+        scope += f"; countries {', '.join(countries)}"
+    return {**snapshot, 'themes': selected, 'slices': None, 'scope': scope}
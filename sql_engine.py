@@ -0,0 +1,255 @@
+"""
+Out-of-core aggregation of Overture Metrics CSV files with DuckDB.
+
+Instead of parsing partitions into DataFrames, the weighted value counts of
+every grouping column are pushed down to an embedded DuckDB database that
+scans each CSV directly, in parallel, and spills group-by state to disk once
+it outgrows `memory_limit`. Each CSV is parsed once into a temporary table;
+the value counts and the numeric statistics are then computed from it in
+SQL. Only per-value totals and a bounded set of centroids per numeric column
+come back to Python, where they are folded into the same partial aggregates
+as the pandas scan, so the results match analyze_theme_data() for trees
+larger than RAM (quantiles to within the sketch's accuracy).
+"""
+
+import os
+
+from csv_readers import NA_VALUES, read_header
+from defaults import SQL_MEMORY_LIMIT
+from instrumentation import stage
+from metrics_aggregation import (ALWAYS_GROUPED, CUBE_DIMENSIONS, HISTOGRAM_BINS, METRIC_COLUMNS, NUMERIC_COLUMNS,
+                                 PER_FEATURE_COLUMNS, add_counts, add_cube_counts, find_theme_files,
+                                 finalize_partial, merge_partial, new_partial, numeric_summary)
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+SQL_TEMP_DIR = ".metrics_spill"
+SNIFF_ROWS = 20_480  # Rows sampled to infer column types
+SQL_CENTROIDS = 1_000  # Equal-weight centroids per numeric column and file handed to the TDigest
+
+# Files are read like pd.read_csv(on_bad_lines='skip'). Column types are
+# inferred from the first SNIFF_ROWS rows, limited to the dtypes pandas would
+# produce; the read then uses the header's columns with those types, so rows
+# with too many fields are skipped and short rows are padded with missing
+# values. When a later row does not fit the sampled types (a cast reject,
+# or a column without values in the sample that turns out numeric), types
+# are inferred from the whole file and the file is read again.
+DIALECT = "header=true, delim=',', quote='\"', escape='\"', nullstr=$na_values, hive_partitioning=false"
+SNIFF_CSV = (f"read_csv($path, {DIALECT}, ignore_errors=true, sample_size=$sample_size, "
+             "auto_type_candidates=['BIGINT', 'DOUBLE', 'VARCHAR'])")
+READ_CSV = (f"read_csv($path, {DIALECT}, auto_detect=false, columns=$columns, null_padding=true, "
+            "ignore_errors=true, store_rejects=true)")
+
+
+def quote(name):
+    """Quote a column name as a SQL identifier"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def connect(memory_limit=SQL_MEMORY_LIMIT, temp_dir=SQL_TEMP_DIR, threads=None):
+    """Open an in-process DuckDB database that spills to `temp_dir`"""
+    if duckdb is None:
+        raise ImportError("The duckdb engine requires duckdb to be installed (pip install duckdb)")
+
+    config = {'memory_limit': memory_limit, 'temp_directory': temp_dir}
+    if threads:
+        config['threads'] = threads
+    return duckdb.connect(config=config)
+
+
+def load_partition(con, file, sample_size=None):
+    """Parse a CSV into the temporary table `part`, returning {column: type}.
+
+    Types come from the first `sample_size` rows (SNIFF_ROWS by default),
+    or the whole file when `sample_size` is -1.
+    """
+    params = {'path': file, 'na_values': NA_VALUES}
+    sample_size = sample_size or SNIFF_ROWS
+    schema = con.execute(f"DESCRIBE SELECT * FROM {SNIFF_CSV}", {**params, 'sample_size': sample_size}).fetchall()
+    sniffed = {name: dtype for name, dtype, *_ in schema}
+    types = {col: sniffed.get(col, 'VARCHAR') for col in read_header(file)}
+
+    con.execute("DROP TABLE IF EXISTS reject_errors")
+    con.execute("DROP TABLE IF EXISTS reject_scans")
+    con.execute(f"CREATE OR REPLACE TEMP TABLE part AS SELECT * FROM {READ_CSV}", {**params, 'columns': types})
+    if sample_size == -1:
+        return types
+
+    casts = con.execute("SELECT COUNT(*) FROM reject_errors WHERE error_type = 'CAST'").fetchone()[0]
+    text = [col for col, dtype in types.items() if dtype == 'VARCHAR']
+    numeric_text = []
+    if text:
+        checks = [f"COUNT({quote(col)}) > 0 AND COUNT({quote(col)}) = COUNT(TRY_CAST({quote(col)} AS DOUBLE))"
+                  for col in text]
+        row = con.execute(f"SELECT {', '.join(checks)} FROM part").fetchone()
+        numeric_text = [col for col, numeric in zip(text, row) if numeric]
+    if casts or numeric_text:
+        return load_partition(con, file, sample_size=-1)
+    return types
+
+
+def add_numeric_sql(con, partial, numeric, weight):
+    """Summarize numeric columns of the table `part` in SQL into a partial"""
+    w = "1.0" if weight == 'records' else f"COALESCE(TRY_CAST({quote(weight)} AS DOUBLE), 0)"
+    aggregates, values = [], {}
+    for col in numeric:
+        x = f"CAST({quote(col)} AS DOUBLE)"
+        present = f"{x} IS NOT NULL AND isfinite({x})"
+        totals = col not in PER_FEATURE_COLUMNS
+        # Totals are summarized per unit of weight, like NumericSummary.update()
+        value = f"{x} / {w}" if totals else x
+        weighted = f"{present} AND {w} > 0"
+        extremes = weighted if totals else present
+        values[col] = (value, weighted)
+        aggregates += [f"COUNT(*) FILTER (WHERE {present})", f"COALESCE(SUM({x}) FILTER (WHERE {present}), 0)",
+                       f"MIN({value}) FILTER (WHERE {extremes})", f"MAX({value}) FILTER (WHERE {extremes})",
+                       f"COALESCE(SUM({w}) FILTER (WHERE {weighted}), 0)",
+                       f"COALESCE(SUM({value} * {w}) FILTER (WHERE {weighted}), 0)"]
+        bins = HISTOGRAM_BINS.get(col) or []
+        for i, (low, high) in enumerate(zip(bins, bins[1:])):
+            # Bins are half-open except the last, as in np.histogram
+            upper = '<=' if i == len(bins) - 2 else '<'
+            aggregates.append(f"COALESCE(SUM({w}) FILTER (WHERE {weighted} AND {value} >= {low} "
+                              f"AND {value} {upper} {high}), 0)")
+    row = list(con.execute(f"SELECT {', '.join(aggregates)} FROM part").fetchone())
+
+    for col in numeric:
+        count, total, low, high, weight_sum, weighted_sum = row[:6]
+        bins = HISTOGRAM_BINS.get(col) or []
+        histogram = row[6:6 + max(len(bins) - 1, 0)]
+        del row[:6 + len(histogram)]
+
+        # Equal-weight centroids of the weighted values, from one sort
+        value, weighted = values[col]
+        centroids = con.execute(
+            f"SELECT SUM(value * weight) / SUM(weight), SUM(weight) FROM ("
+            f"SELECT value, weight, SUM(weight) OVER () AS total, "
+            f"COALESCE(SUM(weight) OVER (ORDER BY value ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0) "
+            f"AS before FROM (SELECT {value} AS value, {w} AS weight FROM part WHERE {weighted})) "
+            f"GROUP BY floor(before / total * $centroids) ORDER BY 1", {'centroids': SQL_CENTROIDS}).fetchall()
+        numeric_summary(partial, col).add_summarized(
+            count, total, low, high, weight_sum, weighted_sum,
+            [mean for mean, _ in centroids], [weight for _, weight in centroids], histogram if bins else None)
+
+
+def aggregate_file_sql(con, file, topk=None, hll=None, cube=False):
+    """Aggregate a single CSV partition into a partial aggregate with DuckDB.
+
+    The CSV is parsed once into a temporary table. One GROUPING SETS query
+    then computes the row count, the total weight and the weighted value
+    counts of every grouping column, plus, with `cube`, a grouping set per
+    pair of CUBE_DIMENSIONS; numeric columns are summarized in SQL, with a
+    bounded set of centroids standing in for their values.
+    """
+    partial = new_partial(topk, hll, cube)
+    try:
+        types = load_partition(con, file)
+
+        weight = 'total_count' if 'total_count' in types else 'id_count'
+        if weight not in types:
+            weight = 'records'
+        if weight == 'records':
+            weight_sum = "COUNT(*)"
+        elif types[weight] == 'VARCHAR':
+            # Only a file without rows leaves its count column untyped
+            weight_sum = f"SUM(TRY_CAST({quote(weight)} AS BIGINT))"
+        else:
+            weight_sum = f"SUM({quote(weight)})"
+        candidates = [col for col in types
+                      if col not in METRIC_COLUMNS and (types[col] == 'VARCHAR' or col in ALWAYS_GROUPED)]
+
+        pairs = [(by, of) for by, of in CUBE_DIMENSIONS if by in candidates and of in candidates] if cube else []
+        sets = ', '.join(['()'] + [f"({quote(col)})" for col in candidates]
+                         + [f"({quote(by)}, {quote(of)})" for by, of in pairs])
+        select = [f"GROUPING({quote(col)})" for col in candidates]
+        select += [f"CAST({quote(col)} AS VARCHAR)" for col in candidates]
+        select += ["COUNT(*)", weight_sum]
+        rows = con.execute(f"SELECT {', '.join(select)} FROM part GROUP BY GROUPING SETS ({sets})").fetchall()
+
+        numeric = [col for col in types if col in NUMERIC_COLUMNS and types[col] in ('BIGINT', 'DOUBLE')]
+        if numeric:
+            add_numeric_sql(con, partial, numeric, weight)
+    except (duckdb.Error, OSError) as e:
+        print(f"Warning: Error reading {file}: {e}")
+        return None
+    finally:
+        con.execute("DROP TABLE IF EXISTS part")
+
+    counts = {col: {} for col in candidates}
+    cells = {pair: {} for pair in pairs}
+    positions = {tuple(sorted(candidates.index(col) for col in pair)): pair for pair in pairs}
+    records = features = 0
+    n = len(candidates)
+    for row in rows:
+        grouped = [i for i in range(n) if row[i] == 0]
+        if not grouped:
+            records, features = row[-2], row[-1] or 0
+        elif len(grouped) == 2:
+            by, of = positions[tuple(grouped)]
+            by_value, of_value = row[n + candidates.index(by)], row[n + candidates.index(of)]
+            if by_value is not None and of_value is not None:
+                cells[(by, of)].setdefault(by_value, {})[of_value] = row[-1] or 0
+        elif row[n + grouped[0]] is not None:
+            # Missing values are dropped, as groupby would
+            counts[candidates[grouped[0]]][row[n + grouped[0]]] = row[-1] or 0
+
+    tally = partial['tallies'].setdefault(weight, {'total_features': 0, 'columns': {}})
+    partial['total_records'] = records
+    if weight != 'records':
+        tally['total_features'] = features
+
+    for col in candidates:
+        # pandas reads a text column without any values as float
+        categorical = types[col] == 'VARCHAR' and (bool(counts[col]) or records == 0)
+        if not categorical and col not in ALWAYS_GROUPED:
+            continue
+        partial['column_order'].append(col)
+        if categorical:
+            partial['categorical'].append(col)
+        add_counts(partial, tally, col, counts[col])
+    for (by, of), pair_cells in cells.items():
+        add_cube_counts(partial, by, of, pair_cells)
+
+    partial['files'] = 1
+    return partial
+
+
+def analyze_themes_sql(themes, release, topk=None, hll=None, memory_limit=SQL_MEMORY_LIMIT,
+                       temp_dir=SQL_TEMP_DIR, threads=None, partitions=None, report=None, cube=False):
+    """Analyze several themes with DuckDB, returning the same results as analyze_themes().
+
+    Partitions are aggregated one at a time, each scanned by all of
+    DuckDB's threads, and merged in sorted file order like the pandas scan.
+
+    Args:
+        topk, hll, partitions, report, cube: As for analyze_themes().
+        memory_limit: DuckDB memory limit before spilling to disk.
+        temp_dir: Where DuckDB spills intermediate results.
+        threads: DuckDB worker threads, or None for all CPUs.
+    """
+    con = connect(memory_limit, temp_dir, threads)
+    results = {}
+    try:
+        for theme in themes:
+            with stage(report, f"theme:{theme}", files=0, rows=0, bytes=0) as entry:
+                theme_partial = new_partial(topk, hll, cube)
+                for file in find_theme_files(theme, release, partitions):
+                    partial = aggregate_file_sql(con, file, topk, hll, cube)
+                    if partial is not None:
+                        merge_partial(theme_partial, partial)
+                        entry['files'] += 1
+                        entry['rows'] += partial['total_records']
+                        entry['bytes'] += os.path.getsize(file)
+                results[theme] = finalize_partial(theme_partial)
+    finally:
+        con.close()
+    return results
+
+
+def analyze_theme_data_sql(theme, release, topk=None, hll=None, memory_limit=SQL_MEMORY_LIMIT,
+                           temp_dir=SQL_TEMP_DIR, threads=None, partitions=None):
+    """Analyze all CSV files for a given theme with DuckDB"""
+    return analyze_themes_sql([theme], release, topk, hll, memory_limit, temp_dir, threads, partitions)[theme]
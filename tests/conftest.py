@@ -0,0 +1,24 @@
+"""
+Shared fixtures. The scripts live at the repository root and are imported
+as top-level modules, so the root is put on sys.path.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import RELEASE, generate_tree  # noqa: E402
+
+
+@pytest.fixture
+def metrics_tree(tmp_path, monkeypatch):
+    """A small synthetic release under tmp_path, which becomes the working directory.
+
+    Returns the release name.
+    """
+    generate_tree(str(tmp_path), rows_per_file=1_500, files_per_theme=3, cardinality=400, seed=1)
+    monkeypatch.chdir(tmp_path)
+    return RELEASE
@@ -0,0 +1,133 @@
+"""Every way of running the scan gives the same results as a full serial run."""
+
+import os
+
+import pandas as pd
+import pytest
+
+import metrics_aggregation
+from csv_readers import reader_settings
+from defaults import THEMES
+from metrics_aggregation import (aggregate_file, aggregate_shard, analyze_slices, analyze_themes, finalize_partial,
+                                 find_theme_files, heaviest, merge_partial, merge_shards, new_partial,
+                                 subtract_partial)
+from partial_store import load_shard, save_shard
+
+# Exact counts, and top-K sketches whose results depend on the merge order
+SETTINGS = [{'topk': None, 'hll': None}, {'topk': 50, 'hll': 10}]
+
+
+def full_serial_run(release, topk, hll):
+    return analyze_themes(THEMES, release, workers=1, topk=topk, hll=hll, cube=True)
+
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_multiple_workers(metrics_tree, settings):
+    expected = full_serial_run(metrics_tree, **settings)
+    assert analyze_themes(THEMES, metrics_tree, workers=3, cube=True, **settings) == expected
+
+
+@pytest.mark.parametrize('settings', SETTINGS)
+@pytest.mark.parametrize('shards', [1, 2, 5])
+def test_shards(metrics_tree, tmp_path, settings, shards):
+    expected = full_serial_run(metrics_tree, **settings)
+    paths = []
+    for shard in range(shards):
+        path = str(tmp_path / f"shard-{shard}.json.gz")
+        save_shard(aggregate_shard(THEMES, metrics_tree, shard, shards, cube=True, **settings), path)
+        paths.append(path)
+    # Shards arrive in any order
+    release, results = merge_shards([load_shard(path) for path in reversed(paths)])
+    assert release == metrics_tree
+    assert results == expected
+
+
+def test_slices_with_multiple_workers(metrics_tree):
+    themes = ['addresses', 'places', 'divisions']
+    assert analyze_slices(themes, metrics_tree, workers=3) == analyze_slices(themes, metrics_tree, workers=1)
+
+
+def change_partitions(release):
+    """Delete one partition, truncate another and add a new one"""
+    root = f"Metrics/metrics/{release}/row_counts"
+    os.remove(f"{root}/theme=places/type=place/part-00001.csv")
+
+    changed = f"{root}/theme=divisions/type=division/part-00000.csv"
+    df = pd.read_csv(changed)
+    df.iloc[:len(df) // 2].to_csv(changed, index=False)
+
+    added = f"{root}/theme=buildings/type=building/part-00007.csv"
+    pd.read_csv(f"{root}/theme=buildings/type=building/part-00000.csv").sample(frac=0.5, random_state=0).to_csv(
+        added, index=False)
+
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_incremental(metrics_tree, tmp_path, monkeypatch, settings):
+    store = str(tmp_path / 'store')
+    subtracted = []
+    monkeypatch.setattr(metrics_aggregation, 'subtract_partial',
+                        lambda partial, other: subtracted.append(subtract_partial(partial, other)))
+
+    first = analyze_themes(THEMES, metrics_tree, cube=True, store=store, **settings)
+    assert first == full_serial_run(metrics_tree, **settings)
+    assert analyze_themes(THEMES, metrics_tree, cube=True, store=store, **settings) == first
+
+    change_partitions(metrics_tree)
+    updated = analyze_themes(THEMES, metrics_tree, workers=2, cube=True, store=store, **settings)
+    assert updated == full_serial_run(metrics_tree, **settings)
+    assert updated != first
+    if settings['topk'] is None:
+        # Exact counts are updated in place rather than re-merged
+        assert subtracted
+
+
+def test_subtract_partial_undoes_merge(metrics_tree):
+    files = find_theme_files('buildings', metrics_tree)
+    partials = [aggregate_file(file, cube=True) for file in files]
+
+    merged = new_partial(None, None, cube=True)
+    for partial in partials:
+        merge_partial(merged, partial)
+    subtract_partial(merged, partials[1])
+
+    expected = new_partial(None, None, cube=True)
+    for partial in partials[:1] + partials[2:]:
+        merge_partial(expected, partial)
+
+    # Numeric summaries cannot be subtracted; compare everything else
+    merged['numeric'] = expected['numeric']
+    assert finalize_partial(merged) == finalize_partial(expected)
+
+
+@pytest.mark.parametrize('backend', ['pyarrow', 'polars'])
+@pytest.mark.parametrize('project', [False, True])
+def test_reader_backends(metrics_tree, backend, project):
+    pytest.importorskip(backend)
+    pytest.importorskip('pyarrow')
+    expected = analyze_themes(THEMES, metrics_tree, reader=reader_settings('pandas', project))
+    assert analyze_themes(THEMES, metrics_tree, reader=reader_settings(backend, project)) == expected
+
+
+def test_numeric_statistics_are_per_feature(metrics_tree):
+    numeric = analyze_themes(['places'], metrics_tree)['places']['numeric']
+    assert 'sum' not in numeric['confidence']
+    assert 'sum' in numeric['total_geometry_area_km2']
+    for stats in numeric.values():
+        assert stats['min'] <= stats['mean'] <= stats['max']
+
+
+def test_heaviest_matches_sorting():
+    counts = {f"v{i:03d}": (i * 37) % 11 for i in range(500)}
+    expected = sorted(counts.items(), key=lambda item: item[0])
+    expected.sort(key=lambda item: item[1], reverse=True)
+    assert heaviest(counts, 15) == expected[:15]
+    assert heaviest(counts, 1_000) == expected
+
+
+def test_projection_keeps_files_with_missing_counts(metrics_tree):
+    # A short row leaves the partition's count column with a missing value
+    with open(find_theme_files('places', metrics_tree)[0], 'a', encoding='utf-8') as f:
+        f.write('AA\n')
+    expected = analyze_themes(['places'], metrics_tree)
+    assert expected['places']['files'] == 3
+    assert analyze_themes(['places'], metrics_tree, reader=reader_settings('pandas', True)) == expected
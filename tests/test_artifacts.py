@@ -0,0 +1,50 @@
+"""Published artifacts are content-addressed and outlive one newer generation."""
+
+import gzip
+import hashlib
+import os
+
+from artifacts import load_manifest, manifest_files, publish_artifacts
+
+
+def publish(tmp_path, text):
+    source = tmp_path / 'README_generation_output.txt'
+    source.write_text(text, encoding='utf-8')
+    return publish_artifacts({'README_generation_output.txt': str(source),
+                              'context_slices/places.txt': str(source)}, str(tmp_path / 'artifacts'))
+
+
+def test_hashed_files_and_variants(tmp_path):
+    manifest = publish(tmp_path, 'first ' * 200)
+    assert load_manifest(str(tmp_path / 'artifacts')) == manifest
+    entry = manifest['artifacts']['README_generation_output.txt']
+    digest = hashlib.sha256(('first ' * 200).encode('utf-8')).hexdigest()
+    assert entry['sha256'] == digest
+    assert entry['file'] == f"README_generation_output.{digest[:12]}.txt"
+    assert manifest['artifacts']['context_slices/places.txt']['file'].startswith('context_slices/places.')
+
+    with open(tmp_path / 'artifacts' / entry['file'], 'rb') as f:
+        data = f.read()
+    assert len(data) == entry['bytes']
+    with gzip.open(tmp_path / 'artifacts' / entry['encodings']['gzip']['file'], 'rb') as f:
+        assert f.read() == data
+    assert entry['encodings']['gzip']['bytes'] < entry['bytes']
+
+
+def test_unchanged_content_keeps_its_name(tmp_path):
+    first = publish(tmp_path, 'same')
+    second = publish(tmp_path, 'same')
+    assert first['artifacts'] == second['artifacts']
+
+
+def test_previous_generation_is_kept(tmp_path):
+    directory = tmp_path / 'artifacts'
+    generations = [publish(tmp_path, text) for text in ['first', 'second']]
+    (directory / 'notes.txt').write_text('not ours', encoding='utf-8')
+    generations.append(publish(tmp_path, 'third'))
+
+    def on_disk():
+        return {os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+                for root, _, names in os.walk(directory) for name in names} - {'manifest.json'}
+    assert manifest_files(generations[0]).isdisjoint(on_disk())
+    assert on_disk() == manifest_files(generations[1]) | manifest_files(generations[2]) | {'notes.txt'}
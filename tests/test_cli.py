@@ -0,0 +1,86 @@
+"""cli.py render serves the snapshot only while it matches the Metrics tree."""
+
+import os
+
+import pytest
+
+import cli
+import generate_llm_context
+from context_document import OUTPUT_FILE
+from defaults import THEMES
+from metrics_aggregation import analyze_themes
+from snapshot import build_snapshot, save_snapshot, source_fingerprints, stale_reasons
+
+SETTINGS = {'engine': 'pandas', 'topk': 50, 'hll': 10, 'cube': False, 'partitions': {}}
+
+
+@pytest.fixture
+def snapshot_file(metrics_tree, tmp_path):
+    path = str(tmp_path / 'snapshot.json.gz')
+    sources = source_fingerprints(metrics_tree)
+    save_snapshot(build_snapshot(metrics_tree, analyze_themes(THEMES, metrics_tree, topk=50, hll=10), None,
+                                 SETTINGS, sources=sources), path)
+    return path
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Record scans instead of running them"""
+    calls = []
+    monkeypatch.setattr(generate_llm_context, 'generate_document', lambda **options: calls.append(options))
+    return calls
+
+
+def touch_partition(release):
+    path = f"Metrics/metrics/{release}/row_counts/theme=places/type=place/part-00000.csv"
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n')
+
+
+def test_renders_current_snapshot(snapshot_file, scans):
+    cli.render(['--snapshot', snapshot_file, '--no-scan', '--detail', 'compact'])
+    assert os.path.exists(OUTPUT_FILE)
+    assert scans == []
+
+
+def test_changed_partitions_are_stale(snapshot_file, metrics_tree, scans, capsys):
+    touch_partition(metrics_tree)
+    with pytest.raises(SystemExit):
+        cli.render(['--snapshot', snapshot_file, '--no-scan'])
+    assert '--allow-stale' in capsys.readouterr().err
+
+    cli.render(['--snapshot', snapshot_file, '--allow-stale'])
+    assert 'Warning: Snapshot' in capsys.readouterr().out
+    assert os.path.exists(OUTPUT_FILE)
+    assert scans == []
+
+    # Rescanned with the settings the snapshot was built with
+    cli.render(['--snapshot', snapshot_file, '--detail', 'standard'])
+    (options,) = scans
+    assert (options['topk'], options['hll'], options['cube'], options['detail']) == (50, 10, False, 'standard')
+    assert options['snapshot_file'] == snapshot_file
+
+
+def test_stale_reasons(snapshot_file, metrics_tree, tmp_path):
+    snapshot = cli.load_snapshot(snapshot_file)
+    assert stale_reasons(snapshot) == []
+
+    os.makedirs("Metrics/metrics/2100-01-01.0/row_counts")
+    (reason,) = stale_reasons(snapshot)
+    assert '2100-01-01.0' in reason
+
+    os.remove(f"Metrics/metrics/{metrics_tree}/row_counts/theme=places/type=place/part-00001.csv")
+    assert len(stale_reasons(snapshot)) == 2
+
+    # Without the Metrics tree, or fingerprints, there is nothing to compare
+    assert stale_reasons(snapshot, base=str(tmp_path / 'elsewhere')) == []
+    snapshot['sources'] = None
+    assert len(stale_reasons(snapshot)) == 1
+
+
+def test_missing_snapshot_scans(metrics_tree, tmp_path, scans):
+    cli.render(['--snapshot', str(tmp_path / 'missing.json.gz')])
+    (options,) = scans
+    assert options['topk'] is None and options['engine'] == 'pandas'
+    with pytest.raises(SystemExit):
+        cli.render(['--snapshot', str(tmp_path / 'missing.json.gz'), '--no-scan'])
@@ -0,0 +1,109 @@
+"""The context API renders from the snapshot and revalidates by ETag."""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docs'))
+
+import context_api  # noqa: E402
+import context_document  # noqa: E402
+from metrics_aggregation import analyze_slices, analyze_themes, load_changelog_stats  # noqa: E402
+from snapshot import build_snapshot, save_snapshot  # noqa: E402
+
+THEMES = ['places', 'buildings']
+
+
+@pytest.fixture
+def snapshot_file(metrics_tree, tmp_path):
+    path = str(tmp_path / 'snapshot.json.gz')
+    save_snapshot(build_snapshot(metrics_tree, analyze_themes(THEMES, metrics_tree, cube=True),
+                                 load_changelog_stats(metrics_tree), slices=analyze_slices(THEMES, metrics_tree)),
+                  path)
+    return path
+
+
+def start_worker(monkeypatch, path):
+    """A fresh API process: nothing loaded and an empty render cache"""
+    monkeypatch.setattr(context_api, 'SNAPSHOT', path)
+    monkeypatch.setattr(context_api, 'snapshot', None)
+    monkeypatch.setattr(context_api, 'cache', context_api.RenderCache(context_api.CACHE_MAX_BYTES))
+    return context_api.app.test_client()
+
+
+def test_renders_and_caches(monkeypatch, snapshot_file):
+    client = start_worker(monkeypatch, snapshot_file)
+    response = client.get('/api/context?themes=places&countries=AA&top_n=3')
+    assert response.status_code == 200
+    assert 'places' in response.get_data(as_text=True)
+    assert int(response.headers['X-Context-Tokens']) > 0
+
+    assert client.get('/api/context?themes=places&countries=AA&top_n=3').data == response.data
+    assert context_api.cache.stats()['hits'] == 1
+
+
+def test_etag_survives_new_workers_and_evictions(monkeypatch, snapshot_file):
+    client = start_worker(monkeypatch, snapshot_file)
+    first = client.get('/api/context?themes=places&detail=standard')
+    etag = first.headers['ETag']
+
+    # Another worker rendering later, so the Generated line differs
+    later = datetime.now() + timedelta(hours=1)
+    monkeypatch.setattr(context_document, 'datetime', type('Later', (datetime,), {'now': staticmethod(lambda: later)}))
+    client = start_worker(monkeypatch, snapshot_file)
+    fresh = client.get('/api/context?themes=places&detail=standard')
+    assert fresh.data != first.data
+    assert fresh.headers['ETag'] == etag
+
+    client = start_worker(monkeypatch, snapshot_file)
+    response = client.get('/api/context?themes=places&detail=standard', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert context_api.cache.stats()['entries'] == 0  # Not even rendered
+
+    other = client.get('/api/context?themes=places&detail=compact', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    assert other.headers['ETag'] != etag
+
+
+def test_new_snapshot_changes_etag(monkeypatch, snapshot_file, metrics_tree, tmp_path):
+    client = start_worker(monkeypatch, snapshot_file)
+    etag = client.get('/api/context?themes=places').headers['ETag']
+
+    rebuilt = str(tmp_path / 'rebuilt.json.gz')
+    snapshot = build_snapshot(metrics_tree, analyze_themes(['places'], metrics_tree), None)
+    snapshot['created'] = '2100-01-01T00:00:00'
+    save_snapshot(snapshot, rebuilt)
+    client = start_worker(monkeypatch, rebuilt)
+    assert client.get('/api/context?themes=places', headers={'If-None-Match': etag}).status_code == 200
+
+
+@pytest.mark.parametrize('query', ['themes=nowhere', 'themes=places&countries=atlantis', 'top_n=0', 'top_n=x',
+                                   'budget=-5', 'detail=everything'])
+def test_bad_requests(monkeypatch, snapshot_file, query):
+    client = start_worker(monkeypatch, snapshot_file)
+    response = client.get(f"/api/context?{query}")
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_missing_snapshot(monkeypatch, tmp_path):
+    client = start_worker(monkeypatch, str(tmp_path / 'missing.json.gz'))
+    assert client.get('/api/health').status_code == 503
+
+
+def test_drilldown(monkeypatch, snapshot_file):
+    client = start_worker(monkeypatch, snapshot_file)
+    response = client.get('/api/context/drilldown?theme=places&by=place_countries&of=primary_category&top_n=2')
+    assert response.status_code == 200
+    rows = response.get_json()['rows']
+    assert len(rows) == 2  # top_n limits the groups listed
+
+    value = next(iter(rows))
+    response = client.get(f"/api/context/drilldown?theme=places&by=place_countries&of=primary_category&value={value}")
+    assert response.get_json()['rows'] == {value: rows[value]}
+    assert client.get('/api/context/drilldown?theme=places&by=country&of=nothing').status_code == 404
@@ -0,0 +1,89 @@
+"""The CSV reader backends yield the same chunks, malformed rows included."""
+
+import pandas as pd
+import pytest
+
+import csv_readers
+from csv_readers import read_csv_chunks, reader_settings
+
+BACKENDS = ['pandas', 'pyarrow', 'polars']
+HEADER = 'country,subtype,confidence,total_count,average_geometry_length_km'
+
+
+def good_rows(count, start=0):
+    return [f"C{i % 7},type_{i % 3},{(i % 10) / 10},{i + 1},{i * 0.137:.6f}" for i in range(start, start + count)]
+
+
+def write_csv(path, rows):
+    path.write_text('\n'.join([HEADER] + rows) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def read_all(path, backend, chunksize, **options):
+    if backend != 'pandas':
+        pytest.importorskip(backend)
+        pytest.importorskip('pyarrow')
+    return list(read_csv_chunks(path, reader_settings(backend), chunksize, **options))
+
+
+def assert_same_chunks(chunks, expected):
+    # Categories keep the order values were met in rather than pandas' sorted
+    # order; aggregation does not depend on it, so only the values are compared
+    assert [len(chunk) for chunk in chunks] == [len(chunk) for chunk in expected]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), pd.concat(expected, ignore_index=True),
+                                  check_exact=True, check_categorical=False)
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    # Small blocks and batches so malformed rows are met part way through a file
+    monkeypatch.setattr(csv_readers, 'BLOCK_BYTES', 1 << 10)
+    monkeypatch.setattr(csv_readers, 'BATCH_ROWS', 16)
+
+
+CASES = {
+    'clean': good_rows(300),
+    'missing values': [row.replace(',type_1,', ',,').replace('C3,', 'NA,') for row in good_rows(300)],
+    'too many fields early': good_rows(3) + ['C1,type_0,0.5,4,1.0,extra'] + good_rows(296, 4),
+    'too many fields late': good_rows(250) + ['C1,type_0,0.5,4,1.0,extra,more'] + good_rows(49, 251),
+    'too few fields late': good_rows(250) + ['C1,type_0,0.5'] + good_rows(49, 251),
+    'several bad rows': [row + ',extra' if i % 37 == 5 else row for i, row in enumerate(good_rows(300))],
+    'unsorted values': good_rows(300)[::-1]
+}
+PROJECTION = {'columns': ['country', 'confidence', 'total_count', 'not_in_file'],
+              'dtypes': {'country': 'category', 'confidence': 'float64', 'total_count': 'int64'}}
+
+
+@pytest.mark.parametrize('backend', BACKENDS[1:])
+@pytest.mark.parametrize('chunksize', [None, 7, 64, 1_000])
+@pytest.mark.parametrize('case', list(CASES))
+def test_backends_match_pandas(tmp_path, backend, chunksize, case):
+    path = write_csv(tmp_path / 'part-00000.csv', CASES[case])
+    assert_same_chunks(read_all(path, backend, chunksize), read_all(path, 'pandas', chunksize))
+
+
+@pytest.mark.parametrize('backend', BACKENDS[1:])
+@pytest.mark.parametrize('case', list(CASES))
+def test_backends_match_pandas_projected(tmp_path, backend, case):
+    path = write_csv(tmp_path / 'part-00000.csv', CASES[case])
+    assert_same_chunks(read_all(path, backend, 50, **PROJECTION), read_all(path, 'pandas', 50, **PROJECTION))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_missing_integers_are_float(tmp_path, backend):
+    # The short row has no total_count: only its chunk reads the column as
+    # float64, as without projection, instead of the file failing
+    path = write_csv(tmp_path / 'part-00000.csv', CASES['too few fields late'])
+    chunks = read_all(path, backend, 50, **PROJECTION)
+    expected = read_all(path, 'pandas', 50)
+    assert [str(chunk['total_count'].dtype) for chunk in chunks] == ['int64'] * 5 + ['float64']
+    assert [chunk['total_count'].dtype for chunk in chunks] == [chunk['total_count'].dtype for chunk in expected]
+    pd.testing.assert_series_equal(pd.concat(chunks, ignore_index=True)['total_count'],
+                                   pd.concat(expected, ignore_index=True)['total_count'])
+
+
+def test_malformed_rows_are_skipped(tmp_path):
+    path = write_csv(tmp_path / 'part-00000.csv', CASES['too many fields late'])
+    (chunk,) = read_all(path, 'pandas', None)
+    assert len(chunk) == 299
+    assert list(chunk.columns) == HEADER.split(',')
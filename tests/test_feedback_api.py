@@ -0,0 +1,111 @@
+"""The feedback API stores each valid submission once, in either write mode."""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docs'))
+
+import feedback_api  # noqa: E402
+
+
+def submission(**fields):
+    return {'satisfaction': 4, 'clarity': 5, 'llm_provider': 'claude', 'questions_answered': 'yes', **fields}
+
+
+def row(llm_provider='claude'):
+    return (4, 5, llm_provider, 'yes', '', '', 'pytest', '127.0.0.1')
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    """The API of a fresh process, on an empty database"""
+    monkeypatch.setattr(feedback_api, 'DATABASE', str(tmp_path / 'feedback.db'))
+    monkeypatch.setattr(feedback_api, 'pool_pid', None)
+    monkeypatch.setattr(feedback_api, 'writer_pid', None)
+    feedback_api.init_db()
+    yield feedback_api
+    feedback_api.stop_writer()
+
+
+def stored(api):
+    conn = api.connect()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM feedback').fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('mode', ['sync', 'batch'])
+def test_concurrent_submissions(api, monkeypatch, mode):
+    monkeypatch.setattr(api, 'WRITE_MODE', mode)
+
+    def post(i):
+        return api.app.test_client().post('/api/feedback', json=submission(improvements=f"#{i}"))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(post, range(40)))
+    assert [response.status_code for response in responses] == [201] * 40
+    assert len({response.get_json()['id'] for response in responses}) == 40
+    assert stored(api) == 40
+
+
+@pytest.mark.parametrize('mode', ['sync', 'batch'])
+@pytest.mark.parametrize('fields', [{'llm_provider': ['claude']}, {'conversation': {'turns': 3}}, {'clarity': 9}])
+def test_invalid_submissions_are_rejected(api, monkeypatch, mode, fields):
+    monkeypatch.setattr(api, 'WRITE_MODE', mode)
+    response = api.app.test_client().post('/api/feedback', json=submission(**fields))
+    assert response.status_code == 400
+    assert stored(api) == 0
+
+
+def test_rejected_row_fails_only_its_submission(api):
+    conn = api.connect()
+    # llm_provider is NOT NULL, so the middle row fails the batch's transaction
+    items = [{'row': values, 'id': None, 'done': threading.Event()} for values in [row(), row(None), row()]]
+    api.commit_batch(conn, items)
+    conn.close()
+
+    assert all(item['done'].is_set() for item in items)
+    assert items[0]['id'] and items[2]['id']
+    assert items[1]['id'] is None
+    assert stored(api) == 2
+
+
+def test_requests_reuse_pooled_connections(api):
+    client = api.app.test_client()
+    assert client.get('/api/feedback/stats').status_code == 200
+    (conn,) = list(api.pool.queue)
+    assert client.get('/api/feedback').status_code == 200
+    assert list(api.pool.queue) == [conn]
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_pool_is_bounded_and_rolls_back(api, monkeypatch):
+    monkeypatch.setattr(api, 'POOL_SIZE', 2)
+    monkeypatch.setattr(api, 'pool_pid', None)  # Rebuilt with the smaller size
+    conns = [api.acquire_connection() for _ in range(3)]
+    assert len({id(conn) for conn in conns}) == 3
+
+    # A request that failed mid-write leaves nothing behind
+    conns[0].execute(api.INSERT_FEEDBACK, row())
+    for conn in conns:
+        api.release_connection(conn)
+    assert api.pool.qsize() == 2
+    assert stored(api) == 0
+    assert api.acquire_connection() in conns
+
+
+def test_forked_worker_opens_its_own_connections(api, monkeypatch):
+    conn = api.acquire_connection()
+    api.release_connection(conn)
+    # As seen from a worker forked after the parent used the pool
+    monkeypatch.setattr(api, 'pool_pid', -1)
+    assert api.acquire_connection() is not conn
+    assert api.pool_pid == os.getpid()
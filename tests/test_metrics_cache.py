@@ -0,0 +1,105 @@
+"""The parsed-CSV cache serves current data and stays within its size cap."""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import metrics_cache
+from metrics_cache import cache_settings, enforce_size_limit, iter_csv_chunks
+
+HEADER = 'country,subtype,total_count'
+
+
+def write_csv(path, rows):
+    path.write_text('\n'.join([HEADER] + [f"C{i % 7},type_{i % 3},{i + 1}" for i in range(rows)]) + '\n',
+                    encoding='utf-8')
+    return str(path)
+
+
+def read(path, cache, **options):
+    return pd.concat(list(iter_csv_chunks(path, 40, cache, **options)), ignore_index=True)
+
+
+def entries(cache):
+    return sorted(name for name in os.listdir(cache['dir']) if not name.startswith('.'))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return cache_settings(directory=str(tmp_path / 'cache'))
+
+
+def test_second_read_is_served_from_cache(tmp_path, cache, monkeypatch):
+    path = write_csv(tmp_path / 'part-00000.csv', 100)
+    first = read(path, cache)
+    assert len(entries(cache)) == 1
+
+    def parse(*args, **kwargs):
+        raise AssertionError("parsed the CSV instead of using the cache")
+    monkeypatch.setattr(metrics_cache, 'read_csv_chunks', parse)
+    cached = list(iter_csv_chunks(path, 40, cache))
+    assert [len(chunk) for chunk in cached] == [40, 40, 20]
+    # Text columns come back dictionary-encoded
+    pd.testing.assert_frame_equal(pd.concat(cached, ignore_index=True).astype({'country': object, 'subtype': object}),
+                                  first)
+
+
+def test_changed_file_is_parsed_again(tmp_path, cache):
+    path = write_csv(tmp_path / 'part-00000.csv', 100)
+    read(path, cache)
+    (old,) = entries(cache)
+
+    write_csv(tmp_path / 'part-00000.csv', 60)
+    assert len(read(path, cache)) == 60
+    (new,) = entries(cache)  # The stale entry is replaced, not kept
+    assert new != old
+
+
+def test_projection_is_part_of_the_key(tmp_path, cache):
+    path = write_csv(tmp_path / 'part-00000.csv', 100)
+    projected = read(path, cache, columns=['country', 'total_count'], dtypes={'country': 'category'})
+    assert list(projected.columns) == ['country', 'total_count']
+    assert list(read(path, cache).columns) == HEADER.split(',')
+
+
+def test_rebuild_and_off_modes(tmp_path, cache):
+    path = write_csv(tmp_path / 'part-00000.csv', 100)
+    read(path, cache)
+    (old,) = entries(cache)
+    # Same key; rebuilding replaces the entry
+    read(path, {**cache, 'mode': 'rebuild'})
+    assert entries(cache) == [old]
+
+    other = write_csv(tmp_path / 'part-00001.csv', 10)
+    read(other, {**cache, 'mode': 'off'})
+    assert entries(cache) == [old]
+
+
+def test_corrupt_entry_falls_back_to_csv(tmp_path, cache):
+    path = write_csv(tmp_path / 'part-00000.csv', 100)
+    read(path, cache)
+    (entry,) = entries(cache)
+    for name in os.listdir(os.path.join(cache['dir'], entry)):
+        if name.startswith('part-'):
+            with open(os.path.join(cache['dir'], entry, name), 'wb') as f:
+                f.write(b'garbage')
+    assert len(read(path, cache)) == 100
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, cache):
+    paths = [write_csv(tmp_path / f"part-{i:05d}.csv", 100) for i in range(3)]
+    names = {}
+    for age, path in zip([300, 200, 100], paths):
+        read(path, cache)
+        (names[path],) = set(entries(cache)) - set(names.values())
+        meta = os.path.join(cache['dir'], names[path], 'meta.json')
+        os.utime(meta, (os.path.getmtime(meta) - age,) * 2)
+
+    # Reading the oldest entry marks it as recently used
+    read(paths[0], cache)
+    with open(os.path.join(cache['dir'], names[paths[0]], 'meta.json'), encoding='utf-8') as f:
+        size = json.load(f)['bytes']
+    enforce_size_limit({**cache, 'max_bytes': 2 * size})
+    assert entries(cache) == sorted([names[paths[0]], names[paths[2]]])
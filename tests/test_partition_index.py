@@ -0,0 +1,53 @@
+"""The partition index lists what is on disk and counts what pandas reads."""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from partition_index import (METRICS_BASE, RELEASES_INDEX, build_partition_index, count_rows, find_partitions,
+                             list_releases)
+
+
+def test_index_matches_tree(metrics_tree):
+    found = find_partitions(metrics_tree, theme='places')
+    index = build_partition_index(metrics_tree)
+    assert find_partitions(metrics_tree, theme='places') == found
+    for entry in index['partitions']:
+        assert entry['rows'] == len(pd.read_csv(os.path.join(METRICS_BASE, metrics_tree, entry['path'])))
+
+
+def test_releases_index_follows_the_directory(metrics_tree):
+    build_partition_index(metrics_tree)
+    assert list_releases() == [metrics_tree]
+
+    # A release synced after the index was built shows up at once
+    os.makedirs(f"{METRICS_BASE}/2100-01-01.0/row_counts")
+    assert list_releases() == [metrics_tree, '2100-01-01.0']
+    with open(os.path.join(METRICS_BASE, RELEASES_INDEX), encoding='utf-8') as f:
+        assert json.load(f)['releases'] == [metrics_tree, '2100-01-01.0']
+
+    os.rmdir(f"{METRICS_BASE}/2100-01-01.0/row_counts")
+    os.rmdir(f"{METRICS_BASE}/2100-01-01.0")
+    assert list_releases() == [metrics_tree]
+
+
+CASES = {
+    'plain': 'a,b\n1,x\n2,y\n',
+    'no final newline': 'a,b\n1,x\n2,y',
+    'crlf': 'a,b\r\n1,x\r\n2,y\r\n',
+    'quoted newlines': 'a,b\n1,"two\nlines"\n2,"x, y"\n3,z\n',
+    'blank lines': 'a,b\n\n1,x\n\n\n2,y\n\n',
+    'crlf blank lines': 'a,b\r\n\r\n1,x\r\n2,y\r\n',
+    'header only': 'a,b\n',
+    'empty': '',
+}
+
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_count_rows_counts_records(tmp_path, case):
+    path = tmp_path / 'part-00000.csv'
+    path.write_bytes(CASES[case].encode('utf-8'))
+    expected = len(pd.read_csv(path)) if CASES[case] else 0
+    assert count_rows(str(path)) == expected
@@ -0,0 +1,146 @@
+"""Accuracy guarantees of the summaries in sketches.py against exact answers."""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from sketches import HyperLogLog, NumericSummary, SpaceSaving, TDigest
+
+
+def zipf_batches(batches=20, rows=5_000, seed=0):
+    """Exact {value: count} batches of Zipf-skewed values"""
+    rng = np.random.default_rng(seed)
+    return [Counter(f"value-{key}" for key in rng.zipf(1.3, rows)) for _ in range(batches)]
+
+
+def check_space_saving(sketch, exact):
+    total = sum(exact.values())
+    assert sketch.total == total
+    assert len(sketch) <= sketch.capacity
+    assert sketch.floor <= total / sketch.capacity
+    for value, true in exact.items():
+        if value in sketch.counts:
+            count, error = sketch.counts[value], sketch.errors[value]
+            assert count - error <= true <= count
+        else:
+            assert true <= sketch.floor
+        if true > total / sketch.capacity:
+            assert value in sketch.counts
+
+
+@pytest.mark.parametrize('capacity', [10, 100, 1_000])
+def test_space_saving_bounds_when_updated(capacity):
+    batches = zipf_batches()
+    sketch = SpaceSaving(capacity)
+    for counts in batches:
+        sketch.update(counts)
+    check_space_saving(sketch, sum(batches, Counter()))
+
+
+@pytest.mark.parametrize('capacity', [10, 100, 1_000])
+def test_space_saving_bounds_when_merged(capacity):
+    batches = zipf_batches()
+    merged = SpaceSaving(capacity)
+    for start in range(0, len(batches), 4):
+        sketch = SpaceSaving(capacity)
+        for counts in batches[start:start + 4]:
+            sketch.update(counts)
+        merged.merge(SpaceSaving.from_dict(sketch.to_dict()))
+    check_space_saving(merged, sum(batches, Counter()))
+
+
+def test_space_saving_is_exact_under_capacity():
+    batches = zipf_batches(batches=2, rows=50)
+    sketch = SpaceSaving(10_000)
+    for counts in batches:
+        sketch.update(counts)
+    exact = sum(batches, Counter())
+    assert sketch.is_exact
+    assert sketch.counts == dict(exact)
+    assert [count for _, count, _ in sketch.top(5)] == [count for _, count in exact.most_common(5)]
+
+
+@pytest.mark.parametrize('precision', [10, 12, 14])
+@pytest.mark.parametrize('distinct', [500, 20_000, 200_000])
+def test_hyperloglog_within_standard_error(precision, distinct):
+    sketch = HyperLogLog(precision)
+    sketch.update(f"key-{i}" for i in range(distinct))
+    # Hashing is deterministic, so this is not flaky; 4 standard errors
+    assert abs(sketch.estimate() / distinct - 1) <= 4 * sketch.relative_error
+
+
+def test_hyperloglog_merge_equals_union():
+    left, right, union = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    left.update(range(0, 30_000))
+    right.update(range(20_000, 50_000))
+    union.update(range(0, 50_000))
+    left.merge(HyperLogLog.from_dict(right.to_dict()))
+    assert left.registers == union.registers
+    with pytest.raises(ValueError):
+        left.merge(HyperLogLog(10))
+
+
+def test_tdigest_rank_error():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.lognormal(size=60_000), rng.normal(50, 5, size=40_000)])
+    digest = TDigest(200)
+    for chunk in np.array_split(values, 10):
+        part = TDigest(200)
+        part.update(chunk, np.ones(len(chunk)))
+        digest.merge(TDigest.from_dict(part.to_dict()))
+
+    qs = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+    ordered = np.sort(values)
+    for q, estimate in zip(qs, digest.quantiles(qs, values.min(), values.max())):
+        rank = np.searchsorted(ordered, estimate) / len(values)
+        assert abs(rank - q) <= 0.005
+
+
+def test_numeric_summary_sums_by_meaning():
+    # Three groups of 1, 2 and 7 features
+    weights = np.array([1, 2, 7])
+    averages = NumericSummary(totals=False)
+    averages.update([2.0, 4.0, 1.0], weights)
+    totals = NumericSummary(totals=True)
+    totals.update([2.0, 8.0, 7.0], weights)
+
+    # Per-feature values: the total is average x count, the mean is per feature
+    summary = averages.summarize()
+    assert summary['sum'] == pytest.approx(17.0)
+    assert summary['mean'] == pytest.approx(1.7)
+    assert (summary['min'], summary['max']) == (1.0, 4.0)
+
+    # Group totals: summed as they are, every other statistic per feature
+    summary = totals.summarize()
+    assert summary['sum'] == pytest.approx(17.0)
+    assert summary['mean'] == pytest.approx(1.7)
+    assert (summary['min'], summary['max']) == (1.0, 4.0)
+    assert summary['min'] <= summary['quantiles']['p50'] <= summary['max']
+
+    merged = NumericSummary.from_dict(totals.to_dict())
+    merged.merge(totals)
+    assert merged.totals
+    assert merged.summarize()['sum'] == pytest.approx(34.0)
+
+
+def test_numeric_summary_totals_are_per_feature():
+    rng = np.random.default_rng(0)
+    counts = rng.integers(1, 5_000, size=2_000)
+    per_feature = rng.lognormal(size=2_000)
+    # A few groups without features have nothing to spread their total over
+    counts[:10] = 0
+    summary = NumericSummary(totals=True)
+    summary.update(per_feature * counts, counts)
+
+    stats = summary.summarize()
+    assert stats['min'] <= stats['mean'] <= stats['max']
+    assert stats['min'] == pytest.approx(per_feature[10:].min())
+    assert stats['max'] == pytest.approx(per_feature[10:].max())
+    for value in stats['quantiles'].values():
+        assert stats['min'] <= value <= stats['max']
+
+    nothing = NumericSummary(totals=True)
+    nothing.update([5.0], [0])
+    assert nothing.summarize() is None
+    assert NumericSummary.from_dict(nothing.to_dict()).summarize() is None
@@ -0,0 +1,73 @@
+"""A snapshot keeps everything the renderers need, and nothing depends on the scan."""
+
+import gzip
+import json
+
+import pytest
+
+from context_document import OUTPUT_FILE, render_document
+from defaults import THEMES
+from generate_llm_context import generate_document
+from metrics_aggregation import analyze_slices, analyze_themes, load_changelog_stats
+from snapshot import (SNAPSHOT_VERSION, build_snapshot, drilldown, load_snapshot, save_snapshot, select_snapshot,
+                      slice_snapshot)
+from token_budget import DETAIL_PRESETS
+
+
+@pytest.fixture
+def snapshot(metrics_tree):
+    themes = ['places', 'buildings']
+    return build_snapshot(metrics_tree, analyze_themes(THEMES, metrics_tree, cube=True),
+                          load_changelog_stats(metrics_tree), {'engine': 'pandas'},
+                          slices=analyze_slices(themes, metrics_tree))
+
+
+def without_timestamps(text):
+    return [line for line in text.splitlines() if 'Generated' not in line]
+
+
+def test_round_trip(snapshot, tmp_path):
+    path = str(tmp_path / 'snapshot.json.gz')
+    save_snapshot(snapshot, path)
+    loaded = load_snapshot(path)
+    assert loaded == snapshot
+    for detail in DETAIL_PRESETS.values():
+        assert without_timestamps(render_document(loaded, detail)) == without_timestamps(
+            render_document(snapshot, detail))
+
+
+def test_rendering_matches_the_scan(metrics_tree, tmp_path):
+    path = str(tmp_path / 'snapshot.json.gz')
+    generate_document(snapshot_file=path, detail='standard')
+    with open(OUTPUT_FILE, encoding='utf-8') as f:
+        scanned = f.read()
+    rendered = render_document(load_snapshot(path), DETAIL_PRESETS['standard'])
+    assert without_timestamps(rendered) == without_timestamps(scanned)
+
+
+def test_other_versions_are_refused(snapshot, tmp_path):
+    path = str(tmp_path / 'snapshot.json.gz')
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump({**snapshot, 'version': SNAPSHOT_VERSION - 1}, f)
+    with pytest.raises(ValueError, match='snapshot version'):
+        load_snapshot(path)
+
+
+def test_slices_and_drilldowns(snapshot):
+    theme = slice_snapshot(snapshot, 'places')
+    assert list(theme['themes']) == ['places'] and theme['slices'] is None
+    assert all(row['theme'] == 'places' for row in theme['changelog'] or [])
+
+    country = next(iter(snapshot['slices']['places']))
+    sliced = slice_snapshot(snapshot, 'places', country)
+    assert sliced['themes']['places'] == snapshot['slices']['places'][country]
+    assert sliced['changelog'] == []
+
+    rollup = drilldown(snapshot, 'places', 'place_countries', 'primary_category')
+    totals = [cell['total'] for cell in rollup.values()]
+    assert totals == sorted(totals, reverse=True)
+    assert drilldown(snapshot, 'places', 'place_countries', 'primary_category', country) == rollup[country]
+    assert drilldown(snapshot, 'places', 'place_countries', 'nothing') is None
+
+    selected = select_snapshot(snapshot, ['places', 'divisions'], [country])
+    assert list(selected['themes']) == [f"places/{country}", 'divisions']
@@ -0,0 +1,100 @@
+"""The DuckDB engine gives the pandas scan's results from one parse per file."""
+
+import math
+
+import pytest
+
+pytest.importorskip('duckdb')
+
+import sql_engine  # noqa: E402
+from defaults import THEMES  # noqa: E402
+from metrics_aggregation import aggregate_file, analyze_themes, finalize_partial  # noqa: E402
+from sql_engine import aggregate_file_sql, analyze_themes_sql, connect, load_partition  # noqa: E402
+
+HEADER = 'country,subtype,confidence,total_count,total_geometry_area_km2,note'
+
+
+def split_numeric(result):
+    result = dict(result)
+    return result, result.pop('numeric')
+
+
+def assert_numeric_close(numeric, expected):
+    assert numeric.keys() == expected.keys()
+    for col, stats in expected.items():
+        assert numeric[col].keys() == stats.keys()
+        for key, value in stats.items():
+            if key == 'quantiles':
+                # Centroids stand in for the values, so quantiles are approximate
+                spread = stats['max'] - stats['min']
+                for q, estimate in value.items():
+                    assert abs(numeric[col][key][q] - estimate) <= 0.02 * spread
+            elif isinstance(value, float):
+                assert math.isclose(numeric[col][key], value, rel_tol=1e-9), (col, key)
+            else:
+                assert numeric[col][key] == value, (col, key)
+
+
+@pytest.fixture
+def con(tmp_path):
+    con = connect(temp_dir=str(tmp_path / 'spill'), threads=2)
+    yield con
+    con.close()
+
+
+@pytest.mark.parametrize('cube', [False, True])
+def test_matches_pandas(metrics_tree, tmp_path, cube):
+    expected = analyze_themes(THEMES, metrics_tree, cube=cube)
+    results = analyze_themes_sql(THEMES, metrics_tree, temp_dir=str(tmp_path / 'spill'), threads=2, cube=cube)
+    assert results.keys() == expected.keys()
+    for theme in THEMES:
+        counts, numeric = split_numeric(results[theme])
+        expected_counts, expected_numeric = split_numeric(expected[theme])
+        assert counts == expected_counts
+        assert_numeric_close(numeric, expected_numeric)
+
+
+def write_csv(path, rows):
+    path.write_text('\n'.join([HEADER] + rows) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def rows(count, start=0):
+    return [f"C{i % 5},type_{i % 3},{(i % 10) / 10},{i % 4},{i * 0.25}," for i in range(start, start + count)]
+
+
+CASES = {
+    'clean': rows(200),
+    'bad lines': rows(50) + ['C1,type_0,0.5,4,1.0,,extra'] + rows(100, 50) + ['C2,type_1'] + rows(49, 150),
+    'text after the sample': rows(150) + ['C1,type_0,high,4,1.0,'] + rows(49, 150),
+    'numbers after the sample': rows(150) + [row + '3' for row in rows(50, 150)],
+    'no rows': [],
+}
+
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_file_matches_pandas(tmp_path, con, monkeypatch, case):
+    # A sample shorter than the file, so late rows can contradict its types
+    monkeypatch.setattr(sql_engine, 'SNIFF_ROWS', 100)
+    path = write_csv(tmp_path / 'part-00000.csv', CASES[case])
+    expected = finalize_partial(aggregate_file(path))
+    result = finalize_partial(aggregate_file_sql(con, path))
+    counts, numeric = split_numeric(result)
+    expected_counts, expected_numeric = split_numeric(expected)
+    assert counts == expected_counts
+    assert_numeric_close(numeric, expected_numeric)
+
+
+def test_sample_types_are_checked(tmp_path, con, monkeypatch):
+    monkeypatch.setattr(sql_engine, 'SNIFF_ROWS', 100)
+    types = load_partition(con, write_csv(tmp_path / 'part-00000.csv', CASES['clean']))
+    assert types['confidence'] == 'DOUBLE' and types['total_count'] == 'BIGINT'
+    assert con.execute("SELECT COUNT(*) FROM part").fetchone() == (200,)
+
+    # Rows past the sample that do not fit are not lost: the file is read again
+    types = load_partition(con, write_csv(tmp_path / 'part-00001.csv', CASES['text after the sample']))
+    assert types['confidence'] == 'VARCHAR'
+    assert con.execute("SELECT COUNT(*) FROM part").fetchone() == (200,)
+
+    types = load_partition(con, write_csv(tmp_path / 'part-00002.csv', CASES['numbers after the sample']))
+    assert types['note'] == 'BIGINT'
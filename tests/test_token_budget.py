@@ -0,0 +1,87 @@
+"""fit_to_budget() keeps the most informative content that fits the budget."""
+
+import math
+
+import pytest
+
+from context_document import render_within_budget
+from defaults import THEMES
+from metrics_aggregation import analyze_themes, load_changelog_stats
+from snapshot import build_snapshot
+from token_budget import DETAIL_PRESETS, DROP_ORDER, LOW_SCORE, estimate_tokens, fit_to_budget
+
+PRESET = {'sections': ['instructions', 'schema', 'prompts', 'resources'], 'columns': [], 'top_values': 10,
+          'min_score': 0}
+SECTION_TOKENS = {'instructions': 40, 'schema': 30, 'prompts': 20, 'resources': 10}
+SCORES = [0.001, 0.002, 0.005, 0.05, 0.2, 0.5]
+
+
+def render(plan):
+    """A title, SECTION_TOKENS words per prose section and 10 words per value"""
+    words = ['title'] * 5
+    words += [section for section in plan['sections'] for _ in range(SECTION_TOKENS[section])]
+    words += [f"value{score}" for score in SCORES if score >= plan['min_score'] for _ in range(10)]
+    return ' '.join(words)
+
+
+def fit(budget):
+    text, plan, tokens = fit_to_budget(render, PRESET, budget, SCORES)
+    assert tokens == estimate_tokens(text)
+    return plan, tokens
+
+
+def test_everything_fits():
+    plan, tokens = fit(10_000)
+    assert plan == PRESET
+    assert tokens == estimate_tokens(render(PRESET))
+
+
+def test_low_score_values_go_before_sections():
+    full = estimate_tokens(render(PRESET))
+    value = estimate_tokens(render({**PRESET, 'sections': [], 'min_score': 0.5}))
+    plan, tokens = fit(full - value)
+    assert plan['sections'] == PRESET['sections']
+    assert 0 < plan['min_score'] <= LOW_SCORE
+    assert tokens <= full - value
+
+
+def test_sections_go_in_drop_order():
+    kept = ['instructions', 'schema']
+    assert [section for section in DROP_ORDER if section in PRESET['sections']][-len(kept):] == kept[::-1]
+    budget = estimate_tokens(render({**PRESET, 'sections': kept, 'min_score': 0.05}))
+    plan, tokens = fit(budget)
+    assert plan['sections'] == kept
+    assert plan['min_score'] == 0.05
+    assert tokens == budget
+
+
+def test_high_score_values_go_last():
+    # Every section fits without values, but the values above LOW_SCORE outlast them all
+    budget = estimate_tokens(render({**PRESET, 'min_score': math.inf}))
+    plan, _ = fit(budget)
+    assert plan['sections'] == []
+    assert plan['min_score'] <= min(score for score in SCORES if score > LOW_SCORE)
+
+
+def test_nothing_fits():
+    plan, tokens = fit(1)
+    assert plan['sections'] == [] and plan['min_score'] == math.inf
+    assert tokens > 1
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('=' * 80) <= 10
+    assert estimate_tokens('1,234,567') < estimate_tokens('one two three four five six seven')
+
+
+@pytest.mark.parametrize('detail', list(DETAIL_PRESETS))
+def test_documents_fit_their_budget(metrics_tree, detail):
+    snapshot = build_snapshot(metrics_tree, analyze_themes(THEMES, metrics_tree), load_changelog_stats(metrics_tree))
+    _, _, unlimited = render_within_budget(snapshot, DETAIL_PRESETS[detail])
+    previous = unlimited
+    for budget in [unlimited, unlimited * 3 // 4, unlimited // 2]:
+        _, _, tokens = render_within_budget(snapshot, DETAIL_PRESETS[detail], budget)
+        assert tokens <= budget
+        assert tokens <= previous
+        previous = tokens
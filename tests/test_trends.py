@@ -0,0 +1,66 @@
+"""Trend mode scans each release once and reuses it until its files change."""
+
+import os
+
+import pytest
+
+import trends
+from benchmark import generate_tree
+from trends import build_trend, release_snapshots, select_releases
+
+THEMES = ['places', 'buildings']
+RELEASES = ['2098-01-01.0', '2098-06-01.0']
+
+
+@pytest.fixture
+def releases(metrics_tree, tmp_path):
+    for seed, release in enumerate(RELEASES, 2):
+        generate_tree(str(tmp_path), rows_per_file=500, files_per_theme=2, cardinality=50, release=release, seed=seed)
+    return RELEASES + [metrics_tree]
+
+
+def test_select_releases(releases):
+    assert select_releases(releases[-1], 2) == releases[1:]
+    assert select_releases(releases[1], 5) == releases[:2]
+    assert select_releases('2000-01-01.0', 3) == ['2000-01-01.0']
+
+
+def test_stored_releases_are_reused(releases, tmp_path, monkeypatch):
+    store = str(tmp_path / 'snapshots')
+    first = release_snapshots(releases, THEMES, store=store)
+    assert list(first) == releases
+
+    scanned = []
+    aggregate = trends.aggregate_release
+    monkeypatch.setattr(trends, 'aggregate_release', lambda release, *args: scanned.append(release)
+                        or aggregate(release, *args))
+    assert release_snapshots(releases, THEMES, store=store) == first
+    assert scanned == []
+
+    # A changed partition file invalidates only its own release
+    part = os.path.join('Metrics', 'metrics', releases[0], 'row_counts', 'theme=places', 'type=place',
+                        'part-00000.csv')
+    with open(part, encoding='utf-8') as f:
+        row = f.read().splitlines()[1]
+    with open(part, 'a', encoding='utf-8') as f:
+        f.write(row + '\n')
+    again = release_snapshots(releases, THEMES, store=store)
+    assert scanned == [releases[0]]
+    assert again[releases[0]]['themes']['places']['total_features'] > (
+        first[releases[0]]['themes']['places']['total_features'])
+    assert again[releases[1]] == first[releases[1]]
+
+    # Other settings are not reused either
+    release_snapshots(releases[1:2], THEMES, topk=20, store=store)
+    assert scanned == [releases[0], releases[1]]
+
+
+def test_build_trend(releases, tmp_path):
+    snapshots = release_snapshots(releases, THEMES, store=str(tmp_path / 'snapshots'))
+    trend = build_trend(snapshots.values())
+    assert [point['release'] for point in trend] == releases
+    for point, snapshot in zip(trend, snapshots.values()):
+        places = point['themes']['places']
+        assert places['total_features'] == snapshot['themes']['places']['total_features']
+        shares = places['shares']['primary_category']
+        assert 0 < sum(shares.values()) <= 100.01
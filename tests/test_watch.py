@@ -0,0 +1,55 @@
+"""Watch mode keeps its results equal to a fresh run as partitions change."""
+
+import os
+
+import pandas as pd
+import pytest
+
+import watch
+from defaults import THEMES
+from metrics_aggregation import analyze_themes, subtract_partial
+
+SETTINGS = [{'topk': None, 'hll': None}, {'topk': 50, 'hll': 10}]
+
+
+def change_partitions(release):
+    """Delete one partition, truncate another and add a new one; return their paths"""
+    root = f"Metrics/metrics/{release}/row_counts"
+    removed = f"{root}/theme=places/type=place/part-00001.csv"
+    os.remove(removed)
+
+    changed = f"{root}/theme=divisions/type=division/part-00000.csv"
+    df = pd.read_csv(changed)
+    df.iloc[:len(df) // 2].to_csv(changed, index=False)
+
+    added = f"{root}/theme=buildings/type=building/part-00007.csv"
+    pd.read_csv(f"{root}/theme=buildings/type=building/part-00000.csv").sample(frac=0.5, random_state=0).to_csv(
+        added, index=False)
+    return removed, changed, added
+
+
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_rebuilds_match_fresh_runs(metrics_tree, monkeypatch, settings):
+    monkeypatch.setattr(watch, 'SETTLE_SECONDS', 0)
+    subtracted = []
+    monkeypatch.setattr(watch, 'subtract_partial',
+                        lambda partial, other: subtracted.append(subtract_partial(partial, other)))
+
+    rebuilds = []
+
+    def on_change(release, results, changes):
+        rebuilds.append((release, results.copy(), changes))
+        if len(rebuilds) == 1:
+            assert results == analyze_themes(THEMES, metrics_tree, cube=True, **settings)
+            rebuilds.append(change_partitions(release))
+
+    watch.watch_partitions(on_change, themes=THEMES, cube=True, interval=0.05, max_rebuilds=2, **settings)
+
+    (release, _, first), (removed, changed, added), (_, results, changes) = rebuilds
+    assert release == metrics_tree
+    assert first['removed'] == first['changed'] == [] and first['added']
+    assert changes == {'added': [added], 'changed': [changed], 'removed': [removed]}
+    assert results == analyze_themes(THEMES, metrics_tree, cube=True, **settings)
+    if settings['topk'] is None:
+        # Exact counts are updated in place rather than re-merged
+        assert subtracted
@@ -0,0 +1,128 @@
+"""
+Token-budgeted detail levels for the LLM context document.
+
+A detail plan says which prose sections, which columns and how many top
+values per column the document includes. Three presets cover most uses
+(compact, standard, full); with a token budget, fit_to_budget() starts from
+a preset and drops the lowest-information content until the document fits:
+
+1. values with a low score (share of their column, weighted towards themes
+   with many features) go first,
+2. then prose sections, least useful first (DROP_ORDER), each time
+   re-admitting as many low-score values as still fit,
+3. then higher-score values, so the top values of the largest themes are
+   the last content to go.
+
+Token counts use tiktoken's cl100k_base encoding when it is installed and a
+fast regex approximation of it otherwise.
+"""
+
+import math
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+SECTIONS = ['instructions', 'theme_notes', 'schema', 'changelog', 'trends', 'numeric', 'drilldowns', 'prompts',
+            'resources']
+
+# Prose sections dropped to meet a budget, least useful first
+DROP_ORDER = ['resources', 'prompts', 'drilldowns', 'schema', 'numeric', 'theme_notes', 'trends', 'changelog',
+              'instructions']
+
+# Columns in the theme statistics, most informative first
+STAT_COLUMNS = ['change_type', 'datasets', 'subtype', 'class', 'subclass', 'country', 'place_countries',
+                'primary_category', 'confidence', 'address_level_1', 'address_level_2']
+
+DETAIL_PRESETS = {
+    'full': {'sections': SECTIONS, 'columns': STAT_COLUMNS, 'top_values': 10, 'min_score': 0},
+    'standard': {'sections': ['instructions', 'theme_notes', 'changelog', 'trends', 'numeric'],
+                 'columns': STAT_COLUMNS,
+                 'top_values': 5, 'min_score': 0},
+    'compact': {'sections': ['instructions'],
+                'columns': ['change_type', 'datasets', 'subtype', 'class', 'country', 'place_countries',
+                            'primary_category'],
+                'top_values': 3, 'min_score': 0}
+}
+
+# Values scoring below this are dropped before any prose section
+LOW_SCORE = 0.01
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|([^\sA-Za-z\d])\1*")
+_encoding = None
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens an LLM tokenizer produces for text"""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        return len(_encoding.encode(text))
+
+    # Words split into ~4-character pieces, digits in groups of three and
+    # runs of repeated punctuation (e.g. ==== rules) merged into few tokens
+    tokens = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        piece = match.group(0)
+        if match.group(1):
+            tokens += math.ceil(len(piece) / 8)
+        else:
+            tokens += math.ceil(len(piece) / 4) if piece[0].isalpha() else 1
+    return tokens
+
+
+def value_score(percentage, theme_features, max_features):
+    """Information score of one top value: its share, weighted by theme size"""
+    weight = math.sqrt(theme_features / max_features) if max_features > 0 else 1
+    return percentage / 100 * weight
+
+
+def fit_to_budget(render, preset, budget, scores):
+    """Pick the richest detail plan whose rendering fits a token budget.
+
+    Args:
+        render: Function rendering a detail plan to the document text.
+        preset: Detail plan to start from.
+        budget: Maximum number of tokens.
+        scores: value_score() of every value the preset could include.
+
+    Returns (text, plan, tokens). If nothing fits, the leanest plan is
+    returned and tokens exceeds the budget.
+    """
+    def attempt(sections, min_score):
+        plan = {**preset, 'sections': sections, 'min_score': min_score}
+        text = render(plan)
+        return text, plan, estimate_tokens(text)
+
+    def best_threshold(sections, candidates):
+        # Lowest score threshold that fits; more values are kept as it drops
+        low, high = 0, len(candidates) - 1
+        best = attempt(sections, candidates[high])
+        if best[2] > budget:
+            return None
+        while low < high:
+            mid = (low + high) // 2
+            result = attempt(sections, candidates[mid])
+            if result[2] <= budget:
+                best, high = result, mid
+            else:
+                low = mid + 1
+        return best
+
+    thresholds = sorted({0} | {score for score in scores if score > 0} | {math.inf})
+    low_thresholds = [score for score in thresholds if score <= LOW_SCORE] + [
+        min(score for score in thresholds if score > LOW_SCORE)]
+
+    sections = list(preset['sections'])
+    for dropped in [None] + [section for section in DROP_ORDER if section in sections]:
+        if dropped is not None:
+            sections = [section for section in sections if section != dropped]
+        result = best_threshold(sections, low_thresholds)
+        if result is not None:
+            return result
+
+    result = best_threshold(sections, thresholds)
+    return result if result is not None else attempt(sections, math.inf)
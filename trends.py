@@ -0,0 +1,117 @@
+"""
+Multi-release trends for the LLM context document.
+
+The document normally describes one release. Trend mode also aggregates
+the releases before it and adds, per theme, total features over time and
+how the shares of the top values moved. Each release's aggregates are kept
+as a snapshot in TREND_DIR:
+
+    <TREND_DIR>/<release>.json.gz
+
+A stored snapshot is reused as long as it was built with the same settings
+from the same partition files (by size and mtime), so adding a release only
+scans the new one. Missing releases are aggregated in parallel, one release
+per worker process.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from defaults import TREND_DIR
+from metrics_aggregation import analyze_themes, find_theme_files, load_changelog_stats
+from metrics_cache import enforce_size_limit, file_fingerprint
+from partition_index import list_releases
+from snapshot import build_snapshot, load_snapshot, save_snapshot
+
+
+def select_releases(release, count):
+    """The `count` releases ending with `release`, oldest first"""
+    releases = list_releases()
+    if release not in releases:
+        return [release]
+    end = releases.index(release) + 1
+    return releases[max(end - count, 0):end]
+
+
+def release_token(release, themes, partitions=None):
+    """Identify the partition files a release's aggregates are built from"""
+    listing = [(file, file_fingerprint(file)) for theme in themes
+               for file in find_theme_files(theme, release, partitions)]
+    return hashlib.sha1(json.dumps(listing).encode('utf-8')).hexdigest()[:16]
+
+
+def trend_settings(release, themes, topk=None, hll=None, partitions=None):
+    """Settings recorded with a stored snapshot to decide whether it is reusable"""
+    return {'themes': themes, 'topk': topk, 'hll': hll, 'partitions': partitions or {},
+            'token': release_token(release, themes, partitions)}
+
+
+def aggregate_release(release, themes, settings, topk=None, hll=None, cache=None, reader=None, partitions=None):
+    """Aggregate one release into a snapshot; runs in a worker process"""
+    results = analyze_themes(themes, release, 1, topk, hll, cache, None, reader, partitions)
+    return build_snapshot(release, results, load_changelog_stats(release), settings)
+
+
+def store_snapshot(snapshot, store=TREND_DIR):
+    """Keep a release's snapshot for later trend runs"""
+    os.makedirs(store, exist_ok=True)
+    save_snapshot(snapshot, os.path.join(store, f"{snapshot['release']}.json.gz"))
+
+
+def release_snapshots(releases, themes, workers=1, topk=None, hll=None, cache=None, reader=None,
+                      partitions=None, store=TREND_DIR):
+    """Snapshots of several releases, scanning only those not already stored.
+
+    Returns {release: snapshot} in the order of `releases`.
+    """
+    snapshots = {}
+    missing = {}
+    for release in releases:
+        settings = trend_settings(release, themes, topk, hll, partitions)
+        try:
+            stored = load_snapshot(os.path.join(store, f"{release}.json.gz"))
+        except (OSError, ValueError):
+            stored = None
+        if stored is not None and stored['settings'] == settings:
+            snapshots[release] = stored
+        else:
+            missing[release] = settings
+
+    if missing:
+        print(f"  Aggregating {len(missing)} of {len(releases)} releases "
+              f"({len(releases) - len(missing)} reused from {store})...")
+        args = [(release, themes, settings, topk, hll, cache, reader, partitions)
+                for release, settings in missing.items()]
+        if workers > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+                built = list(pool.map(aggregate_release, *zip(*args)))
+        else:
+            built = [aggregate_release(*arg) for arg in args]
+        enforce_size_limit(cache)
+        for snapshot in built:
+            store_snapshot(snapshot, store)
+            snapshots[snapshot['release']] = snapshot
+    else:
+        print(f"  Reusing {len(releases)} stored releases from {store}")
+
+    return {release: snapshots[release] for release in releases}
+
+
+def build_trend(snapshots):
+    """Compact per-release trend data from snapshots, oldest first.
+
+    Keeps each theme's total features and the shares (percentages) of its
+    top categorical values: [{'release', 'themes': {theme:
+    {'total_features', 'shares': {col: {value: percentage}}}}}].
+    """
+    trend = []
+    for snapshot in snapshots:
+        themes = {}
+        for theme, data in snapshot['themes'].items():
+            shares = {col: {str(item['value']): item['percentage'] for item in col_data['top_values']}
+                      for col, col_data in data['columns'].items() if col_data['categorical']}
+            themes[theme] = {'total_features': data['total_features'], 'shares': shares}
+        trend.append({'release': snapshot['release'], 'themes': themes})
+    return trend
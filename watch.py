@@ -0,0 +1,217 @@
+"""
+Watch mode: keep per-partition aggregates warm and rebuild on change.
+
+A long-running process pays for the pandas import and the cold scan once,
+then keeps every CSV partition's partial aggregate of the documented
+release in memory. The release's row_counts tree is re-listed every
+`interval` seconds, or as soon as watchdog (pip install watchdog, inotify
+on Linux) reports a change; only new or changed partitions are
+re-aggregated. Each theme keeps a running aggregate that, like the
+incremental store (see update_stored_theme()), has the partials of
+replaced and removed partitions subtracted and the new ones merged in, so a
+warm rebuild costs one partition scan and no re-merge of exact counts.
+
+Without a pinned release the newest release directory is documented, and a
+new release directory is picked up as soon as it appears. The tree is
+listed directly rather than through the partition index, which would be
+stale while data lands; rebuild the index with partition_index.py once the
+sync is done.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial as bind
+
+from defaults import POLL_SECONDS, THEMES
+from metrics_aggregation import (aggregate_file, finalize_partial, has_zero_weights, is_subtractable, merge_numeric,
+                                 merge_partial, new_partial, subtract_partial)
+from metrics_cache import enforce_size_limit, file_fingerprint
+from partition_index import METRICS_BASE, partition_keys
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+SETTLE_SECONDS = 0.5  # Partitions modified more recently may still be being written
+
+
+def newest_release(base=METRICS_BASE):
+    """Newest release directory, listed directly so new releases show up at once"""
+    releases = sorted(entry.name for entry in os.scandir(base)
+                      if entry.is_dir() and not entry.name.startswith(('.', '_')))
+    if not releases:
+        raise FileNotFoundError(f"No releases found in {base}")
+    return releases[-1]
+
+
+def release_files(release, themes=THEMES, partitions=None, base=METRICS_BASE):
+    """Current CSV partitions of a release as {path: (fingerprint, mtime)}"""
+    keys = {key: str(value) for key, value in (partitions or {}).items()}
+    files = {}
+    for root, dirs, names in os.walk(os.path.join(base, release, 'row_counts')):
+        dirs.sort()
+        for name in names:
+            path = os.path.join(root, name)
+            found = partition_keys(path)
+            if not name.endswith('.csv') or found.get('theme') not in themes:
+                continue
+            if any(found.get(key) != value for key, value in keys.items()):
+                continue
+            try:
+                files[path] = (file_fingerprint(path), os.path.getmtime(path))
+            except OSError:
+                continue  # Removed while listing
+    return files
+
+
+def start_observer(path, wake):
+    """Set `wake` on any filesystem event under `path`, or None without watchdog"""
+    if Observer is None:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            wake.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), path, recursive=True)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+def update_aggregate(aggregate, outdated, fresh, kept, settings):
+    """Bring a theme's running aggregate up to date and return it.
+
+    Mirrors update_stored_theme() for partials held in memory: the
+    `outdated` partials of removed and replaced partitions are subtracted
+    and the `fresh` ones merged in, then only the numeric summaries are
+    re-merged in file order. Sketched or float counts, or zero-weight
+    values in the `kept` partitions, cannot be subtracted exactly, so the
+    aggregate is then re-merged from scratch.
+
+    Args:
+        aggregate: Running aggregate of the theme, or None.
+        kept: (partial, zero_weights) of every current partition of the
+            theme in file order, fresh ones included.
+        settings: {'topk', 'hll', 'cube'} for new aggregates.
+    """
+    subtractable = aggregate is not None and is_subtractable(aggregate)
+    if not subtractable or (outdated and any(zero_weights for _, zero_weights in kept)):
+        aggregate = new_partial(settings['topk'], settings['hll'], settings['cube'])
+        for partial, _ in kept:
+            merge_partial(aggregate, partial)
+        return aggregate
+
+    for partial in outdated:
+        subtract_partial(aggregate, partial)
+    for partial in fresh:
+        merge_partial(aggregate, partial)
+    if aggregate['numeric']:
+        # Digests depend on merge order, so re-merge the summaries in file order
+        aggregate['numeric'] = {}
+        for partial, _ in kept:
+            merge_numeric(aggregate, partial)
+    return aggregate
+
+
+def watch_partitions(on_change, release=None, themes=THEMES, workers=1, topk=None, hll=None, cache=None,
+                     reader=None, partitions=None, cube=False, interval=POLL_SECONDS, base=METRICS_BASE,
+                     max_rebuilds=None):
+    """Aggregate a release, then keep its results up to date until interrupted.
+
+    Every time partitions were added, changed or removed (including the
+    first scan), calls on_change(release, results, changes) with results
+    shaped like analyze_themes() and changes as {'added', 'changed',
+    'removed'} lists of paths. Results are merged in sorted file order, so
+    they match a one-off run over the same files.
+
+    Args:
+        release: Release to watch; None follows the newest release.
+        workers: Processes used to aggregate partitions, kept for the life
+            of the watch.
+        topk, hll, cache, reader, partitions, cube: As for analyze_themes().
+        interval: Seconds between listings of the tree when no filesystem
+            event arrives first.
+        max_rebuilds: Stop after this many rebuilds (None: run until
+            interrupted).
+    """
+    wake = threading.Event()
+    observer = start_observer(base, wake)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    task = bind(aggregate_file, topk=topk, hll=hll, cache=cache, reader=reader, cube=cube)
+    print(f"Watching {base} ({'filesystem events' if observer else f'polling every {interval:g}s'}); "
+          "Ctrl+C to stop")
+
+    settings = {'topk': topk, 'hll': hll, 'cube': cube}
+    current = None
+    state = {}       # path: (fingerprint, partial or None when unreadable, zero_weights)
+    aggregates = {}  # theme: running aggregate of its readable partitions
+    results = {}     # theme: result, finalized only when one of its partitions changes
+    rebuilds = 0
+    try:
+        while max_rebuilds is None or rebuilds < max_rebuilds:
+            settled = time.time() - SETTLE_SECONDS
+            target = release or newest_release(base)
+            files = release_files(target, themes, partitions, base)
+            if target != current:
+                if current is not None and not any(mtime <= settled for _, mtime in files.values()):
+                    # Keep documenting the previous release until the new one has data
+                    target = current
+                    files = release_files(target, themes, partitions, base)
+                else:
+                    print(f"\nDocumenting release {target}")
+                    current, state, aggregates, results = target, {}, {}, {}
+
+            pending = [path for path, (fingerprint, _) in files.items()
+                       if path not in state or state[path][0] != fingerprint]
+            ready = [path for path in pending if files[path][1] <= settled]
+            removed = [path for path in state if path not in files]
+
+            if ready or removed or not (results or pending):
+                start = time.perf_counter()
+                changes = {'added': [path for path in ready if path not in state],
+                           'changed': [path for path in ready if path in state],
+                           'removed': removed}
+                outdated, fresh = {}, {}
+                for path in removed + changes['changed']:
+                    if state[path][1] is not None:
+                        outdated.setdefault(partition_keys(path).get('theme'), []).append(state[path][1])
+                for path in removed:
+                    del state[path]
+                partials = list(pool.map(task, ready)) if pool is not None and len(ready) > 1 else map(task, ready)
+                for path, partial in zip(ready, partials):
+                    state[path] = (files[path][0], partial, partial is not None and has_zero_weights(partial))
+                    if partial is not None:
+                        fresh.setdefault(partition_keys(path).get('theme'), []).append(partial)
+                enforce_size_limit(cache)
+
+                touched = {partition_keys(path).get('theme') for path in ready + removed}
+                for theme in themes:
+                    if theme in touched or theme not in results:
+                        kept = [(state[path][1], state[path][2]) for path in sorted(state)
+                                if partition_keys(path).get('theme') == theme and state[path][1] is not None]
+                        aggregates[theme] = update_aggregate(aggregates.get(theme), outdated.get(theme, []),
+                                                             fresh.get(theme, []), kept, settings)
+                        results[theme] = finalize_partial(aggregates[theme])
+
+                on_change(current, results, changes)
+                rebuilds += 1
+                print(f"  Rebuilt in {time.perf_counter() - start:.2f}s: {len(changes['added'])} added, "
+                      f"{len(changes['changed'])} changed, {len(changes['removed'])} removed partitions")
+                continue  # List again at once in case more data landed meanwhile
+
+            # Files still being written are picked up once they settle
+            wake.wait(SETTLE_SECONDS if pending else interval)
+            wake.clear()
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        if observer is not None:
+            observer.stop()
+        if pool is not None:
+            pool.shutdown()